@@ -99,6 +99,7 @@ contract L1DAIBridge {
     uint256 public maxDeposit = type(uint256).max;
 
     uint256 constant HANDLE_WITHDRAW = 0;
+    uint256 constant HANDLE_WITHDRAWALS = 1;
 
     // src/starkware/cairo/lang/cairo_constants.py
     //  2 ** 251 + 17 * 2 ** 192 + 1;
@@ -196,6 +197,33 @@ contract L1DAIBridge {
         TokenLike(dai).transferFrom(escrow, l1Recipient, amount);
     }
 
+    // Consumes the message of l2_dai_bridge.flush_withdrawals for the queued
+    // withdrawals firstIndex to firstIndex + l1Recipients.length - 1 and sends
+    // every recipient its DAI from the escrow.
+    function finalizeWithdrawals(
+        uint256 firstIndex,
+        address[] calldata l1Recipients,
+        uint256[] calldata amounts
+    ) external {
+        require(l1Recipients.length == amounts.length, "L1DAIBridge/length-mismatch");
+
+        uint256[] memory payload = new uint256[](3 + l1Recipients.length * 3);
+        payload[0] = HANDLE_WITHDRAWALS;
+        payload[1] = firstIndex;
+        payload[2] = l1Recipients.length;
+        for (uint256 i = 0; i < l1Recipients.length; i++) {
+            payload[3 + i * 3] = uint256(uint160(l1Recipients[i]));
+            (payload[4 + i * 3], payload[5 + i * 3]) = toSplitUint(amounts[i]);
+        }
+
+        StarkNetLike(starkNet).consumeMessageFromL2(l2DaiBridge, payload);
+
+        for (uint256 i = 0; i < l1Recipients.length; i++) {
+            emit LogWithdrawal(l1Recipients[i], amounts[i]);
+            TokenLike(dai).transferFrom(escrow, l1Recipients[i], amounts[i]);
+        }
+    }
+
     function forceWithdrawal(uint256 amount, uint256 l2Sender) external payable whenOpen {
         emit LogForceWithdrawal(msg.sender, amount, l2Sender);
 
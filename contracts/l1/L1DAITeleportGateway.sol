@@ -64,6 +64,9 @@ contract L1DAITeleportGateway {
 
   uint256 constant HANDLE_REGISTER_TELEPORT = 0;
   uint256 constant HANDLE_FLUSH = 1;
+  uint256 constant HANDLE_REGISTER_TELEPORTS = 2;
+  uint256 constant HANDLE_FLUSH_MANY = 3;
+  uint256 constant TELEPORT_REGISTRATION_SIZE = 6;
 
   constructor(
     address _starkNet,
@@ -98,6 +101,33 @@ contract L1DAITeleportGateway {
     l1TeleportRouter.settle(targetDomain, daiToFlush);
   }
 
+  // Consumes the message of l2_dai_teleport_gateway.flush_many, targetDomains
+  // and daiToFlush in the order the domains were flushed on L2.
+  function finalizeFlushMany(bytes32[] calldata targetDomains, uint256[] calldata daiToFlush)
+    external
+  {
+    require(targetDomains.length == daiToFlush.length, "L1DAITeleportGateway/length-mismatch");
+
+    uint256[] memory payload = new uint256[](2 + targetDomains.length * 3);
+    payload[0] = HANDLE_FLUSH_MANY;
+    payload[1] = targetDomains.length;
+    uint256 total = 0;
+    for (uint256 i = 0; i < targetDomains.length; i++) {
+      payload[2 + i * 3] = toL2String(targetDomains[i]);
+      (payload[3 + i * 3], payload[4 + i * 3]) = toSplitUint(daiToFlush[i]);
+      total += daiToFlush[i];
+    }
+
+    StarkNetLike(starkNet).consumeMessageFromL2(l2TeleportGateway, payload);
+
+    // Pull the DAI of all domains from the escrow to this contract at once
+    TokenLike(l1Token).transferFrom(l1Escrow, address(this), total);
+    // The router will pull the DAI of every domain from this contract
+    for (uint256 i = 0; i < targetDomains.length; i++) {
+      l1TeleportRouter.settle(targetDomains[i], daiToFlush[i]);
+    }
+  }
+
   function finalizeRegisterTeleport(TeleportGUID calldata teleport)
     external
   {
@@ -116,6 +146,38 @@ contract L1DAITeleportGateway {
     l1TeleportRouter.requestMint(teleport, 0, 0);
   }
 
+  // Consumes a single message for teleports registered together by
+  // l2_dai_teleport_gateway.finalize_register_teleports. All of them come from
+  // the same source domain.
+  function finalizeRegisterTeleports(TeleportGUID[] calldata teleports)
+    external
+  {
+    require(teleports.length > 0, "L1DAITeleportGateway/empty-batch");
+    bytes32 sourceDomain = teleports[0].sourceDomain;
+
+    uint256[] memory payload = new uint256[](3 + teleports.length * TELEPORT_REGISTRATION_SIZE);
+    payload[0] = HANDLE_REGISTER_TELEPORTS;
+    payload[1] = toL2String(sourceDomain); // bytes32 -> uint256
+    payload[2] = teleports.length;
+    for (uint256 i = 0; i < teleports.length; i++) {
+      TeleportGUID calldata teleport = teleports[i];
+      require(teleport.sourceDomain == sourceDomain, "L1DAITeleportGateway/source-domain-mismatch");
+      uint256 offset = 3 + i * TELEPORT_REGISTRATION_SIZE;
+      payload[offset] = toL2String(teleport.targetDomain); // bytes32 -> uint256
+      payload[offset + 1] = uint256(teleport.receiver); // bytes32 -> uint256
+      payload[offset + 2] = uint256(teleport.operator); // bytes32 -> uint256
+      payload[offset + 3] = uint256(teleport.amount); // uint128 -> uint256
+      payload[offset + 4] = uint256(teleport.nonce); // uint80 -> uint256
+      payload[offset + 5] = uint256(teleport.timestamp); // uint48 -> uint256
+    }
+
+    StarkNetLike(starkNet).consumeMessageFromL2(l2TeleportGateway, payload);
+
+    for (uint256 i = 0; i < teleports.length; i++) {
+      l1TeleportRouter.requestMint(teleports[i], 0, 0);
+    }
+  }
+
   function toL2String(bytes32 str) internal pure returns (uint256) {
     while (str[31] == '\x00') {
       str = str >> 8;
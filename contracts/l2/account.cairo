@@ -1,6 +1,7 @@
 // amarna: disable=arithmetic-add,unused-arguments,must-check-caller-address
 %lang starknet
 
+from starkware.cairo.common.bool import TRUE
 from starkware.cairo.common.registers import get_fp_and_pc
 from starkware.starknet.common.syscalls import get_contract_address
 from starkware.cairo.common.signature import verify_ecdsa_signature
@@ -100,7 +101,7 @@ func constructor{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr
 @view
 func is_valid_signature{
     syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr, ecdsa_ptr: SignatureBuiltin*
-}(hash: felt, signature_len: felt, signature: felt*) -> () {
+}(hash: felt, signature_len: felt, signature: felt*) -> (is_valid: felt) {
     let (_public_key) = public_key.read();
 
     // This interface expects a signature pointer and length to make
@@ -113,7 +114,7 @@ func is_valid_signature{
         message=hash, public_key=_public_key, signature_r=sig_r, signature_s=sig_s
     );
 
-    return ();
+    return (is_valid=TRUE);
 }
 
 @external
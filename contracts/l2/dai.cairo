@@ -17,9 +17,17 @@
 
 %lang starknet
 
+from starkware.cairo.common.alloc import alloc
+from starkware.cairo.common.bool import FALSE, TRUE
 from starkware.cairo.common.cairo_builtins import HashBuiltin, BitwiseBuiltin
-from starkware.cairo.common.math import assert_not_equal, assert_not_zero
-from starkware.starknet.common.syscalls import get_caller_address, get_contract_address
+from starkware.cairo.common.hash_state import hash_finalize, hash_init, hash_update
+from starkware.cairo.common.math import assert_le_felt, assert_not_equal, assert_not_zero
+from starkware.starknet.common.syscalls import (
+    get_block_timestamp,
+    get_caller_address,
+    get_contract_address,
+    get_tx_info,
+)
 from starkware.cairo.common.uint256 import (
     Uint256,
     uint256_add,
@@ -31,6 +39,21 @@ from starkware.cairo.common.uint256 import (
 
 const ALL_ONES = 2 ** 128 - 1;
 
+// try_burn statuses
+const BURNED = 0;
+const INSUFFICIENT_BALANCE = 1;
+const INSUFFICIENT_ALLOWANCE = 2;
+
+const PERMIT = 'PERMIT';
+
+@contract_interface
+namespace IAccount {
+    func is_valid_signature(hash: felt, signature_len: felt, signature: felt*) -> (
+        is_valid: felt
+    ) {
+    }
+}
+
 @event
 func Rely(user: felt) {
 }
@@ -63,6 +86,10 @@ func _total_supply() -> (res: Uint256) {
 func _allowances(owner: felt, spender: felt) -> (res: Uint256) {
 }
 
+@storage_var
+func _nonces(owner: felt) -> (res: felt) {
+}
+
 @view
 func decimals{}() -> (res: felt) {
     return (18,);
@@ -102,6 +129,14 @@ func allowance{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(
     return (res,);
 }
 
+@view
+func nonces{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(owner: felt) -> (
+    res: felt
+) {
+    let (res) = _nonces.read(owner);
+    return (res,);
+}
+
 @view
 func wards{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(user: felt) -> (
     res: felt
@@ -152,6 +187,33 @@ func mint{
     return ();
 }
 
+// Mints amounts[i] to accounts[i]. The total supply is updated once for the
+// sum of the amounts.
+@external
+func mint_many{
+    syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr, bitwise_ptr: BitwiseBuiltin*
+}(accounts_len: felt, accounts: felt*, amounts_len: felt, amounts: Uint256*) {
+    alloc_locals;
+
+    auth();
+
+    with_attr error_message("dai/length-mismatch") {
+        assert accounts_len = amounts_len;
+    }
+
+    let (local contract_address) = get_contract_address();
+    let (local total) = sum_amounts(amounts_len, amounts, Uint256(0, 0));
+
+    // update total supply
+    let (total_supply) = _total_supply.read();
+    let (new_total_supply) = uint256_add_safe(total_supply, total);
+    _total_supply.write(new_total_supply);
+
+    credit_many(0, contract_address, accounts_len, accounts, amounts);
+
+    return ();
+}
+
 @external
 func burn{
     syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr, bitwise_ptr: BitwiseBuiltin*
@@ -183,25 +245,85 @@ func burn{
 
     Transfer.emit(account, 0, amount);
 
-    if (caller != account) {
-        let (allowance) = _allowances.read(account, caller);
-        let MAX = Uint256(low=ALL_ONES, high=ALL_ONES);
-        let (eq) = uint256_eq(allowance, MAX);
-        if (eq == 0) {
-            with_attr error_message("dai/insufficient-allowance") {
-                assert_uint256_le(amount, allowance);
-            }
-            let (new_allowance) = uint256_sub(allowance, amount);
-            _allowances.write(account, caller, new_allowance);
-            return ();
-        } else {
-            return ();
-        }
+    let (spent) = spend_allowance(account, caller, amount);
+    with_attr error_message("dai/insufficient-allowance") {
+        assert spent = TRUE;
     }
 
     return ();
 }
 
+// Same as burn, but returns INSUFFICIENT_BALANCE or INSUFFICIENT_ALLOWANCE
+// instead of reverting when the burn isn't possible, and BURNED otherwise.
+// Lets a contract check and burn in a single call.
+@external
+func try_burn{
+    syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr, bitwise_ptr: BitwiseBuiltin*
+}(account: felt, amount: Uint256) -> (status: felt) {
+    alloc_locals;
+
+    let (local caller) = get_caller_address();
+
+    // check valid amount
+    with_attr error_message("dai/invalid-amount") {
+        uint256_check(amount);
+    }
+
+    let (local balance) = _balances.read(account);
+    let (balance_check) = uint256_le(amount, balance);
+    if (balance_check == 0) {
+        return (status=INSUFFICIENT_BALANCE);
+    }
+
+    let (spent) = spend_allowance(account, caller, amount);
+    if (spent == FALSE) {
+        return (status=INSUFFICIENT_ALLOWANCE);
+    }
+
+    // update balance
+    let (new_balance) = uint256_sub(balance, amount);
+    _balances.write(account, new_balance);
+
+    // decrease supply
+    let (total_supply) = _total_supply.read();
+
+    // underflow check disabled since amount <= balance <= total_supply
+    let (new_total_supply) = uint256_sub(total_supply, amount);
+    _total_supply.write(new_total_supply);
+
+    Transfer.emit(account, 0, amount);
+
+    return (status=BURNED);
+}
+
+// Spends amount of the allowance of caller on account, unless caller is
+// account or the allowance is unlimited. Returns FALSE and leaves the
+// allowance as is when it's too low. Used by burn, try_burn and transferFrom.
+func spend_allowance{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(
+    account: felt, caller: felt, amount: Uint256
+) -> (spent: felt) {
+    alloc_locals;
+
+    if (caller == account) {
+        return (spent=TRUE);
+    }
+
+    let (local allowance) = _allowances.read(account, caller);
+    let MAX = Uint256(low=ALL_ONES, high=ALL_ONES);
+    let (eq) = uint256_eq(allowance, MAX);
+    if (eq == 1) {
+        return (spent=TRUE);
+    }
+
+    let (allowance_check) = uint256_le(amount, allowance);
+    if (allowance_check == 0) {
+        return (spent=FALSE);
+    }
+    let (new_allowance) = uint256_sub(allowance, amount);
+    _allowances.write(account, caller, new_allowance);
+    return (spent=TRUE);
+}
+
 @external
 func rely{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(user: felt) {
     auth();
@@ -228,6 +350,35 @@ func transfer{
     return (res=1);
 }
 
+// Transfers amounts[i] to recipients[i] from the caller. The balance of the
+// caller is checked and written once for the sum of the amounts.
+@external
+func transfer_many{
+    syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr, bitwise_ptr: BitwiseBuiltin*
+}(recipients_len: felt, recipients: felt*, amounts_len: felt, amounts: Uint256*) -> (res: felt) {
+    alloc_locals;
+
+    with_attr error_message("dai/length-mismatch") {
+        assert recipients_len = amounts_len;
+    }
+
+    let (local caller) = get_caller_address();
+    let (local contract_address) = get_contract_address();
+    let (local total) = sum_amounts(amounts_len, amounts, Uint256(0, 0));
+
+    // decrease sender balance
+    let (local sender_balance) = _balances.read(caller);
+    with_attr error_message("dai/insufficient-balance") {
+        assert_uint256_le(total, sender_balance);
+    }
+    let (new_balance) = uint256_sub(sender_balance, total);
+    _balances.write(caller, new_balance);
+
+    credit_many(caller, contract_address, recipients_len, recipients, amounts);
+
+    return (res=1);
+}
+
 @external
 func transferFrom{
     syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr, bitwise_ptr: BitwiseBuiltin*
@@ -237,21 +388,11 @@ func transferFrom{
     let (local caller) = get_caller_address();
     _transfer(sender, recipient, amount);
 
-    if (caller != sender) {
-        let (allowance) = _allowances.read(sender, caller);
-        let MAX = Uint256(low=ALL_ONES, high=ALL_ONES);
-        let (max_allowance) = uint256_eq(allowance, MAX);
-        if (max_allowance == 0) {
-            with_attr error_message("dai/insufficient-allowance") {
-                assert_uint256_le(amount, allowance);
-            }
-            let (new_allowance: Uint256) = uint256_sub(allowance, amount);
-            _allowances.write(sender, caller, new_allowance);
-            return (res=1);
-        } else {
-            return (res=1);
-        }
+    let (spent) = spend_allowance(sender, caller, amount);
+    with_attr error_message("dai/insufficient-allowance") {
+        assert spent = TRUE;
     }
+
     return (res=1);
 }
 
@@ -303,6 +444,79 @@ func decreaseAllowance{
     return (res=1);
 }
 
+// Sets the allowance of spender on the DAI of owner to amount, like approve
+// called by owner, from a signature of owner on hash_permit. The signature
+// is checked by the account contract of owner. A permit must use the next
+// nonce of owner and can't be used after deadline (a block timestamp).
+@external
+func permit{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(
+    owner: felt,
+    spender: felt,
+    amount: Uint256,
+    nonce: felt,
+    deadline: felt,
+    signature_len: felt,
+    signature: felt*,
+) {
+    alloc_locals;
+
+    with_attr error_message("dai/invalid-amount") {
+        uint256_check(amount);
+    }
+
+    let (timestamp) = get_block_timestamp();
+    with_attr error_message("dai/permit-expired") {
+        assert_le_felt(timestamp, deadline);
+    }
+
+    let (current_nonce) = _nonces.read(owner);
+    with_attr error_message("dai/invalid-nonce") {
+        assert nonce = current_nonce;
+    }
+    _nonces.write(owner, nonce + 1);
+
+    let (local hash) = hash_permit(owner, spender, amount, nonce, deadline);
+    // the account either reverts or returns a value other than TRUE
+    // on an invalid signature
+    with_attr error_message("dai/invalid-permit") {
+        let (is_valid) = IAccount.is_valid_signature(owner, hash, signature_len, signature);
+        assert is_valid = TRUE;
+    }
+
+    _approve(owner, spender, amount);
+    return ();
+}
+
+// Hash of the elements PERMIT, chain id, DAI address, owner, spender,
+// amount (low, high), nonce and deadline, as in compute_hash_on_elements.
+func hash_permit{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(
+    owner: felt, spender: felt, amount: Uint256, nonce: felt, deadline: felt
+) -> (res: felt) {
+    alloc_locals;
+
+    let (tx_info) = get_tx_info();
+    let (contract_address) = get_contract_address();
+    let (local elements: felt*) = alloc();
+    assert elements[0] = PERMIT;
+    assert elements[1] = tx_info.chain_id;
+    assert elements[2] = contract_address;
+    assert elements[3] = owner;
+    assert elements[4] = spender;
+    assert elements[5] = amount.low;
+    assert elements[6] = amount.high;
+    assert elements[7] = nonce;
+    assert elements[8] = deadline;
+
+    let hash_ptr = pedersen_ptr;
+    with hash_ptr {
+        let (hash_state_ptr) = hash_init();
+        let (hash_state_ptr) = hash_update(hash_state_ptr, elements, 9);
+        let (res) = hash_finalize(hash_state_ptr);
+        let pedersen_ptr = hash_ptr;
+        return (res=res);
+    }
+}
+
 func auth{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}() {
     let (caller) = get_caller_address();
 
@@ -359,6 +573,50 @@ func _approve{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(
     return ();
 }
 
+func sum_amounts{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(
+    amounts_len: felt, amounts: Uint256*, sum: Uint256
+) -> (sum: Uint256) {
+    if (amounts_len == 0) {
+        return (sum=sum);
+    }
+
+    // check valid amount
+    with_attr error_message("dai/invalid-amount") {
+        uint256_check([amounts]);
+    }
+    let (new_sum) = uint256_add_safe(sum, [amounts]);
+
+    return sum_amounts(amounts_len - 1, amounts + Uint256.SIZE, new_sum);
+}
+
+// Credits amounts[i] to recipients[i] and emits a Transfer from sender for
+// each of them. The amounts must have been taken from sender (or minted when
+// sender is 0) by the caller.
+func credit_many{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(
+    sender: felt, contract_address: felt, recipients_len: felt, recipients: felt*, amounts: Uint256*
+) {
+    if (recipients_len == 0) {
+        return ();
+    }
+
+    let recipient = [recipients];
+    with_attr error_message("dai/invalid-recipient") {
+        assert_not_zero(recipient);
+        assert_not_equal(recipient, contract_address);
+    }
+
+    // increase recipient balance
+    let (recipient_balance) = _balances.read(recipient);
+    let (sum) = uint256_add_safe(recipient_balance, [amounts]);
+    _balances.write(recipient, sum);
+
+    Transfer.emit(sender, recipient, [amounts]);
+
+    return credit_many(
+        sender, contract_address, recipients_len - 1, recipients + 1, amounts + Uint256.SIZE
+    );
+}
+
 func uint256_add_safe{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(
     a: Uint256, b: Uint256
 ) -> (sum: Uint256) {
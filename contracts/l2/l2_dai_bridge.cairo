@@ -20,12 +20,16 @@
 from starkware.cairo.common.alloc import alloc
 from starkware.starknet.common.messages import send_message_to_l1
 from starkware.cairo.common.cairo_builtins import HashBuiltin
-from starkware.cairo.common.math import assert_le_felt
-from starkware.starknet.common.syscalls import get_caller_address, get_contract_address
-from starkware.cairo.common.uint256 import Uint256, uint256_le
+from starkware.cairo.common.math import assert_le, assert_le_felt, assert_not_zero
+from starkware.cairo.common.math_cmp import is_le
+from starkware.starknet.common.syscalls import get_caller_address
+from starkware.cairo.common.uint256 import Uint256
 
 const FINALIZE_WITHDRAW = 0;
+const FINALIZE_WITHDRAWALS = 1;
+const BURNED = 0;
 const MAX_L1_ADDRESS = 2 ** 160 - 1;
+const MAX_WITHDRAWALS_PER_FLUSH = 100;
 
 @contract_interface
 namespace IDAI {
@@ -35,10 +39,7 @@ namespace IDAI {
     func burn(from_address: felt, value: Uint256) {
     }
 
-    func allowance(owner: felt, spender: felt) -> (res: Uint256) {
-    }
-
-    func balanceOf(user: felt) -> (res: Uint256) {
+    func try_burn(from_address: felt, value: Uint256) -> (status: felt) {
     }
 }
 
@@ -64,6 +65,14 @@ func Closed() {
 func withdraw_initiated(l1_recipient: felt, amount: Uint256, caller: felt) {
 }
 
+@event
+func withdraw_queued(l1_recipient: felt, amount: Uint256, caller: felt, index: felt) {
+}
+
+@event
+func withdrawals_flushed(first_index: felt, count: felt) {
+}
+
 @event
 func deposit_handled(account: felt, amount: Uint256) {
 }
@@ -92,6 +101,25 @@ func _bridge() -> (res: felt) {
 func _wards(user: felt) -> (res: felt) {
 }
 
+struct QueuedWithdrawal {
+    l1_recipient: felt,
+    amount: Uint256,
+}
+
+// Withdrawals queued by queue_withdraw and not flushed yet are the ones of
+// indexes _withdrawal_queue_head to _withdrawal_queue_tail - 1.
+@storage_var
+func _withdrawal_queue(index: felt) -> (res: QueuedWithdrawal) {
+}
+
+@storage_var
+func _withdrawal_queue_head() -> (res: felt) {
+}
+
+@storage_var
+func _withdrawal_queue_tail() -> (res: felt) {
+}
+
 @view
 func is_open{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}() -> (res: felt) {
     let (res) = _is_open.read();
@@ -124,6 +152,23 @@ func wards{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(user
     return (res,);
 }
 
+@view
+func withdrawal_queue{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(
+    index: felt
+) -> (res: QueuedWithdrawal) {
+    let (res) = _withdrawal_queue.read(index);
+    return (res,);
+}
+
+@view
+func withdrawal_queue_bounds{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}() -> (
+    head: felt, tail: felt
+) {
+    let (head) = _withdrawal_queue_head.read();
+    let (tail) = _withdrawal_queue_tail.read();
+    return (head, tail);
+}
+
 func auth{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}() {
     let (caller) = get_caller_address();
     let (ward) = _wards.read(caller);
@@ -194,6 +239,97 @@ func initiate_withdraw{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_che
     return ();
 }
 
+// Same as initiate_withdraw, but the withdrawal is queued and sent to L1
+// by flush_withdrawals together with other queued withdrawals.
+@external
+func queue_withdraw{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(
+    l1_recipient: felt, amount: Uint256
+) {
+    alloc_locals;
+
+    let (is_open) = _is_open.read();
+    with_attr error_message("l2_dai_bridge/bridge-closed") {
+        assert is_open = 1;
+    }
+
+    // check valid L1 address
+    assert_l1_address(l1_recipient);
+
+    let (dai) = _dai.read();
+    let (local caller) = get_caller_address();
+
+    IDAI.burn(dai, caller, amount);
+
+    let (local index) = _withdrawal_queue_tail.read();
+    _withdrawal_queue.write(index, QueuedWithdrawal(l1_recipient, amount));
+    _withdrawal_queue_tail.write(index + 1);
+
+    withdraw_queued.emit(l1_recipient, amount, caller, index);
+
+    return ();
+}
+
+// Sends the oldest queued withdrawals, at most max_count and
+// MAX_WITHDRAWALS_PER_FLUSH of them, to L1 in a single message:
+// FINALIZE_WITHDRAWALS, first_index, count followed by l1_recipient,
+// amount.low, amount.high of every withdrawal. Anyone can flush.
+@external
+func flush_withdrawals{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(
+    max_count: felt
+) {
+    alloc_locals;
+
+    let (local head) = _withdrawal_queue_head.read();
+    let (tail) = _withdrawal_queue_tail.read();
+    with_attr error_message("l2_dai_bridge/queue-empty") {
+        assert_not_zero(tail - head);
+    }
+
+    with_attr error_message("l2_dai_bridge/invalid-count") {
+        assert_le(1, max_count);
+    }
+    let (limit) = min(tail - head, MAX_WITHDRAWALS_PER_FLUSH);
+    let (local count) = min(limit, max_count);
+
+    let (local payload: felt*) = alloc();
+    assert payload[0] = FINALIZE_WITHDRAWALS;
+    assert payload[1] = head;
+    assert payload[2] = count;
+    flush_withdrawals_loop(head, count, payload + 3);
+    _withdrawal_queue_head.write(head + count);
+
+    let (bridge) = _bridge.read();
+    send_message_to_l1(bridge, 3 + count * 3, payload);
+
+    withdrawals_flushed.emit(head, count);
+
+    return ();
+}
+
+func flush_withdrawals_loop{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(
+    index: felt, count: felt, payload: felt*
+) {
+    if (count == 0) {
+        return ();
+    }
+
+    let (withdrawal) = _withdrawal_queue.read(index);
+    assert payload[0] = withdrawal.l1_recipient;
+    assert payload[1] = withdrawal.amount.low;
+    assert payload[2] = withdrawal.amount.high;
+    _withdrawal_queue.write(index, QueuedWithdrawal(0, Uint256(low=0, high=0)));
+
+    return flush_withdrawals_loop(index + 1, count - 1, payload + 3);
+}
+
+func min{range_check_ptr}(a: felt, b: felt) -> (res: felt) {
+    let a_le_b = is_le(a, b);
+    if (a_le_b == 1) {
+        return (res=a);
+    }
+    return (res=b);
+}
+
 @l1_handler
 func handle_deposit{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(
     from_address: felt,
@@ -240,24 +376,13 @@ func handle_force_withdrawal{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, ran
         return ();
     }
 
-    let (local dai) = _dai.read();
-
-    // check l2 DAI balance
-    let (balance) = IDAI.balanceOf(dai, l2_sender);
-    let (balance_check) = uint256_le(amount, balance);
-    if (balance_check == 0) {
-        return ();
-    }
-
-    // check allowance
-    let (contract_address) = get_contract_address();
-    let (allowance) = IDAI.allowance(dai, l2_sender, contract_address);
-    let (allowance_check) = uint256_le(amount, allowance);
-    if (allowance_check == 0) {
+    // burn if the l2 DAI balance and the allowance of the bridge allow it
+    let (dai) = _dai.read();
+    let (status) = IDAI.try_burn(dai, l2_sender, amount);
+    if (status != BURNED) {
         return ();
     }
 
-    IDAI.burn(dai, l2_sender, amount);
     send_handle_withdraw(l1_recipient, amount);
 
     return ();
@@ -18,15 +18,30 @@
 %lang starknet
 
 from starkware.cairo.common.alloc import alloc
+from starkware.cairo.common.memcpy import memcpy
 from starkware.starknet.common.messages import send_message_to_l1
 from starkware.cairo.common.cairo_builtins import HashBuiltin
-from starkware.cairo.common.math import assert_lt, assert_not_zero
+from starkware.cairo.common.hash import hash2
+from starkware.cairo.common.math import (
+    assert_le,
+    assert_lt,
+    assert_nn_le,
+    assert_not_zero,
+    split_felt,
+    unsigned_div_rem,
+)
 from starkware.starknet.common.syscalls import get_caller_address, get_block_timestamp
 from starkware.cairo.common.uint256 import Uint256, uint256_add, uint256_check
 
 const FINALIZE_REGISTER_TELEPORT = 0;
 const FINALIZE_FLUSH = 1;
+const FINALIZE_REGISTER_TELEPORTS = 2;
+const FINALIZE_FLUSH_MANY = 3;
 const MAX_NONCE = 2 ** 80 - 1;
+const MAX_SHARDS = 256;
+const MAX_TELEPORT_TTL = 2 ** 64;
+// shard of the unsharded _nonce and _batched_dai_to_flush
+const NO_SHARD = -1;
 
 @contract_interface
 namespace Burnable {
@@ -78,6 +93,10 @@ func TeleportRegisterFinalized(
 func Flushed(target_domain: felt, dai: Uint256) {
 }
 
+@event
+func TeleportsPruned(count: felt) {
+}
+
 @storage_var
 func _nonce() -> (res: felt) {
 }
@@ -110,6 +129,26 @@ func _batched_dai_to_flush(domain: felt) -> (res: Uint256) {
 func _wards(user: felt) -> (res: felt) {
 }
 
+// Once _shards is set, teleports take their nonce from, and batch their DAI
+// in, the shard of their caller instead of _nonce and _batched_dai_to_flush,
+// so teleports of different callers don't write the same cells. The nonce of
+// the i-th teleport of a shard is _shard_nonce_base + i * _shards + shard.
+@storage_var
+func _shards() -> (res: felt) {
+}
+
+@storage_var
+func _shard_nonce_base() -> (res: felt) {
+}
+
+@storage_var
+func _shard_nonces(shard: felt) -> (res: felt) {
+}
+
+@storage_var
+func _batched_dai_to_flush_shards(domain: felt, shard: felt) -> (res: Uint256) {
+}
+
 struct TeleportData {
     target_domain: felt,
     receiver: felt,
@@ -122,6 +161,40 @@ struct TeleportData {
 func _teleports(nonce: felt) -> (res: TeleportData) {
 }
 
+// Pedersen commitments of the TeleportData of teleports initiated while
+// _commit_teleports is set, instead of a _teleports record.
+@storage_var
+func _teleport_commitments(nonce: felt) -> (res: felt) {
+}
+
+@storage_var
+func _commit_teleports() -> (res: felt) {
+}
+
+// Seconds after which the record of a teleport can be pruned, 0 disables
+// pruning.
+@storage_var
+func _teleport_ttl() -> (res: felt) {
+}
+
+struct TeleportRequest {
+    target_domain: felt,
+    receiver: felt,
+    amount: felt,
+    operator: felt,
+}
+
+// A teleport to finalize, in the order of its fields in the
+// FINALIZE_REGISTER_TELEPORTS payload.
+struct TeleportRegistration {
+    target_domain: felt,
+    receiver: felt,
+    operator: felt,
+    amount: felt,
+    nonce: felt,
+    timestamp: felt,
+}
+
 @view
 func nonce{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}() -> (res: felt) {
     let (res) = _nonce.read();
@@ -166,7 +239,29 @@ func valid_domains{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_p
 func batched_dai_to_flush{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(
     domain: felt
 ) -> (res: Uint256) {
-    let (res: Uint256) = _batched_dai_to_flush.read(domain);
+    let (res: Uint256) = read_batched(0, domain);
+    return (res,);
+}
+
+@view
+func teleport_ttl{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}() -> (
+    res: felt
+) {
+    let (res) = _teleport_ttl.read();
+    return (res,);
+}
+
+@view
+func shards{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}() -> (res: felt) {
+    let (res) = _shards.read();
+    return (res,);
+}
+
+@view
+func shard_nonces{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(
+    shard: felt
+) -> (res: felt) {
+    let (res) = _shard_nonces.read(shard);
     return (res,);
 }
 
@@ -186,6 +281,22 @@ func teleports{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(
     return (res,);
 }
 
+@view
+func teleport_commitments{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(
+    nonce: felt
+) -> (res: felt) {
+    let (res) = _teleport_commitments.read(nonce);
+    return (res,);
+}
+
+@view
+func commit_teleports{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}() -> (
+    res: felt
+) {
+    let (res) = _commit_teleports.read();
+    return (res,);
+}
+
 func auth{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}() {
     let (caller) = get_caller_address();
     let (ward) = _wards.read(caller);
@@ -195,15 +306,34 @@ func auth{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}() {
     return ();
 }
 
-func read_and_update_nonce{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}() -> (
-    res: felt
-) {
-    let (nonce) = _nonce.read();
+// Reserves count consecutive nonces of the shard of caller (of _nonce
+// before sharding). Returns the first one, the step between them and the
+// shard (NO_SHARD before sharding).
+func reserve_nonces{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(
+    caller: felt, count: felt
+) -> (nonce: felt, nonce_step: felt, shard: felt) {
+    alloc_locals;
+
+    let (local shards) = _shards.read();
+    if (shards == 0) {
+        let (nonce) = _nonce.read();
+        with_attr error_message("l2_dai_teleport_gateway/nonce-overflow") {
+            assert_le(nonce + count, MAX_NONCE);
+        }
+        _nonce.write(nonce + count);
+        return (nonce, 1, NO_SHARD);
+    }
+
+    let (_, caller_low) = split_felt(caller);
+    let (_, local shard) = unsigned_div_rem(caller_low, shards);
+    let (local index) = _shard_nonces.read(shard);
+    _shard_nonces.write(shard, index + count);
+    let (base) = _shard_nonce_base.read();
+    local nonce = base + index * shards + shard;
     with_attr error_message("l2_dai_teleport_gateway/nonce-overflow") {
-        assert_lt(nonce, MAX_NONCE);
+        assert_lt(nonce + (count - 1) * shards, MAX_NONCE);
     }
-    _nonce.write(nonce + 1);
-    return (res=nonce);
+    return (nonce, shards, shard);
 }
 
 @external
@@ -256,16 +386,48 @@ func constructor{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr
 func file{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(
     what: felt, domain: felt, data: felt
 ) {
+    alloc_locals;
     auth();
 
-    with_attr error_message("l2_dai_teleport_gateway/file-unrecognized-param") {
-        assert what = 'valid_domains';
+    if (what == 'shards') {
+        with_attr error_message("l2_dai_teleport_gateway/shards-already-set") {
+            let (shards) = _shards.read();
+            assert shards = 0;
+        }
+        with_attr error_message("l2_dai_teleport_gateway/invalid-data") {
+            assert_le(2, data);
+            assert_le(data, MAX_SHARDS);
+        }
+        let (nonce) = _nonce.read();
+        _shard_nonce_base.write(nonce);
+        _shards.write(data);
+        File.emit(what, domain, data);
+        return ();
+    }
+
+    if (what == 'teleport_ttl') {
+        with_attr error_message("l2_dai_teleport_gateway/invalid-data") {
+            assert_nn_le(data, MAX_TELEPORT_TTL);
+        }
+        _teleport_ttl.write(data);
+        File.emit(what, domain, data);
+        return ();
     }
 
     with_attr error_message("l2_dai_teleport_gateway/invalid-data") {
         assert (1 - data) * data = 0;
     }
 
+    if (what == 'commit_teleports') {
+        _commit_teleports.write(data);
+        File.emit(what, domain, data);
+        return ();
+    }
+
+    with_attr error_message("l2_dai_teleport_gateway/file-unrecognized-param") {
+        assert what = 'valid_domains';
+    }
+
     _valid_domains.write(domain, data);
 
     File.emit(what, domain, data);
@@ -277,6 +439,8 @@ func file{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(
 func initiate_teleport{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(
     target_domain: felt, receiver: felt, amount: felt, operator: felt
 ) {
+    alloc_locals;
+
     with_attr error_message("l2_dai_teleport_gateway/gateway-closed") {
         let (is_open) = _is_open.read();
         assert is_open = 1;
@@ -294,17 +458,15 @@ func initiate_teleport{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_che
         uint256_check(amount_uint256);
     }
 
-    let (dai_to_flush) = _batched_dai_to_flush.read(target_domain);
-    let (new_dai_to_flush) = uint256_add_safe(dai_to_flush, amount_uint256);
-    _batched_dai_to_flush.write(target_domain, new_dai_to_flush);
+    let (local caller) = get_caller_address();
+    let (local nonce, _, shard) = reserve_nonces(caller, 1);
+    add_to_flush(shard, target_domain, amount_uint256);
 
     let (dai) = _dai.read();
-    let (caller) = get_caller_address();
     Burnable.burn(dai, caller, amount_uint256);
 
-    let (domain) = _domain.read();
-    let (nonce) = read_and_update_nonce();
-    let (timestamp) = get_block_timestamp();
+    let (local domain) = _domain.read();
+    let (local timestamp) = get_block_timestamp();
 
     TeleportInitialized.emit(
         source_domain=domain,
@@ -316,18 +478,280 @@ func initiate_teleport{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_che
         timestamp=timestamp,
     );
 
-    _teleports.write(nonce, TeleportData(target_domain, receiver, operator, amount, timestamp));
+    let (commit) = _commit_teleports.read();
+    store_teleport(commit, nonce, TeleportData(target_domain, receiver, operator, amount, timestamp));
+
+    return ();
+}
+
+// Pedersen hash chain of the fields of teleport, in the order of TeleportData.
+func teleport_commitment{pedersen_ptr: HashBuiltin*}(teleport: TeleportData) -> (res: felt) {
+    let (res) = hash2{hash_ptr=pedersen_ptr}(teleport.target_domain, teleport.receiver);
+    let (res) = hash2{hash_ptr=pedersen_ptr}(res, teleport.operator);
+    let (res) = hash2{hash_ptr=pedersen_ptr}(res, teleport.amount);
+    let (res) = hash2{hash_ptr=pedersen_ptr}(res, teleport.timestamp);
+    return (res,);
+}
+
+func store_teleport{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(
+    commit: felt, nonce: felt, teleport: TeleportData
+) {
+    if (commit == 1) {
+        let (commitment) = teleport_commitment(teleport);
+        _teleport_commitments.write(nonce, commitment);
+        return ();
+    }
+
+    _teleports.write(nonce, teleport);
+    return ();
+}
+
+// Checks teleport against the commitment of nonce or, for teleports
+// initiated before commitments were enabled, its _teleports record. Missing
+// records (target_domain is never 0 for a stored teleport) are rejected.
+// Returns whether the teleport is stored as a commitment.
+func assert_teleport_exists{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(
+    nonce: felt, teleport: TeleportData
+) -> (committed: felt) {
+    alloc_locals;
+
+    let (local commitment) = _teleport_commitments.read(nonce);
+    if (commitment != 0) {
+        let (expected) = teleport_commitment(teleport);
+        with_attr error_message("l2_dai_teleport_gateway/teleport-does-not-exist") {
+            assert commitment = expected;
+        }
+        return (committed=1);
+    }
+
+    let (local stored: TeleportData) = _teleports.read(nonce);
+    with_attr error_message("l2_dai_teleport_gateway/teleport-does-not-exist") {
+        assert_not_zero(stored.target_domain);
+        assert teleport.target_domain = stored.target_domain;
+        assert teleport.receiver = stored.receiver;
+        assert teleport.operator = stored.operator;
+        assert teleport.amount = stored.amount;
+        assert teleport.timestamp = stored.timestamp;
+    }
+    return (committed=0);
+}
+
+// Same as initiate_teleport for every request, with the config, the nonce
+// and the timestamp read once, the amounts of consecutive requests to the
+// same domain added up before updating _batched_dai_to_flush and a single
+// burn of the total.
+@external
+func initiate_teleports{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(
+    teleports_len: felt, teleports: TeleportRequest*
+) {
+    alloc_locals;
+
+    with_attr error_message("l2_dai_teleport_gateway/gateway-closed") {
+        let (is_open) = _is_open.read();
+        assert is_open = 1;
+    }
+
+    if (teleports_len == 0) {
+        return ();
+    }
+
+    let (local domain) = _domain.read();
+    let (local caller) = get_caller_address();
+    let (local nonce, local nonce_step, local shard) = reserve_nonces(caller, teleports_len);
+    let (local timestamp) = get_block_timestamp();
+    let (local commit) = _commit_teleports.read();
+
+    // valid domain check of the first run, the following runs are checked
+    // by extend_run
+    with_attr error_message("l2_dai_teleport_gateway/invalid-domain") {
+        let (valid_domain) = _valid_domains.read(teleports[0].target_domain);
+        assert valid_domain = 1;
+    }
+
+    let uint256_zero = Uint256(low=0, high=0);
+    let (run_domain, run_amount: Uint256, local total: Uint256) = initiate_teleports_loop(
+        commit,
+        domain,
+        nonce,
+        nonce_step,
+        shard,
+        timestamp,
+        teleports_len,
+        teleports,
+        teleports[0].target_domain,
+        uint256_zero,
+        uint256_zero,
+    );
+    add_to_flush(shard, run_domain, run_amount);
+
+    let (dai) = _dai.read();
+    Burnable.burn(dai, caller, total);
+
+    return ();
+}
+
+func initiate_teleports_loop{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(
+    commit: felt,
+    domain: felt,
+    nonce: felt,
+    nonce_step: felt,
+    shard: felt,
+    timestamp: felt,
+    teleports_len: felt,
+    teleports: TeleportRequest*,
+    run_domain: felt,
+    run_amount: Uint256,
+    total: Uint256,
+) -> (run_domain: felt, run_amount: Uint256, total: Uint256) {
+    alloc_locals;
+
+    if (teleports_len == 0) {
+        return (run_domain, run_amount, total);
+    }
+
+    // amount should be uint128
+    let amount_uint256 = Uint256(low=teleports[0].amount, high=0);
+    with_attr error_message("l2_dai_teleport_gateway/invalid-amount") {
+        uint256_check(amount_uint256);
+    }
+
+    let (local next_run_domain, local next_run_amount: Uint256) = extend_run(
+        shard,
+        run_domain, run_amount, teleports[0].target_domain, amount_uint256
+    );
+    let (local next_total: Uint256) = uint256_add_safe(total, amount_uint256);
+
+    TeleportInitialized.emit(
+        source_domain=domain,
+        target_domain=teleports[0].target_domain,
+        receiver=teleports[0].receiver,
+        operator=teleports[0].operator,
+        amount=teleports[0].amount,
+        nonce=nonce,
+        timestamp=timestamp,
+    );
+
+    store_teleport(
+        commit,
+        nonce,
+        TeleportData(
+            teleports[0].target_domain,
+            teleports[0].receiver,
+            teleports[0].operator,
+            teleports[0].amount,
+            timestamp,
+        ),
+    );
+
+    return initiate_teleports_loop(
+        commit,
+        domain,
+        nonce + nonce_step,
+        nonce_step,
+        shard,
+        timestamp,
+        teleports_len - 1,
+        teleports + TeleportRequest.SIZE,
+        next_run_domain,
+        next_run_amount,
+        next_total,
+    );
+}
+
+// Adds amount to the run of teleports to run_domain, or flushes the run to
+// _batched_dai_to_flush and starts a new one when target_domain differs.
+func extend_run{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(
+    shard: felt, run_domain: felt, run_amount: Uint256, target_domain: felt, amount: Uint256
+) -> (run_domain: felt, run_amount: Uint256) {
+    if (run_domain == target_domain) {
+        let (sum) = uint256_add_safe(run_amount, amount);
+        return (run_domain, sum);
+    }
+
+    add_to_flush(shard, run_domain, run_amount);
+
+    // valid domain check
+    with_attr error_message("l2_dai_teleport_gateway/invalid-domain") {
+        let (valid_domain) = _valid_domains.read(target_domain);
+        assert valid_domain = 1;
+    }
+
+    return (target_domain, amount);
+}
 
+func add_to_flush{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(
+    shard: felt, domain: felt, amount: Uint256
+) {
+    if (shard == NO_SHARD) {
+        let (dai_to_flush) = _batched_dai_to_flush.read(domain);
+        let (new_dai_to_flush) = uint256_add_safe(dai_to_flush, amount);
+        _batched_dai_to_flush.write(domain, new_dai_to_flush);
+        return ();
+    }
+
+    let (dai_to_flush) = _batched_dai_to_flush_shards.read(domain, shard);
+    let (new_dai_to_flush) = uint256_add_safe(dai_to_flush, amount);
+    _batched_dai_to_flush_shards.write(domain, shard, new_dai_to_flush);
     return ();
 }
 
+// DAI batched for domain, in _batched_dai_to_flush and in every shard. With
+// clear = 1 the cells holding some are zeroed.
+func read_batched{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(
+    clear: felt, domain: felt
+) -> (res: Uint256) {
+    alloc_locals;
+
+    let (local dai_to_flush: Uint256) = _batched_dai_to_flush.read(domain);
+    if (clear * (dai_to_flush.low + dai_to_flush.high) != 0) {
+        _batched_dai_to_flush.write(domain, Uint256(low=0, high=0));
+        tempvar syscall_ptr = syscall_ptr;
+        tempvar pedersen_ptr = pedersen_ptr;
+        tempvar range_check_ptr = range_check_ptr;
+    } else {
+        tempvar syscall_ptr = syscall_ptr;
+        tempvar pedersen_ptr = pedersen_ptr;
+        tempvar range_check_ptr = range_check_ptr;
+    }
+
+    let (shards) = _shards.read();
+    return read_batched_shards(clear, domain, shards, dai_to_flush);
+}
+
+func read_batched_shards{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(
+    clear: felt, domain: felt, shards_len: felt, sum: Uint256
+) -> (res: Uint256) {
+    alloc_locals;
+
+    if (shards_len == 0) {
+        return (sum,);
+    }
+
+    let (local dai_to_flush: Uint256) = _batched_dai_to_flush_shards.read(domain, shards_len - 1);
+    let (local new_sum: Uint256) = uint256_add_safe(sum, dai_to_flush);
+    if (clear * (dai_to_flush.low + dai_to_flush.high) != 0) {
+        _batched_dai_to_flush_shards.write(domain, shards_len - 1, Uint256(low=0, high=0));
+        tempvar syscall_ptr = syscall_ptr;
+        tempvar pedersen_ptr = pedersen_ptr;
+        tempvar range_check_ptr = range_check_ptr;
+    } else {
+        tempvar syscall_ptr = syscall_ptr;
+        tempvar pedersen_ptr = pedersen_ptr;
+        tempvar range_check_ptr = range_check_ptr;
+    }
+
+    return read_batched_shards(clear, domain, shards_len - 1, new_sum);
+}
+
 @external
 func finalize_register_teleport{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(
     target_domain: felt, receiver: felt, amount: felt, operator: felt, nonce: felt, timestamp: felt
 ) {
-    let (domain) = _domain.read();
+    alloc_locals;
 
-    let (payload) = alloc();
+    let (local domain) = _domain.read();
+
+    let (local payload: felt*) = alloc();
     assert payload[0] = FINALIZE_REGISTER_TELEPORT;
     assert payload[1] = domain;
     assert payload[2] = target_domain;
@@ -337,14 +761,7 @@ func finalize_register_teleport{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*,
     assert payload[6] = nonce;
     assert payload[7] = timestamp;
 
-    let (teleport) = _teleports.read(nonce);
-    with_attr error_message("l2_dai_teleport_gateway/teleport-does-not-exist") {
-        assert target_domain = teleport.target_domain;
-        assert receiver = teleport.receiver;
-        assert operator = teleport.operator;
-        assert amount = teleport.amount;
-        assert timestamp = teleport.timestamp;
-    }
+    assert_teleport_exists(nonce, TeleportData(target_domain, receiver, operator, amount, timestamp));
 
     TeleportRegisterFinalized.emit(
         source_domain=domain,
@@ -362,6 +779,135 @@ func finalize_register_teleport{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*,
     return ();
 }
 
+// Same as finalize_register_teleport for every teleport, with a single
+// FINALIZE_REGISTER_TELEPORTS message to L1 carrying all of them:
+// FINALIZE_REGISTER_TELEPORTS, source_domain, teleports_len followed by the
+// TeleportRegistration fields of every teleport.
+@external
+func finalize_register_teleports{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(
+    teleports_len: felt, teleports: TeleportRegistration*
+) {
+    alloc_locals;
+
+    with_attr error_message("l2_dai_teleport_gateway/empty-batch") {
+        assert_not_zero(teleports_len);
+    }
+
+    let (local domain) = _domain.read();
+    finalize_register_teleports_loop(domain, teleports_len, teleports);
+
+    let (payload) = alloc();
+    assert payload[0] = FINALIZE_REGISTER_TELEPORTS;
+    assert payload[1] = domain;
+    assert payload[2] = teleports_len;
+    memcpy(payload + 3, teleports, teleports_len * TeleportRegistration.SIZE);
+
+    let (teleport_gateway) = _teleport_gateway.read();
+    send_message_to_l1(teleport_gateway, 3 + teleports_len * TeleportRegistration.SIZE, payload);
+
+    return ();
+}
+
+func finalize_register_teleports_loop{
+    syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr
+}(domain: felt, teleports_len: felt, teleports: TeleportRegistration*) {
+    if (teleports_len == 0) {
+        return ();
+    }
+
+    assert_teleport_exists(
+        teleports[0].nonce,
+        TeleportData(
+            teleports[0].target_domain,
+            teleports[0].receiver,
+            teleports[0].operator,
+            teleports[0].amount,
+            teleports[0].timestamp,
+        ),
+    );
+
+    TeleportRegisterFinalized.emit(
+        source_domain=domain,
+        target_domain=teleports[0].target_domain,
+        receiver=teleports[0].receiver,
+        operator=teleports[0].operator,
+        amount=teleports[0].amount,
+        nonce=teleports[0].nonce,
+        timestamp=teleports[0].timestamp,
+    );
+
+    return finalize_register_teleports_loop(
+        domain, teleports_len - 1, teleports + TeleportRegistration.SIZE
+    );
+}
+
+// Clears the records, or commitments, of teleports initiated more than
+// _teleport_ttl seconds ago. The teleports are given in full, like to
+// finalize_register_teleports, so that their age can be checked whichever
+// way they are stored. Whether a teleport was finalized on L1 can't be
+// checked on L2, so pruning is restricted to wards, who must only prune
+// teleports known to be finalized.
+@external
+func prune_teleports{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(
+    teleports_len: felt, teleports: TeleportRegistration*
+) {
+    alloc_locals;
+
+    auth();
+
+    let (ttl) = _teleport_ttl.read();
+    with_attr error_message("l2_dai_teleport_gateway/pruning-disabled") {
+        assert_not_zero(ttl);
+    }
+    let (timestamp) = get_block_timestamp();
+    let (count) = prune_teleports_loop(timestamp - ttl, teleports_len, teleports, 0);
+
+    TeleportsPruned.emit(count);
+
+    return ();
+}
+
+func prune_teleports_loop{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(
+    expired_before: felt, teleports_len: felt, teleports: TeleportRegistration*, count: felt
+) -> (count: felt) {
+    alloc_locals;
+
+    if (teleports_len == 0) {
+        return (count=count);
+    }
+
+    let (local committed) = assert_teleport_exists(
+        teleports[0].nonce,
+        TeleportData(
+            teleports[0].target_domain,
+            teleports[0].receiver,
+            teleports[0].operator,
+            teleports[0].amount,
+            teleports[0].timestamp,
+        ),
+    );
+    with_attr error_message("l2_dai_teleport_gateway/teleport-not-expired") {
+        assert_lt(teleports[0].timestamp, expired_before);
+    }
+    clear_teleport(committed, teleports[0].nonce);
+
+    return prune_teleports_loop(
+        expired_before, teleports_len - 1, teleports + TeleportRegistration.SIZE, count + 1
+    );
+}
+
+func clear_teleport{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(
+    committed: felt, nonce: felt
+) {
+    if (committed == 1) {
+        _teleport_commitments.write(nonce, 0);
+        return ();
+    }
+
+    _teleports.write(nonce, TeleportData(0, 0, 0, 0, 0));
+    return ();
+}
+
 func uint256_assert_not_zero{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(
     a: Uint256
 ) {
@@ -374,11 +920,10 @@ func uint256_assert_not_zero{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, ran
 
 @external
 func flush{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(target_domain: felt) {
-    let (dai_to_flush: Uint256) = _batched_dai_to_flush.read(target_domain);
-    uint256_assert_not_zero(dai_to_flush);
+    alloc_locals;
 
-    let uint256_zero = Uint256(low=0, high=0);
-    _batched_dai_to_flush.write(target_domain, uint256_zero);
+    let (local dai_to_flush: Uint256) = read_batched(1, target_domain);
+    uint256_assert_not_zero(dai_to_flush);
 
     let (payload) = alloc();
     assert payload[0] = FINALIZE_FLUSH;
@@ -395,6 +940,54 @@ func flush{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(targ
     return ();
 }
 
+// Flushes every domain of domains with DAI batched, domains with nothing
+// batched are skipped. A single FINALIZE_FLUSH_MANY message to L1 covers all
+// flushed domains: FINALIZE_FLUSH_MANY, count followed by target_domain,
+// dai.low, dai.high of every flushed domain. No message is sent when there
+// is nothing to flush.
+@external
+func flush_many{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(
+    domains_len: felt, domains: felt*
+) {
+    alloc_locals;
+
+    let (payload) = alloc();
+    assert payload[0] = FINALIZE_FLUSH_MANY;
+    let (count) = flush_many_loop(domains_len, domains, payload + 2, 0);
+    if (count == 0) {
+        return ();
+    }
+    assert payload[1] = count;
+
+    let (teleport_gateway) = _teleport_gateway.read();
+    send_message_to_l1(teleport_gateway, 2 + count * 3, payload);
+
+    return ();
+}
+
+func flush_many_loop{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(
+    domains_len: felt, domains: felt*, payload: felt*, count: felt
+) -> (count: felt) {
+    alloc_locals;
+
+    if (domains_len == 0) {
+        return (count,);
+    }
+
+    let (local dai_to_flush: Uint256) = read_batched(1, domains[0]);
+    if (dai_to_flush.low + dai_to_flush.high == 0) {
+        return flush_many_loop(domains_len - 1, domains + 1, payload, count);
+    }
+
+    assert payload[0] = domains[0];
+    assert payload[1] = dai_to_flush.low;
+    assert payload[2] = dai_to_flush.high;
+
+    Flushed.emit(target_domain=domains[0], dai=dai_to_flush);
+
+    return flush_many_loop(domains_len - 1, domains + 1, payload + 3, count + 1);
+}
+
 func uint256_add_safe{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, range_check_ptr}(
     a: Uint256, b: Uint256
 ) -> (sum: Uint256) {
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Long-lived process that runs L2 tests against an in-memory deployment.
+
+`serve` imports starkware and the test harness once, builds the base
+deployment with `build_copyable_deployment` and keeps it warm. It watches
+`contracts/l2` and `test/l2`: a changed contract is recompiled (unchanged
+ones come from the compile cache of `conftest.py`) and the deployment is
+rebuilt, changed test modules are simply re-imported by the next run.
+
+`run` is the thin client: it sends its pytest arguments to the daemon and
+streams back the output, running in-process without xdist.
+
+    poetry run python scripts/l2_daemon.py serve &
+    poetry run python scripts/l2_daemon.py run test/l2/dai.py -k test_transfer
+"""
+
+import argparse
+import asyncio
+import glob
+import hashlib
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+SOCKET_PATH = os.path.join(ROOT, ".l2-daemon.sock")
+L2_CONTRACTS_DIR = os.path.join(ROOT, "contracts", "l2")
+L2_TESTS_DIR = os.path.join(ROOT, "test", "l2")
+# Written and removed by build_copyable_deployment itself.
+IGNORED_FILES = {os.path.join(L2_CONTRACTS_DIR, "sample_spell.cairo")}
+# The deployment depends on the contracts and on these harness modules.
+DEPLOYMENT_MODULES = ["conftest", "Signer"]
+EXIT_PREFIX = "\0exit:"
+POLL_INTERVAL = 0.5
+
+
+def fingerprint(paths):
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        if path in IGNORED_FILES:
+            continue
+        digest.update(path.encode())
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def contract_files():
+    return glob.glob(os.path.join(L2_CONTRACTS_DIR, "*.cairo"))
+
+
+def harness_files():
+    return [os.path.join(L2_TESTS_DIR, f"{name}.py") for name in DEPLOYMENT_MODULES]
+
+
+def test_modules():
+    return [
+        os.path.splitext(os.path.basename(path))[0]
+        for path in glob.glob(os.path.join(L2_TESTS_DIR, "*.py"))
+    ]
+
+
+class WarmDeployment:
+    """The base deployment, rebuilt when the contracts or the harness change."""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.deployment = None
+        self.contracts_fingerprint = None
+        self.harness_fingerprint = None
+
+    def refresh(self, log):
+        with self.lock:
+            harness = fingerprint(harness_files())
+            contracts = fingerprint(contract_files())
+            if harness != self.harness_fingerprint:
+                # Drop the harness modules so the next import picks up the
+                # edits, this also drops the compile cache of conftest.
+                for name in DEPLOYMENT_MODULES:
+                    sys.modules.pop(name, None)
+            elif contracts == self.contracts_fingerprint and self.deployment is not None:
+                return
+
+            import conftest
+
+            start = time.time()
+            self.deployment = asyncio.run(conftest.build_copyable_deployment())
+            self.harness_fingerprint = harness
+            self.contracts_fingerprint = contracts
+            log(f"deployment ready in {time.time() - start:.1f}s")
+
+
+class WarmDeploymentPlugin:
+    """Makes the warm deployment available to the `copyable_deployment` fixture."""
+
+    def __init__(self, warm):
+        self.warm = warm
+
+    def pytest_configure(self, config):
+        config.pluginmanager.register(self.warm, "l2_warm_deployment")
+
+
+def run_pytest(warm, args, color, out):
+    import pytest
+
+    # Test modules (and the helpers they import) are cheap to import again,
+    # keep only the harness modules the deployment was built with.
+    for name in test_modules():
+        if name not in DEPLOYMENT_MODULES:
+            sys.modules.pop(name, None)
+
+    pytest_args = list(args)
+    try:
+        import xdist  # noqa: F401
+
+        pytest_args += ["-n", "0"]
+    except ImportError:
+        pass
+    pytest_args += [f"--color={'yes' if color else 'no'}"]
+
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout = sys.stderr = out
+    try:
+        return int(pytest.main(pytest_args, plugins=[WarmDeploymentPlugin(warm)]))
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+
+
+def serve():
+    os.chdir(ROOT)
+    sys.path.insert(0, L2_TESTS_DIR)
+    if os.path.exists(SOCKET_PATH):
+        os.remove(SOCKET_PATH)
+
+    def log(message):
+        print(f"l2 daemon: {message}", file=sys.stderr, flush=True)
+
+    warm = WarmDeployment()
+    warm.refresh(log)
+
+    def watch():
+        while True:
+            time.sleep(POLL_INTERVAL)
+            try:
+                warm.refresh(log)
+            except Exception as error:
+                log(f"deployment failed: {error}")
+
+    threading.Thread(target=watch, name="l2-daemon-watch", daemon=True).start()
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            request = json.loads(self.rfile.readline())
+            out = _LineWriter(self.wfile)
+            with warm.lock:
+                try:
+                    warm.refresh(log)
+                    code = run_pytest(warm, request["args"], request.get("color", False), out)
+                except Exception as error:
+                    out.write(f"l2 daemon: {error!r}\n")
+                    code = 3
+            out.write(f"{EXIT_PREFIX}{code}\n")
+            out.flush()
+
+    with socketserver.UnixStreamServer(SOCKET_PATH, Handler) as server:
+        log(f"listening on {SOCKET_PATH}")
+        try:
+            server.serve_forever()
+        finally:
+            os.remove(SOCKET_PATH)
+
+
+class _LineWriter:
+    """Text stream over the socket, flushed on every line."""
+
+    def __init__(self, wfile):
+        self.wfile = wfile
+
+    def write(self, text):
+        self.wfile.write(text.encode())
+        if "\n" in text:
+            self.wfile.flush()
+        return len(text)
+
+    def flush(self):
+        self.wfile.flush()
+
+    def isatty(self):
+        return False
+
+
+def absolute_test_path(arg):
+    path, sep, rest = arg.partition("::")
+    if not os.path.exists(path):
+        return arg
+    return os.path.abspath(path) + sep + rest
+
+
+def run(args):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(SOCKET_PATH)
+    except (FileNotFoundError, ConnectionRefusedError):
+        sys.exit("l2 daemon is not running, start it with `scripts/l2_daemon.py serve`")
+
+    # Test paths are relative to the caller, the daemon runs from the repo root.
+    args = [absolute_test_path(arg) for arg in args]
+    request = dict(args=args, color=sys.stdout.isatty())
+    client.sendall((json.dumps(request) + "\n").encode())
+
+    with client.makefile("r") as lines:
+        for line in lines:
+            if line.startswith(EXIT_PREFIX):
+                sys.exit(int(line[len(EXIT_PREFIX):]))
+            sys.stdout.write(line)
+            sys.stdout.flush()
+    sys.exit("l2 daemon closed the connection")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Warm L2 test daemon")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("serve", help="start the daemon")
+    run_parser = subparsers.add_parser("run", help="run tests on the daemon")
+    run_parser.add_argument("pytest_args", nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve()
+    else:
+        run(args.pytest_args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Fuzzes dai.cairo against the Python reference model of test/l2/dai_model.py
+with many seeds in parallel.
+
+Every worker process deploys DAI once and runs the sequences of the seeds
+it gets on copies of that state. Failing seeds are shrunk by the worker and
+printed as minimal reproductions.
+
+    poetry run python scripts/l2_fuzz_dai.py --seeds 1000 --length 200
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+L2_TESTS_DIR = os.path.join(ROOT, "test", "l2")
+WARD = 0x1000
+ACCOUNTS = dict(ward=WARD, alice=0x1001, bob=0x1002, carol=0x1003, dave=0x1004)
+
+_worker = None
+
+
+def init_worker(dai_class):
+    global _worker
+    sys.path.insert(0, L2_TESTS_DIR)
+    from starkware.starknet.services.api.contract_class import ContractClass
+    from starkware.starknet.testing.starknet import Starknet
+
+    from dai_model import DaiFuzzer
+
+    async def deploy():
+        starknet = await Starknet.empty()
+        dai = await starknet.deploy(contract_class=ContractClass.loads(dai_class), constructor_calldata=[WARD])
+        return DaiFuzzer(dai, ACCOUNTS.values())
+
+    loop = asyncio.new_event_loop()
+    _worker = (loop, loop.run_until_complete(deploy()))
+
+
+def fuzz_seed(seed, length):
+    from dai_model import format_ops
+
+    loop, fuzzer = _worker
+    failure = loop.run_until_complete(fuzzer.fuzz(seed, length))
+    if failure is None:
+        return seed, None
+    ops, divergence = failure
+    names = {address: name for name, address in ACCOUNTS.items()}
+    return seed, (
+        f"{format_ops(ops, names)}\n"
+        f"diverged at step {divergence.step}: expected {divergence.expected}, actual {divergence.actual}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Differential fuzzing of dai.cairo")
+    parser.add_argument("--seeds", type=int, default=200, help="number of sequences (default: 200)")
+    parser.add_argument("--first-seed", type=int, default=0)
+    parser.add_argument("--length", type=int, default=100, help="calls per sequence (default: 100)")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="worker processes")
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    sys.path.insert(0, L2_TESTS_DIR)
+    out = sys.stdout
+    import conftest  # redirects sys.stdout
+
+    dai_class = conftest.compile(conftest.DAI_FILE).dumps()
+
+    start = time.time()
+    failures = 0
+    seeds = range(args.first_seed, args.first_seed + args.seeds)
+    with ProcessPoolExecutor(args.jobs, initializer=init_worker, initargs=(dai_class,)) as pool:
+        futures = [pool.submit(fuzz_seed, seed, args.length) for seed in seeds]
+        for future in as_completed(futures):
+            seed, failure = future.result()
+            if failure is not None:
+                failures += 1
+                print(f"seed {seed} failed:\n{failure}\n", file=out, flush=True)
+
+    elapsed = time.time() - start
+    print(
+        f"{args.seeds} sequences of {args.length} calls in {elapsed:.1f}s "
+        f"({args.seeds * args.length / elapsed:.0f} calls/s), {failures} failed",
+        file=out,
+    )
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Summarizes which imports dominate the startup of an L2 test worker.
+
+Runs `python -X importtime` on what an xdist worker imports before its
+first test (pytest, the xdist worker, `test/l2/conftest.py` and the test
+modules) and aggregates the output per top level package and per module
+imported by the harness. With `--history`, the totals are appended as a
+JSON line so the cost can be tracked over time.
+
+    poetry run python scripts/l2_import_report.py --top 15 --history l2-imports.jsonl
+"""
+
+import argparse
+import datetime
+import glob
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+L2_TESTS_DIR = os.path.join(ROOT, "test", "l2")
+LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+
+def harness_modules():
+    return sorted(
+        os.path.splitext(os.path.basename(path))[0]
+        for path in glob.glob(os.path.join(L2_TESTS_DIR, "*.py"))
+    )
+
+
+def worker_imports(modules):
+    lines = ["import pytest", "import asyncio", f"sys.path.insert(0, {L2_TESTS_DIR!r})"]
+    try:
+        import xdist  # noqa: F401
+
+        lines.insert(1, "import xdist.remote")
+    except ImportError:
+        pass
+    lines += [f"import {name}" for name in modules]
+    return "import sys\n" + "\n".join(lines)
+
+
+def run_importtime(code):
+    start = time.time()
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    wall = time.time() - start
+    if process.returncode != 0:
+        sys.exit(process.stderr)
+    return wall, process.stderr.splitlines()
+
+
+def parse(lines):
+    """Returns a list of (module, self_us, cumulative_us, depth)."""
+    entries = []
+    for line in lines:
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            entries.append((module, int(self_us), int(cumulative_us), len(indent) // 2))
+    return entries
+
+
+def summarize(entries, harness):
+    packages = defaultdict(int)
+    for module, self_us, _, _ in entries:
+        packages[module.split(".")[0]] += self_us
+
+    # Modules imported by pytest and the harness, with everything they pulled
+    # in. `-X importtime` prints children before their parent, walking the
+    # entries backwards visits every parent before its children.
+    direct = defaultdict(int)
+    ancestors = []
+    for module, _, cumulative_us, depth in reversed(entries):
+        ancestors = ancestors[:depth] + [module]
+        if depth == 0 and module not in harness:
+            direct[module] += cumulative_us
+        elif depth == 1 and ancestors[0] in harness:
+            direct[f"{module} (from {ancestors[0]})"] += cumulative_us
+
+    total = sum(self_us for _, self_us, _, _ in entries)
+    return total, packages, direct
+
+
+def print_top(title, counter, total, top):
+    print(f"\n{title}")
+    for name, us in sorted(counter.items(), key=lambda item: item[1], reverse=True)[:top]:
+        print(f"  {us / 1000:9.1f} ms  {us / total:6.1%}  {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time report of an L2 test worker")
+    parser.add_argument("--top", type=int, default=10, help="rows per table (default: 10)")
+    parser.add_argument("--history", default=None,
+                        help="append the totals to this JSON lines file")
+    args = parser.parse_args()
+
+    harness = harness_modules()
+    wall, lines = run_importtime(worker_imports(harness))
+    total, packages, direct = summarize(parse(lines), set(harness))
+
+    print(f"worker startup: {wall:.2f}s wall, {total / 1e6:.2f}s importing")
+    print_top("self time per top level package", packages, total, args.top)
+    print_top("cumulative time per module imported by pytest and the harness", direct, total, args.top)
+
+    if args.history:
+        with open(args.history, "a") as f:
+            f.write(json.dumps(dict(
+                date=datetime.datetime.now().isoformat(timespec="seconds"),
+                commit=subprocess.run(
+                    ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True
+                ).stdout.strip(),
+                wall_s=round(wall, 3),
+                import_s=round(total / 1e6, 3),
+                packages={name: us for name, us in sorted(
+                    packages.items(), key=lambda item: item[1], reverse=True)[:args.top]},
+            )) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+In-process load generator for the L2 bridge and teleport flows.
+
+Builds the test deployment with `build_copyable_deployment`, funds a
+population of accounts through `handle_deposit` messages and runs a random
+mix of DAI transfers, `initiate_withdraw`, `initiate_teleport`, `flush` and
+`handle_deposit` against it, the same way the tests drive the contracts.
+
+Reports transactions per second, latency percentiles and Cairo steps per
+operation, and how the process memory and the state grow during the run.
+
+    poetry run python scripts/l2_load.py --accounts 2000 --txs 20000 \\
+        --mix transfer=50,withdraw=15,teleport=15,flush=5,deposit=15
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import time
+from collections import defaultdict
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+L2_TESTS_DIR = os.path.join(ROOT, "test", "l2")
+
+L1_ADDRESS = 0x1
+L1_BRIDGE_ADDRESS = 0x1
+FIRST_ACCOUNT = 0x10000
+FUNDING = 10**6
+MAX = (2**128 - 1, 2**128 - 1)
+OPERATIONS = ["transfer", "withdraw", "teleport", "flush", "deposit"]
+DEFAULT_MIX = "transfer=50,withdraw=15,teleport=15,flush=5,deposit=15"
+
+
+def parse_mix(mix):
+    weights = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"unknown operation {name!r}, expected one of {OPERATIONS}")
+        weights[name] = float(weight)
+    return weights
+
+
+def rss_bytes():
+    # Current resident set size, falls back to the peak where /proc is missing.
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+class Load:
+    def __init__(self, deployment, accounts, seed):
+        from starkware.starknet.testing.starknet import Starknet
+
+        import conftest
+
+        self.state = deployment.starknet.state
+        self.starknet = Starknet(self.state)
+        self.contracts = {
+            name: conftest.unserialize_contract(self.state, contract)
+            for name, contract in deployment.serialized_contracts.items()
+        }
+        self.target_domain = conftest.TARGET_DOMAIN
+        self.accounts = [FIRST_ACCOUNT + i for i in range(accounts)]
+        self.rng = random.Random(seed)
+        self.unflushed = 0
+
+    def deposit(self, recipient, amount):
+        return self.starknet.send_message_to_l2(
+            from_address=L1_BRIDGE_ADDRESS,
+            to_address=self.contracts["l2_bridge"].contract_address,
+            selector="handle_deposit",
+            payload=[recipient, amount, 0, L1_ADDRESS],
+        )
+
+    async def fund(self):
+        dai = self.contracts["dai"]
+        for account in self.accounts:
+            await self.deposit(account, FUNDING)
+            await dai.approve(self.contracts["l2_bridge"].contract_address, MAX).execute(account)
+            await dai.approve(self.contracts["l2_teleport_gateway"].contract_address, MAX).execute(account)
+
+    def next_tx(self, operation):
+        """Returns the operation actually run and its (not yet awaited) transaction."""
+        sender = self.rng.choice(self.accounts)
+        amount = self.rng.randint(1, 5)
+        if operation == "flush" and self.unflushed == 0:
+            operation = "teleport"
+
+        if operation == "transfer":
+            tx = self.contracts["dai"].transfer(self.rng.choice(self.accounts), (amount, 0)).execute(sender)
+        elif operation == "withdraw":
+            tx = self.contracts["l2_bridge"].initiate_withdraw(L1_ADDRESS, (amount, 0)).execute(sender)
+        elif operation == "teleport":
+            self.unflushed += 1
+            tx = self.contracts["l2_teleport_gateway"].initiate_teleport(
+                self.target_domain, self.rng.choice(self.accounts), amount, sender,
+            ).execute(sender)
+        elif operation == "flush":
+            self.unflushed = 0
+            tx = self.contracts["l2_teleport_gateway"].flush(self.target_domain).execute(sender)
+        else:
+            tx = self.deposit(self.rng.choice(self.accounts), amount)
+        return operation, tx
+
+
+async def run(args):
+    from starkware.starkware_utils.error_handling import StarkException
+
+    import conftest
+    from measurements import get_resources
+
+    start = time.perf_counter()
+    deployment = await conftest.build_copyable_deployment()
+    load = Load(deployment, args.accounts, args.seed)
+    deployed_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    await load.fund()
+    funded_s = time.perf_counter() - start
+
+    weights = parse_mix(args.mix)
+    operations = load.rng.choices(list(weights), weights=list(weights.values()), k=args.txs)
+    latencies = defaultdict(list)
+    steps = defaultdict(int)
+    failures = defaultdict(int)
+    memory = [(0, rss_bytes(), len(load.state.state.cache.storage_view))]
+    sample_every = max(1, args.txs // 10)
+
+    start = time.perf_counter()
+    for i, operation in enumerate(operations, 1):
+        operation, tx = load.next_tx(operation)
+        tx_start = time.perf_counter()
+        try:
+            result = await tx
+        except StarkException:
+            failures[operation] += 1
+            continue
+        latencies[operation].append(time.perf_counter() - tx_start)
+        steps[operation] += get_resources(result).steps
+        if i % sample_every == 0:
+            memory.append((i, rss_bytes(), len(load.state.state.cache.storage_view)))
+    elapsed = time.perf_counter() - start
+
+    report = dict(
+        accounts=args.accounts,
+        txs=args.txs,
+        deploy_s=round(deployed_s, 3),
+        fund_s=round(funded_s, 3),
+        run_s=round(elapsed, 3),
+        tx_per_s=round(args.txs / elapsed, 1),
+        operations={},
+        memory=[dict(txs=txs, rss_mb=round(rss / 2**20, 1), storage_cells=cells) for txs, rss, cells in memory],
+        l2_to_l1_messages=len(load.state.l2_to_l1_messages_log),
+    )
+    for operation in OPERATIONS:
+        values = sorted(latencies[operation])
+        if not values and not failures[operation]:
+            continue
+        report["operations"][operation] = dict(
+            count=len(values),
+            failed=failures[operation],
+            p50_ms=round(percentile(values, 0.5) * 1000, 2),
+            p90_ms=round(percentile(values, 0.9) * 1000, 2),
+            p99_ms=round(percentile(values, 0.99) * 1000, 2),
+            max_ms=round(values[-1] * 1000, 2) if values else 0.0,
+            steps=round(steps[operation] / len(values)) if values else 0,
+        )
+    return report
+
+
+def print_report(report, out):
+    print(
+        f"{report['accounts']} accounts, deployed in {report['deploy_s']:.1f}s, funded in {report['fund_s']:.1f}s",
+        file=out,
+    )
+    print(f"{report['txs']} txs in {report['run_s']:.1f}s: {report['tx_per_s']:.1f} tx/s\n", file=out)
+    print(
+        f"{'operation':<10} {'count':>7} {'failed':>7} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} "
+        f"{'max ms':>8} {'steps':>7}",
+        file=out,
+    )
+    for name, op in report["operations"].items():
+        print(
+            f"{name:<10} {op['count']:>7} {op['failed']:>7} {op['p50_ms']:>8.2f} {op['p90_ms']:>8.2f} "
+            f"{op['p99_ms']:>8.2f} {op['max_ms']:>8.2f} {op['steps']:>7}",
+            file=out,
+        )
+    print(f"\n{'txs':>7} {'rss MiB':>8} {'storage cells':>14}", file=out)
+    for sample in report["memory"]:
+        print(f"{sample['txs']:>7} {sample['rss_mb']:>8.1f} {sample['storage_cells']:>14}", file=out)
+    print(f"\nL2 -> L1 messages sent: {report['l2_to_l1_messages']}", file=out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="In-process load generator for the L2 contracts")
+    parser.add_argument("--accounts", type=int, default=1000, help="number of accounts (default: 1000)")
+    parser.add_argument("--txs", type=int, default=10000, help="number of transactions (default: 10000)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, type=str,
+                        help=f"operation weights (default: {DEFAULT_MIX})")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+    parse_mix(args.mix)
+
+    os.chdir(ROOT)
+    sys.path.insert(0, L2_TESTS_DIR)
+    out = sys.stdout
+    import conftest  # noqa: F401, redirects sys.stdout
+
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, indent=2), file=out)
+    else:
+        print_report(report, out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Replays L1 deposits against the L2 test deployment and reports how many
+`handle_deposit` messages per second the harness applies.
+
+The deposits come from a CSV of `LogDeposit` records of the L1 bridge
+(columns l1Sender, amount, l2Recipient) or, with `--synthetic N`, are
+generated.
+
+    poetry run python scripts/l2_replay_deposits.py --csv deposits.csv
+    poetry run python scripts/l2_replay_deposits.py --synthetic 50000
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+L2_TESTS_DIR = os.path.join(ROOT, "test", "l2")
+L1_BRIDGE_ADDRESS = 0x1
+
+
+def synthetic_deposits(count, l2_bridge, seed):
+    from messaging import deposit_message
+
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield deposit_message(
+            L1_BRIDGE_ADDRESS,
+            l2_bridge,
+            l2_recipient=rng.randrange(1, 2**251),
+            amount=rng.randrange(1, 10**24),
+            l1_sender=rng.randrange(1, 2**160),
+        )
+
+
+async def replay(args):
+    import conftest
+    from messaging import inject_messages, read_deposits_csv
+
+    deployment = await conftest.build_copyable_deployment()
+    l2_bridge = deployment.serialized_contracts["l2_bridge"]["contract_address"]
+    if args.csv:
+        messages = read_deposits_csv(args.csv, L1_BRIDGE_ADDRESS, l2_bridge)
+    else:
+        messages = synthetic_deposits(args.synthetic, l2_bridge, args.seed)
+    return await inject_messages(deployment.starknet, messages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay L1 deposits against the L2 contracts")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--csv", help="CSV of LogDeposit records")
+    source.add_argument("--synthetic", type=int, metavar="N", help="generate N deposits")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    sys.path.insert(0, L2_TESTS_DIR)
+    out = sys.stdout
+    import conftest  # noqa: F401, redirects sys.stdout
+
+    report = asyncio.run(replay(args))
+    print(
+        f"{report.count} messages in {report.elapsed:.1f}s: {report.messages_per_s:.1f} msgs/s, "
+        f"{len(report.failures)} failed",
+        file=out,
+    )
+    for failure in report.failures[:10]:
+        print(f"  #{failure.index} {failure.message}: {failure.error.message}", file=out)
+    sys.exit(1 if report.failures else 0)
+
+
+if __name__ == "__main__":
+    main()
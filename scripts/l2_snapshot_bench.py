@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Compares the snapshot format of test/l2/snapshot.py with pickling the
+deployment with dill, as the L2 harness used to do.
+
+Reports serialization and deserialization time and size of both, the time
+to load every compiled class of a snapshot, and the time to copy the state
+of the deployment for a test.
+
+    poetry run python scripts/l2_snapshot_bench.py
+"""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+async def atimed(coroutine):
+    start = time.perf_counter()
+    result = await coroutine
+    return result, time.perf_counter() - start
+
+
+def directory_size(directory):
+    return sum(
+        os.path.getsize(os.path.join(path, name))
+        for path, _, names in os.walk(directory)
+        for name in names
+    )
+
+
+def print_row(name, dump_s, load_s, size):
+    dump = "-" if dump_s is None else f"{dump_s * 1000:.1f}"
+    load = "-" if load_s is None else f"{load_s * 1000:.1f}"
+    print(f"{name:<28} {dump:>10} {load:>10} {size / 2**20:>10.2f}")
+
+
+async def main():
+    os.chdir(ROOT)
+    sys.path.insert(0, os.path.join(ROOT, "test", "l2"))
+    import dill
+    import conftest
+    from snapshot import CLASSES_DIR, DEPLOYMENT_FILE, dump_deployment, load_deployment
+
+    deployment = await conftest.build_copyable_deployment()
+
+    # What the copyable_deployment fixture used to store in the pytest cache.
+    blob, dill_dump_s = timed(lambda: json.dumps(dill.dumps(deployment).decode("cp437")))
+    _, dill_load_s = timed(lambda: dill.loads(json.loads(blob).encode("cp437")))
+
+    with tempfile.TemporaryDirectory() as directory:
+        _, snapshot_dump_s = timed(dump_deployment, deployment, directory)
+        loaded, snapshot_load_s = await atimed(load_deployment(directory))
+        deployment_size = os.path.getsize(os.path.join(directory, DEPLOYMENT_FILE))
+        classes_size = directory_size(os.path.join(directory, CLASSES_DIR))
+
+        classes = loaded.starknet.state.state.contract_classes
+        _, classes_load_s = timed(lambda: [classes[class_hash] for class_hash in classes.class_hashes])
+
+    _, built_copy_s = timed(deployment.starknet.state.copy)
+    _, loaded_copy_s = timed(loaded.starknet.state.copy)
+
+    print(f"{'':<28} {'dump ms':>10} {'load ms':>10} {'MiB':>10}")
+    print_row("dill (pytest cache json)", dill_dump_s, dill_load_s, len(blob))
+    print_row("snapshot", snapshot_dump_s, snapshot_load_s, deployment_size + classes_size)
+    print_row("  deployment.json", None, None, deployment_size)
+    print_row("  classes (lazy)", None, classes_load_s, classes_size)
+    print()
+    print(f"state copy per test: {built_copy_s * 1000:.1f} ms built, {loaded_copy_s * 1000:.1f} ms from snapshot")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
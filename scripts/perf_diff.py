@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+"""
+Compares execution resources of the L2 contract entry points between two git
+revisions.
+
+Both revisions are checked out into temporary worktrees (the head defaults to
+the current working tree, uncommitted changes included) and the same set of
+deterministic scenarios is run against each of them in parallel, using the
+`build_copyable_deployment` flow of the revision's own `test/l2/conftest.py`.
+
+    poetry run python scripts/perf_diff.py --base main
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+from types import SimpleNamespace
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+L1_ADDRESS = 0x1
+METRICS = ["steps", "pedersen", "range_check", "storage_writes", "l1_messages"]
+
+#############
+# SCENARIOS #
+#############
+# A scenario prepares a fresh context and returns the (not yet awaited)
+# transaction to measure. Scenarios whose entry point is missing from the
+# revision's ABI are reported as n/a. The `variant` of a scenario tells apart
+# several scenarios of the same entry point.
+SCENARIOS = []
+
+
+def scenario(contract, entry_point, variant=None):
+    def register(fn):
+        SCENARIOS.append(SimpleNamespace(
+            name=f"{contract}.{entry_point}" + (f" [{variant}]" if variant else ""),
+            contract=contract,
+            entry_point=entry_point,
+            run=fn,
+        ))
+        return fn
+    return register
+
+
+def to_split_uint(a):
+    return (a & ((1 << 128) - 1), a >> 128)
+
+
+def target_domain():
+    from starkware.starknet.public.abi import get_selector_from_name
+    return get_selector_from_name("optimism")
+
+
+@scenario("dai", "transfer")
+async def dai_transfer(ctx):
+    return ctx.dai.transfer(
+        ctx.user2.contract_address, to_split_uint(10)).execute(ctx.user1.contract_address)
+
+
+@scenario("dai", "transferFrom")
+async def dai_transfer_from(ctx):
+    await ctx.dai.approve(
+        ctx.user3.contract_address, to_split_uint(10)).execute(ctx.user1.contract_address)
+    return ctx.dai.transferFrom(
+        ctx.user1.contract_address,
+        ctx.user2.contract_address,
+        to_split_uint(10)).execute(ctx.user3.contract_address)
+
+
+@scenario("dai", "approve")
+async def dai_approve(ctx):
+    return ctx.dai.approve(
+        ctx.user3.contract_address, to_split_uint(10)).execute(ctx.user1.contract_address)
+
+
+@scenario("dai", "increaseAllowance")
+async def dai_increase_allowance(ctx):
+    await ctx.dai.approve(
+        ctx.user3.contract_address, to_split_uint(10)).execute(ctx.user1.contract_address)
+    return ctx.dai.increaseAllowance(
+        ctx.user3.contract_address, to_split_uint(10)).execute(ctx.user1.contract_address)
+
+
+@scenario("dai", "decreaseAllowance")
+async def dai_decrease_allowance(ctx):
+    await ctx.dai.approve(
+        ctx.user3.contract_address, to_split_uint(10)).execute(ctx.user1.contract_address)
+    return ctx.dai.decreaseAllowance(
+        ctx.user3.contract_address, to_split_uint(5)).execute(ctx.user1.contract_address)
+
+
+@scenario("dai", "mint")
+async def dai_mint(ctx):
+    return ctx.dai.mint(
+        ctx.user1.contract_address, to_split_uint(10)).execute(ctx.auth_user.contract_address)
+
+
+@scenario("dai", "burn")
+async def dai_burn(ctx):
+    return ctx.dai.burn(
+        ctx.user1.contract_address, to_split_uint(10)).execute(ctx.user1.contract_address)
+
+
+def transfer_many(size):
+    # `size` distinct recipients, divide the steps by `size` for the cost per
+    # transfer
+    async def run(ctx):
+        await ctx.dai.mint(
+            ctx.user1.contract_address, to_split_uint(size)).execute(ctx.auth_user.contract_address)
+        return ctx.dai.transfer_many(
+            [0x10000 + i for i in range(size)], [to_split_uint(1)] * size).execute(ctx.user1.contract_address)
+    return run
+
+
+for size in [10, 100, 1000]:
+    scenario("dai", "transfer_many", f"{size} transfers")(transfer_many(size))
+
+
+@scenario("dai", "try_burn")
+async def dai_try_burn(ctx):
+    return ctx.dai.try_burn(
+        ctx.user1.contract_address, to_split_uint(10)).execute(ctx.user1.contract_address)
+
+
+@scenario("l2_bridge", "initiate_withdraw")
+async def bridge_initiate_withdraw(ctx):
+    await ctx.dai.approve(
+        ctx.l2_bridge.contract_address, to_split_uint(10)).execute(ctx.user1.contract_address)
+    return ctx.l2_bridge.initiate_withdraw(
+        L1_ADDRESS, to_split_uint(10)).execute(ctx.user1.contract_address)
+
+
+@scenario("l2_bridge", "queue_withdraw")
+async def bridge_queue_withdraw(ctx):
+    await ctx.dai.approve(
+        ctx.l2_bridge.contract_address, to_split_uint(10)).execute(ctx.user1.contract_address)
+    return ctx.l2_bridge.queue_withdraw(
+        L1_ADDRESS, to_split_uint(10)).execute(ctx.user1.contract_address)
+
+
+@scenario("l2_bridge", "flush_withdrawals", "100 queued")
+async def bridge_flush_withdrawals(ctx):
+    await ctx.dai.approve(
+        ctx.l2_bridge.contract_address, to_split_uint(100)).execute(ctx.user1.contract_address)
+    for _ in range(100):
+        await ctx.l2_bridge.queue_withdraw(
+            L1_ADDRESS, to_split_uint(1)).execute(ctx.user1.contract_address)
+    return ctx.l2_bridge.flush_withdrawals(100).execute(ctx.user1.contract_address)
+
+
+@scenario("l2_bridge", "handle_deposit")
+async def bridge_handle_deposit(ctx):
+    return ctx.starknet.send_message_to_l2(
+        from_address=L1_ADDRESS,
+        to_address=ctx.l2_bridge.contract_address,
+        selector="handle_deposit",
+        payload=[ctx.user2.contract_address, *to_split_uint(10), L1_ADDRESS],
+    )
+
+
+@scenario("l2_bridge", "handle_force_withdrawal")
+async def bridge_handle_force_withdrawal(ctx):
+    await ctx.dai.approve(
+        ctx.l2_bridge.contract_address, to_split_uint(10)).execute(ctx.user1.contract_address)
+    return ctx.starknet.send_message_to_l2(
+        from_address=L1_ADDRESS,
+        to_address=ctx.l2_bridge.contract_address,
+        selector="handle_force_withdrawal",
+        payload=[ctx.user1.contract_address, L1_ADDRESS, *to_split_uint(10)],
+    )
+
+
+async def initiate_teleport(ctx):
+    await ctx.dai.approve(
+        ctx.l2_teleport_gateway.contract_address,
+        to_split_uint(10)).execute(ctx.user1.contract_address)
+    return ctx.l2_teleport_gateway.initiate_teleport(
+        target_domain(),
+        ctx.user1.contract_address,
+        10,
+        ctx.user1.contract_address).execute(ctx.user1.contract_address)
+
+
+@scenario("l2_teleport_gateway", "initiate_teleport")
+async def gateway_initiate_teleport(ctx):
+    return await initiate_teleport(ctx)
+
+
+@scenario("l2_teleport_gateway", "initiate_teleport", "commit_teleports")
+async def gateway_initiate_teleport_committed(ctx):
+    await ctx.l2_teleport_gateway.file(
+        int.from_bytes(b"commit_teleports", "big"), 0, 1).execute(ctx.auth_user.contract_address)
+    return await initiate_teleport(ctx)
+
+
+@scenario("l2_teleport_gateway", "initiate_teleports")
+async def gateway_initiate_teleports(ctx):
+    await ctx.dai.approve(
+        ctx.l2_teleport_gateway.contract_address,
+        to_split_uint(10)).execute(ctx.user1.contract_address)
+    return ctx.l2_teleport_gateway.initiate_teleports([
+        (target_domain(), ctx.user1.contract_address, 1, ctx.user1.contract_address)
+        for _ in range(10)
+    ]).execute(ctx.user1.contract_address)
+
+
+@scenario("l2_teleport_gateway", "finalize_register_teleport")
+async def gateway_finalize_register_teleport(ctx):
+    await (await initiate_teleport(ctx))
+    timestamp = ctx.starknet.state.state.block_info.block_timestamp
+    return ctx.l2_teleport_gateway.finalize_register_teleport(
+        target_domain(),
+        ctx.user1.contract_address,
+        10,
+        ctx.user1.contract_address,
+        0,
+        timestamp).execute(ctx.user1.contract_address)
+
+
+@scenario("l2_teleport_gateway", "finalize_register_teleports")
+async def gateway_finalize_register_teleports(ctx):
+    await (await gateway_initiate_teleports(ctx))
+    timestamp = ctx.starknet.state.state.block_info.block_timestamp
+    return ctx.l2_teleport_gateway.finalize_register_teleports([
+        (target_domain(), ctx.user1.contract_address, ctx.user1.contract_address, 1, nonce, timestamp)
+        for nonce in range(10)
+    ]).execute(ctx.user1.contract_address)
+
+
+@scenario("l2_teleport_gateway", "flush")
+async def gateway_flush(ctx):
+    await (await initiate_teleport(ctx))
+    return ctx.l2_teleport_gateway.flush(target_domain()).execute(ctx.user1.contract_address)
+
+
+@scenario("l2_teleport_gateway", "flush_many")
+async def gateway_flush_many(ctx):
+    await (await initiate_teleport(ctx))
+    return ctx.l2_teleport_gateway.flush_many([target_domain()]).execute(ctx.user1.contract_address)
+
+
+@scenario("l2_governance_relay", "relay")
+async def governance_relay(ctx):
+    return ctx.starknet.send_message_to_l2(
+        from_address=L1_ADDRESS,
+        to_address=ctx.l2_governance_relay.contract_address,
+        selector="relay",
+        payload=[ctx.sample_spell.class_hash],
+    )
+
+
+##########
+# RUNNER #
+##########
+def has_entry_point(contract, entry_point):
+    return any(entry.get("name") == entry_point for entry in contract.abi)
+
+
+async def run_scenarios():
+    # The revision's own harness comes first, this checkout's helpers are the
+    # fallback for revisions that predate them.
+    sys.path[:0] = [os.path.join(os.getcwd(), "test", "l2"), os.path.join(ROOT, "test", "l2")]
+    from starkware.starknet.testing.starknet import Starknet
+    import conftest
+    from measurements import measure
+
+    random.seed(0)
+    deployment = await conftest.build_copyable_deployment()
+
+    results = {}
+    for s in SCENARIOS:
+        state = deployment.starknet.state.copy()
+        contracts = {
+            name: conftest.unserialize_contract(state, serialized_contract)
+            for name, serialized_contract in deployment.serialized_contracts.items()
+        }
+        ctx = SimpleNamespace(
+            starknet=Starknet(state),
+            sample_spell=deployment.sample_spell,
+            **contracts,
+        )
+        if not has_entry_point(contracts[s.contract], s.entry_point):
+            results[s.name] = None
+            continue
+        try:
+            _, resources = await measure(state, await s.run(ctx), s.entry_point)
+            results[s.name] = resources._asdict()
+        except Exception as error:
+            results[s.name] = dict(error=str(error).splitlines()[0])
+    return results
+
+
+def git(*args, cwd=ROOT):
+    return subprocess.run(
+        ["git", *args], cwd=cwd, check=True, capture_output=True, text=True
+    ).stdout.strip()
+
+
+def start_run(path):
+    return subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--run-scenarios"],
+        cwd=path,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+
+
+def format_cell(base, head):
+    if base is None or head is None:
+        return "n/a" if head is None else f"{head}"
+    if base == head:
+        return f"{head}"
+    delta = head - base
+    percent = f" {delta / base:+.1%}" if base else ""
+    return f"{base} -> {head} ({delta:+}{percent})"
+
+
+def print_table(base_name, base, head_name, head):
+    print(f"base: {base_name}\nhead: {head_name}\n")
+    header = ["entry point", *METRICS]
+    rows = []
+    for name in sorted(set(base) | set(head)):
+        b, h = base.get(name), head.get(name)
+        if (b and "error" in b) or (h and "error" in h):
+            error = (h or {}).get("error") or b["error"]
+            rows.append([name, f"error: {error}"] + [""] * (len(METRICS) - 1))
+            continue
+        rows.append([name] + [
+            format_cell(b and b[metric], h and h[metric]) for metric in METRICS
+        ])
+    widths = [max(len(row[i]) for row in [header, *rows]) for i in range(len(header))]
+    for row in [header, ["-" * w for w in widths], *rows]:
+        print("  ".join(cell.ljust(width) for cell, width in zip(row, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Per entry point resource diff of the L2 contracts between two revisions")
+    parser.add_argument("--base", default="main", help="base revision (default: main)")
+    parser.add_argument("--head", default=None,
+                        help="head revision (default: the current working tree)")
+    parser.add_argument("--json", default=None, help="also write the raw results to this file")
+    parser.add_argument("--run-scenarios", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_scenarios:
+        # conftest redirects sys.stdout to stderr when imported
+        json.dump(asyncio.run(run_scenarios()), sys.__stdout__)
+        return
+
+    with tempfile.TemporaryDirectory(prefix="perf-diff-") as tmp:
+        worktrees = []
+        try:
+            paths = {}
+            for label, rev in [("base", args.base), ("head", args.head)]:
+                if rev is None:
+                    paths[label] = ROOT
+                    continue
+                path = os.path.join(tmp, label)
+                git("worktree", "add", "--detach", path, rev)
+                worktrees.append(path)
+                paths[label] = path
+
+            runs = {label: start_run(path) for label, path in paths.items()}
+            results = {}
+            for label, run in runs.items():
+                out, _ = run.communicate()
+                if run.returncode != 0:
+                    sys.exit(f"scenarios failed on {label} revision")
+                results[label] = json.loads(out)
+        finally:
+            for path in worktrees:
+                git("worktree", "remove", "--force", path)
+
+    head_name = args.head or "working tree"
+    print_table(args.base, results["base"], head_name, results["head"])
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(dict(base=args.base, head=head_name, results=results), f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -22,6 +22,7 @@ const FORCE_WITHDRAW = parseFixed(
 );
 
 const WITHDRAW = 0;
+const WITHDRAWALS = 1;
 
 function toSplitUint(value: any) {
   const bits = value.toBigInt().toString(16).padStart(64, "0");
@@ -47,6 +48,7 @@ describe("l1:L1DAIBridge", function () {
       "close()",
       "deposit(uint256,uint256)",
       "withdraw(uint256,address)",
+      "finalizeWithdrawals(uint256,address[],uint256[])",
       "forceWithdrawal(uint256,uint256)",
       "setCeiling(uint256)",
       "setMaxDeposit(uint256)",
@@ -557,6 +559,65 @@ describe("l1:L1DAIBridge", function () {
       ).to.be.revertedWith("L1DAIBridge/not-authorized");
     });
   });
+  describe("finalizeWithdrawals", function () {
+    it("sends the funds of every withdrawal of the batch", async () => {
+      const {
+        admin,
+        l1Alice,
+        l1Bob,
+        dai,
+        starkNetFake,
+        escrow,
+        l1Bridge,
+        l2BridgeAddress,
+      } = await setupTest();
+
+      const aliceAmount = eth("333");
+      const bobAmount = eth("111");
+
+      await escrow.approve(dai.address, l1Bridge.address, MAX_UINT256);
+      await dai
+        .connect(admin)
+        .transfer(escrow.address, aliceAmount.add(bobAmount));
+
+      await expect(
+        l1Bridge.finalizeWithdrawals(
+          7,
+          [l1Alice.address, l1Bob.address],
+          [aliceAmount, bobAmount]
+        )
+      )
+        .to.emit(l1Bridge, "LogWithdrawal")
+        .withArgs(l1Alice.address, aliceAmount)
+        .and.to.emit(l1Bridge, "LogWithdrawal")
+        .withArgs(l1Bob.address, bobAmount);
+
+      expect(await dai.balanceOf(l1Alice.address)).to.be.eq(aliceAmount);
+      expect(await dai.balanceOf(l1Bob.address)).to.be.eq(bobAmount);
+      expect(await dai.balanceOf(escrow.address)).to.be.eq(0);
+
+      expect(starkNetFake.consumeMessageFromL2).to.have.been.calledOnce;
+      expect(starkNetFake.consumeMessageFromL2).to.have.been.calledWith(
+        l2BridgeAddress,
+        [
+          WITHDRAWALS,
+          7,
+          2,
+          l1Alice.address,
+          ...split(aliceAmount),
+          l1Bob.address,
+          ...split(bobAmount),
+        ]
+      );
+    });
+    it("reverts when the lengths differ", async () => {
+      const { l1Alice, l1Bridge } = await setupTest();
+
+      await expect(
+        l1Bridge.finalizeWithdrawals(0, [l1Alice.address], [])
+      ).to.be.revertedWith("L1DAIBridge/length-mismatch");
+    });
+  });
   describe("forceWithdrawal", function () {
     it("sends a message to l2, emits event", async () => {
       const { l1Alice, starkNetFake, l1Bridge, l2BridgeAddress } =
@@ -11,6 +11,8 @@ const allowanceLimit = 100;
 const INITIAL_ESCROW_BALANCE = BigInt(eth("100").toString());
 const HANDLE_REGISTER_TELEPORT = 0;
 const HANDLE_FLUSH = 1;
+const HANDLE_REGISTER_TELEPORTS = 2;
+const HANDLE_FLUSH_MANY = 3;
 const AMOUNT = BigInt(10);
 const L1_TARGET_DOMAIN = hre.ethers.utils.formatBytes32String("1");
 const L2_TARGET_DOMAIN = `0x${Buffer.from("1", "utf8").toString("hex")}`;
@@ -47,7 +49,9 @@ describe("l1:L1DAITeleportGateway", () => {
   it("has correct public interface", async () => {
     await assertPublicMutableMethods("L1DAITeleportGateway", [
       "finalizeFlush(bytes32,uint256)",
+      "finalizeFlushMany(bytes32[],uint256[])",
       "finalizeRegisterTeleport((bytes32,bytes32,bytes32,bytes32,uint128,uint80,uint48))",
+      "finalizeRegisterTeleports((bytes32,bytes32,bytes32,bytes32,uint128,uint80,uint48)[])",
     ]);
   });
 
@@ -86,6 +90,60 @@ describe("l1:L1DAITeleportGateway", () => {
     });
   });
 
+  describe("finalizeFlushMany", () => {
+    it("calls the router to settle the dai debt of every domain", async () => {
+      const {
+        dai,
+        escrow,
+        starkNetFake,
+        teleportRouterFake,
+        l1TeleportGateway,
+        l2TeleportGatewayAddress,
+      } = await setupTest();
+
+      await l1TeleportGateway.finalizeFlushMany(
+        [L1_TARGET_DOMAIN, L1_SOURCE_DOMAIN],
+        [AMOUNT, AMOUNT * BigInt(2)]
+      );
+
+      expect(starkNetFake.consumeMessageFromL2).to.have.been.calledOnce;
+      expect(starkNetFake.consumeMessageFromL2).to.have.been.calledWith(
+        l2TeleportGatewayAddress,
+        [
+          HANDLE_FLUSH_MANY,
+          2,
+          L2_TARGET_DOMAIN,
+          AMOUNT, // uint256.low
+          0, // uint256.high
+          L2_SOURCE_DOMAIN,
+          AMOUNT * BigInt(2), // uint256.low
+          0, // uint256.high
+        ]
+      );
+
+      expect(teleportRouterFake.settle).to.have.callCount(2);
+      expect(teleportRouterFake.settle).to.have.been.calledWith(
+        L1_TARGET_DOMAIN,
+        AMOUNT
+      );
+      expect(teleportRouterFake.settle).to.have.been.calledWith(
+        L1_SOURCE_DOMAIN,
+        AMOUNT * BigInt(2)
+      );
+      expect(await dai.balanceOf(escrow.address)).to.be.eq(
+        INITIAL_ESCROW_BALANCE - AMOUNT * BigInt(3)
+      );
+    });
+
+    it("reverts when the lengths differ", async () => {
+      const { l1TeleportGateway } = await setupTest();
+
+      await expect(
+        l1TeleportGateway.finalizeFlushMany([L1_TARGET_DOMAIN], [])
+      ).to.be.revertedWith("L1DAITeleportGateway/length-mismatch");
+    });
+  });
+
   describe("finalizeRegisterTeleport", () => {
     it("calls the router to request DAI", async () => {
       const {
@@ -148,6 +206,75 @@ describe("l1:L1DAITeleportGateway", () => {
       */
     });
   });
+
+  describe("finalizeRegisterTeleports", () => {
+    it("consumes one message and requests DAI for every teleport", async () => {
+      const {
+        l1TeleportGateway,
+        l1Alice,
+        l1Bob,
+        starkNetFake,
+        teleportRouterFake,
+        l2TeleportGatewayAddress,
+      } = await setupTest();
+
+      const receiver = `0x${l1Alice.address.slice(2).padStart(64, "0")}`;
+      const operator = `0x${l1Bob.address.slice(2).padStart(64, "0")}`;
+      const nonces = [0, 1, 2];
+      const l1Teleports = nonces.map((nonce) => [
+        L1_SOURCE_DOMAIN, // sourceDomain
+        L1_TARGET_DOMAIN, // targetDomain
+        receiver, // receiver
+        operator, // operator
+        AMOUNT, // amount
+        nonce, // nonce
+        0, // timestamp
+      ]);
+      const l2Teleports = nonces.flatMap((nonce) => [
+        L2_TARGET_DOMAIN, // targetDomain
+        receiver, // receiver
+        operator, // operator
+        AMOUNT, // amount
+        nonce, // nonce
+        0, // timestamp
+      ]);
+
+      await l1TeleportGateway.finalizeRegisterTeleports(l1Teleports);
+      expect(starkNetFake.consumeMessageFromL2).to.have.been.calledOnce;
+      expect(starkNetFake.consumeMessageFromL2).to.have.been.calledWith(
+        l2TeleportGatewayAddress,
+        [
+          HANDLE_REGISTER_TELEPORTS,
+          L2_SOURCE_DOMAIN,
+          nonces.length,
+          ...l2Teleports,
+        ]
+      );
+
+      expect(teleportRouterFake.requestMint).to.have.callCount(nonces.length);
+    });
+
+    it("reverts when called with no teleports", async () => {
+      const { l1TeleportGateway } = await setupTest();
+
+      await expect(
+        l1TeleportGateway.finalizeRegisterTeleports([])
+      ).to.be.revertedWith("L1DAITeleportGateway/empty-batch");
+    });
+
+    it("reverts when the source domains differ", async () => {
+      const { l1TeleportGateway, l1Alice, l1Bob } = await setupTest();
+
+      const receiver = `0x${l1Alice.address.slice(2).padStart(64, "0")}`;
+      const operator = `0x${l1Bob.address.slice(2).padStart(64, "0")}`;
+      await expect(
+        l1TeleportGateway.finalizeRegisterTeleports([
+          [L1_SOURCE_DOMAIN, L1_TARGET_DOMAIN, receiver, operator, AMOUNT, 0, 0],
+          [L1_TARGET_DOMAIN, L1_TARGET_DOMAIN, receiver, operator, AMOUNT, 1, 0],
+        ])
+      ).to.be.revertedWith("L1DAITeleportGateway/source-domain-mismatch");
+    });
+  });
 });
 
 async function setupTest() {
@@ -24,13 +24,17 @@ class Signer:
                                      )
     """
 
-    def __init__(self, private_key):
+    def __init__(self, private_key, public_key=None):
         self.private_key = private_key
-        self.public_key = private_to_stark_key(private_key)
+        self.public_key = private_to_stark_key(private_key) if public_key is None else public_key
 
     def sign(self, message_hash):
         return sign(msg_hash=message_hash, priv_key=self.private_key)
 
+    def sign_permit(self, dai, owner, spender, amount, nonce, deadline, chain_id):
+        """Signature of a `dai.permit` of `amount` (an int) for the account `owner`."""
+        return self.sign(hash_permit(dai, owner, spender, amount, nonce, deadline, chain_id))
+
     async def send_transaction(self, account, to, selector_name, calldata, nonce=None):
         if nonce is None:
             execution_info = await account.get_nonce().call()
@@ -50,3 +54,11 @@ class Signer:
 def hash_message(sender, to, selector, calldata, nonce):
     message = [sender, to, selector, compute_hash_on_elements(calldata), nonce]
     return compute_hash_on_elements(message)
+
+
+PERMIT = int.from_bytes(b"PERMIT", "big")
+
+
+def hash_permit(dai, owner, spender, amount, nonce, deadline, chain_id):
+    low, high = amount % 2**128, amount // 2**128
+    return compute_hash_on_elements([PERMIT, chain_id, dai, owner, spender, low, high, nonce, deadline])
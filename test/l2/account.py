@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+import pytest
+from types import SimpleNamespace
+
+from conftest import to_split_uint, unserialize_contract
+
+
+def farm_account(farm_ctx: SimpleNamespace, index: int):
+    return unserialize_contract(farm_ctx.starknet.state, dict(
+        abi=farm_ctx.user1.abi,
+        contract_address=farm_ctx.farm.addresses[index],
+        deploy_call_info=None,
+    ))
+
+
+#########
+# TESTS #
+#########
+@pytest.mark.asyncio
+async def test_farm_accounts_have_distinct_keys(
+    farm_ctx: SimpleNamespace,
+):
+    farm = farm_ctx.farm
+    assert len(set(farm.public_keys)) == len(farm)
+    assert len(set(farm.addresses)) == len(farm)
+
+    for index in [0, len(farm) - 1]:
+        public_key = await farm_account(farm_ctx, index).get_public_key().call()
+        assert public_key.result == (farm.signer(index).public_key,)
+
+
+@pytest.mark.asyncio
+async def test_farm_accounts_hold_dai(
+    farm_ctx: SimpleNamespace,
+):
+    dai = farm_ctx.dai
+    first, last = farm_ctx.farm.addresses[0], farm_ctx.farm.addresses[-1]
+
+    await dai.mint(first, to_split_uint(10)).execute(farm_ctx.auth_user.contract_address)
+    await dai.transfer(last, to_split_uint(10)).execute(first)
+
+    balance = await dai.balanceOf(last).call()
+    assert balance.result == (to_split_uint(10),)
@@ -0,0 +1,117 @@
+"""Deterministic populations of account contracts for large-scale tests.
+
+Private keys are derived from a seed, so a farm of a given seed and size is
+the same in every session. Deriving the public keys is the expensive part
+and they are cached on disk (with the addresses, which also depend on the
+account class).
+
+Accounts are not deployed one transaction at a time: the account
+constructor only stores the public key, so the farm writes the class hash
+and the `public_key` storage cell of every account straight into the
+state, at the address a deploy with salt = index would have used.
+"""
+
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from starkware.crypto.signature.signature import EC_ORDER, private_to_stark_key
+from starkware.starknet.core.os.contract_address.contract_address import (
+    calculate_contract_address_from_hash,
+)
+from starkware.starknet.public.abi import get_storage_var_address
+
+from Signer import Signer
+
+FARM_VERSION = 1
+PARALLEL_KEYS_THRESHOLD = 256
+
+
+def derive_private_key(seed, index):
+    digest = hashlib.sha256(f"l2-account-farm:{seed}:{index}".encode()).digest()
+    return int.from_bytes(digest, "big") % (EC_ORDER - 1) + 1
+
+
+def _derive_public_keys(private_keys):
+    if len(private_keys) < PARALLEL_KEYS_THRESHOLD:
+        return [private_to_stark_key(key) for key in private_keys]
+    with ProcessPoolExecutor() as pool:
+        return list(pool.map(private_to_stark_key, private_keys, chunksize=64))
+
+
+class AccountFarm:
+    def __init__(self, seed, private_keys, public_keys, addresses, class_hash):
+        self.seed = seed
+        self.private_keys = private_keys
+        self.public_keys = public_keys
+        self.addresses = addresses
+        self.class_hash = class_hash
+        self.state = None
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def signer(self, index):
+        return Signer(self.private_keys[index], public_key=self.public_keys[index])
+
+    def apply(self, starknet_state):
+        """Deploys the accounts of the farm to `starknet_state`."""
+        public_key = get_storage_var_address("public_key")
+        starknet_state.state.cache.update_writes(
+            address_to_class_hash={address: self.class_hash for address in self.addresses},
+            address_to_nonce={},
+            storage_updates={
+                (address, public_key): key for address, key in zip(self.addresses, self.public_keys)
+            },
+        )
+
+
+def _read_cache(path):
+    try:
+        with open(path) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return dict(version=FARM_VERSION, public_keys=[], addresses={})
+    if cache.get("version") != FARM_VERSION:
+        return dict(version=FARM_VERSION, public_keys=[], addresses={})
+    return cache
+
+
+def load_or_build_farm(directory, seed, size, class_hash):
+    """
+    The farm of `size` accounts of class `class_hash` (bytes) for `seed`,
+    reusing and extending the keys and addresses cached in `directory`.
+    """
+    path = os.path.join(directory, f"{seed}.json")
+    cache = _read_cache(path)
+    private_keys = [derive_private_key(seed, index) for index in range(size)]
+
+    public_keys = cache["public_keys"][:size]
+    dirty = len(public_keys) < size
+    public_keys += _derive_public_keys(private_keys[len(public_keys):])
+
+    addresses = cache["addresses"].get(class_hash.hex(), [])[:size]
+    dirty = dirty or len(addresses) < size
+    class_hash_int = int.from_bytes(class_hash, "big")
+    addresses += [
+        calculate_contract_address_from_hash(
+            salt=index,
+            class_hash=class_hash_int,
+            constructor_calldata=[public_keys[index]],
+            deployer_address=0,
+        )
+        for index in range(len(addresses), size)
+    ]
+
+    if dirty:
+        if len(public_keys) > len(cache["public_keys"]):
+            cache["public_keys"] = public_keys
+        if len(addresses) > len(cache["addresses"].get(class_hash.hex(), [])):
+            cache["addresses"][class_hash.hex()] = addresses
+        tmp = f"{path}.{os.getpid()}"
+        with open(tmp, "w") as f:
+            json.dump(cache, f)
+        os.replace(tmp, path)
+
+    return AccountFarm(seed, private_keys, public_keys, addresses, class_hash)
@@ -0,0 +1,387 @@
+"""Typed records for the payloads of the bridge and teleport messages.
+
+Every record encodes to and decodes from the felts of its message payload
+(or, for Uint256, its calldata), one at a time or in bulk with
+`encode_many`/`decode_many`. Message hashes are computed the way the
+StarkNet core contract does, without going through the validated
+dataclasses of cairo-lang, so hashing many messages stays cheap.
+
+Layouts (see the L1 and L2 contracts):
+
+    handle_deposit            l2_recipient, amount.low, amount.high, sender
+    handle_force_withdrawal   l2_sender, l1_recipient, amount.low, amount.high
+    FINALIZE_WITHDRAW         0, l1_recipient, amount.low, amount.high
+    FINALIZE_WITHDRAWALS      1, first_index, count, then for every withdrawal
+                              l1_recipient, amount.low, amount.high
+    FINALIZE_REGISTER_TELEPORT 0, source_domain, target_domain, receiver, operator,
+                              amount, nonce, timestamp
+    FINALIZE_FLUSH            1, target_domain, dai.low, dai.high
+    FINALIZE_REGISTER_TELEPORTS 2, source_domain, count, then for every teleport
+                              target_domain, receiver, operator, amount, nonce,
+                              timestamp
+    FINALIZE_FLUSH_MANY       3, count, then for every domain target_domain,
+                              dai.low, dai.high
+"""
+
+from dataclasses import dataclass
+
+from eth_hash.auto import keccak
+from starkware.crypto.signature.fast_pedersen_hash import pedersen_hash
+
+UINT128 = 2**128
+FINALIZE_WITHDRAW = 0
+FINALIZE_WITHDRAWALS = 1
+FINALIZE_REGISTER_TELEPORT = 0
+FINALIZE_FLUSH = 1
+FINALIZE_REGISTER_TELEPORTS = 2
+TELEPORT_REGISTRATION_SIZE = 6
+FINALIZE_FLUSH_MANY = 3
+
+
+def _word(value):
+    return value.to_bytes(32, "big")
+
+
+def keccak_words(values):
+    """keccak256 of the 32 byte big endian words `values` (abi.encode of uint256s)."""
+    return int.from_bytes(keccak(b"".join(_word(value) for value in values)), "big")
+
+
+@dataclass(frozen=True)
+class Uint256:
+    __slots__ = ("low", "high")
+    low: int
+    high: int
+
+    @classmethod
+    def from_int(cls, value):
+        return cls(value % UINT128, value // UINT128)
+
+    def __int__(self):
+        return self.low + self.high * UINT128
+
+    def encode(self):
+        return [self.low, self.high]
+
+    @classmethod
+    def decode(cls, felts):
+        return cls(felts[0], felts[1])
+
+    @staticmethod
+    def encode_many(values):
+        """The flattened (low, high) felts of the ints `values`."""
+        felts = []
+        for value in values:
+            felts += (value % UINT128, value // UINT128)
+        return felts
+
+    @staticmethod
+    def decode_many(felts):
+        """The ints of the flattened (low, high) `felts`."""
+        return [low + high * UINT128 for low, high in zip(felts[::2], felts[1::2])]
+
+
+def _split(amount):
+    return amount % UINT128, amount // UINT128
+
+
+def _join(low, high):
+    return low + high * UINT128
+
+
+class _Record:
+    __slots__ = ()
+
+    @classmethod
+    def encode_many(cls, records):
+        return [record.encode() for record in records]
+
+    @classmethod
+    def decode_many(cls, payloads):
+        return [cls.decode(payload) for payload in payloads]
+
+
+@dataclass(frozen=True)
+class Deposit(_Record):
+    """Payload of `handle_deposit`."""
+
+    __slots__ = ("l2_recipient", "amount", "sender")
+    l2_recipient: int
+    amount: int
+    sender: int
+
+    def encode(self):
+        return [self.l2_recipient, *_split(self.amount), self.sender]
+
+    @classmethod
+    def decode(cls, payload):
+        return cls(payload[0], _join(payload[1], payload[2]), payload[3])
+
+
+@dataclass(frozen=True)
+class ForceWithdrawal(_Record):
+    """Payload of `handle_force_withdrawal`."""
+
+    __slots__ = ("l2_sender", "l1_recipient", "amount")
+    l2_sender: int
+    l1_recipient: int
+    amount: int
+
+    def encode(self):
+        return [self.l2_sender, self.l1_recipient, *_split(self.amount)]
+
+    @classmethod
+    def decode(cls, payload):
+        return cls(payload[0], payload[1], _join(payload[2], payload[3]))
+
+
+@dataclass(frozen=True)
+class Withdrawal(_Record):
+    """FINALIZE_WITHDRAW payload of the L2 bridge."""
+
+    __slots__ = ("l1_recipient", "amount")
+    l1_recipient: int
+    amount: int
+
+    def encode(self):
+        return [FINALIZE_WITHDRAW, self.l1_recipient, *_split(self.amount)]
+
+    @classmethod
+    def decode(cls, payload):
+        assert len(payload) == 4 and payload[0] == FINALIZE_WITHDRAW, f"not a withdrawal: {payload}"
+        return cls(payload[1], _join(payload[2], payload[3]))
+
+
+@dataclass(frozen=True)
+class Withdrawals(_Record):
+    """FINALIZE_WITHDRAWALS payload of the L2 bridge, for the queued withdrawals from `first_index`."""
+
+    __slots__ = ("first_index", "withdrawals")
+    first_index: int
+    withdrawals: tuple
+
+    def encode(self):
+        payload = [FINALIZE_WITHDRAWALS, self.first_index, len(self.withdrawals)]
+        for withdrawal in self.withdrawals:
+            payload += withdrawal.encode()[1:]
+        return payload
+
+    @classmethod
+    def decode(cls, payload):
+        assert (
+            len(payload) >= 3 and payload[0] == FINALIZE_WITHDRAWALS and len(payload) == 3 + payload[2] * 3
+        ), f"not a batch of withdrawals: {payload}"
+        return cls(payload[1], tuple(
+            Withdrawal(payload[offset], _join(payload[offset + 1], payload[offset + 2]))
+            for offset in range(3, len(payload), 3)
+        ))
+
+
+def decode_bridge_payload(payload):
+    """The Withdrawal or Withdrawals of an L2 bridge payload."""
+    if payload and payload[0] == FINALIZE_WITHDRAWALS:
+        return Withdrawals.decode(payload)
+    return Withdrawal.decode(payload)
+
+
+def l2_string_to_bytes32(value):
+    """A short string felt as the left aligned bytes32 L1 uses for domains."""
+    length = (value.bit_length() + 7) // 8
+    return value << (8 * (32 - length)) if length else 0
+
+
+def bytes32_to_l2_string(value):
+    """The inverse of `l2_string_to_bytes32` (`toL2String` of the L1 gateway)."""
+    while value and value & 0xFF == 0:
+        value >>= 8
+    return value
+
+
+@dataclass(frozen=True)
+class TeleportGUID(_Record):
+    """
+    A teleport as the L2 gateway stores it. `to_l1` returns the fields of the
+    L1 TeleportGUID struct, with the domains as left aligned bytes32.
+    """
+
+    __slots__ = ("source_domain", "target_domain", "receiver", "operator", "amount", "nonce", "timestamp")
+    source_domain: int
+    target_domain: int
+    receiver: int
+    operator: int
+    amount: int
+    nonce: int
+    timestamp: int
+
+    def encode(self):
+        return [
+            self.source_domain, self.target_domain, self.receiver, self.operator,
+            self.amount, self.nonce, self.timestamp,
+        ]
+
+    @classmethod
+    def decode(cls, felts):
+        return cls(*felts[:7])
+
+    def registration(self):
+        """
+        The fields of the TeleportRegistration struct, the teleport without its
+        source domain. A tuple, as the testing API expects for struct arguments.
+        """
+        return tuple(self.encode()[1:])
+
+    def to_l1(self):
+        return (
+            l2_string_to_bytes32(self.source_domain),
+            l2_string_to_bytes32(self.target_domain),
+            self.receiver,
+            self.operator,
+            self.amount,
+            self.nonce,
+            self.timestamp,
+        )
+
+    @classmethod
+    def from_l1(cls, fields):
+        source_domain, target_domain, *rest = fields
+        return cls(bytes32_to_l2_string(source_domain), bytes32_to_l2_string(target_domain), *rest)
+
+    def guid_hash(self):
+        """keccak256(abi.encode(guid)), the hash dss-teleport identifies a teleport by."""
+        return keccak_words(self.to_l1())
+
+    @classmethod
+    def guid_hashes(cls, guids):
+        return [guid.guid_hash() for guid in guids]
+
+    def commitment(self):
+        """
+        The Pedersen commitment the L2 gateway stores instead of the teleport
+        when `commit_teleports` is set.
+        """
+        result = pedersen_hash(self.target_domain, self.receiver)
+        for value in (self.operator, self.amount, self.timestamp):
+            result = pedersen_hash(result, value)
+        return result
+
+
+@dataclass(frozen=True)
+class FinalizeRegisterTeleport(_Record):
+    """FINALIZE_REGISTER_TELEPORT payload of the L2 teleport gateway."""
+
+    __slots__ = ("guid",)
+    guid: TeleportGUID
+
+    def encode(self):
+        return [FINALIZE_REGISTER_TELEPORT, *self.guid.encode()]
+
+    @classmethod
+    def decode(cls, payload):
+        assert len(payload) == 8 and payload[0] == FINALIZE_REGISTER_TELEPORT, (
+            f"not a teleport registration: {payload}"
+        )
+        return cls(TeleportGUID.decode(payload[1:]))
+
+
+@dataclass(frozen=True)
+class FinalizeFlush(_Record):
+    """FINALIZE_FLUSH payload of the L2 teleport gateway."""
+
+    __slots__ = ("target_domain", "amount")
+    target_domain: int
+    amount: int
+
+    def encode(self):
+        return [FINALIZE_FLUSH, self.target_domain, *_split(self.amount)]
+
+    @classmethod
+    def decode(cls, payload):
+        assert len(payload) == 4 and payload[0] == FINALIZE_FLUSH, f"not a flush: {payload}"
+        return cls(payload[1], _join(payload[2], payload[3]))
+
+
+@dataclass(frozen=True)
+class FinalizeRegisterTeleports(_Record):
+    """FINALIZE_REGISTER_TELEPORTS payload of the L2 teleport gateway."""
+
+    __slots__ = ("guids",)
+    guids: tuple
+
+    def encode(self):
+        source_domain = self.guids[0].source_domain
+        payload = [FINALIZE_REGISTER_TELEPORTS, source_domain, len(self.guids)]
+        for guid in self.guids:
+            assert guid.source_domain == source_domain, f"teleports of different source domains: {self.guids}"
+            payload += guid.registration()
+        return payload
+
+    @classmethod
+    def decode(cls, payload):
+        assert (
+            len(payload) >= 3
+            and payload[0] == FINALIZE_REGISTER_TELEPORTS
+            and len(payload) == 3 + payload[2] * TELEPORT_REGISTRATION_SIZE
+        ), f"not a batch of teleport registrations: {payload}"
+        source_domain = payload[1]
+        return cls(tuple(
+            TeleportGUID.decode([source_domain, *payload[offset:offset + TELEPORT_REGISTRATION_SIZE]])
+            for offset in range(3, len(payload), TELEPORT_REGISTRATION_SIZE)
+        ))
+
+
+@dataclass(frozen=True)
+class FinalizeFlushMany(_Record):
+    """FINALIZE_FLUSH_MANY payload of the L2 teleport gateway."""
+
+    __slots__ = ("flushes",)
+    flushes: tuple
+
+    def encode(self):
+        payload = [FINALIZE_FLUSH_MANY, len(self.flushes)]
+        for flush in self.flushes:
+            payload += flush.encode()[1:]
+        return payload
+
+    @classmethod
+    def decode(cls, payload):
+        assert (
+            len(payload) >= 2 and payload[0] == FINALIZE_FLUSH_MANY and len(payload) == 2 + payload[1] * 3
+        ), f"not a flush of many domains: {payload}"
+        return cls(tuple(
+            FinalizeFlush(payload[offset], _join(payload[offset + 1], payload[offset + 2]))
+            for offset in range(2, len(payload), 3)
+        ))
+
+
+def decode_gateway_payload(payload):
+    """
+    The FinalizeRegisterTeleport, FinalizeRegisterTeleports, FinalizeFlush or
+    FinalizeFlushMany of an L2 teleport gateway payload.
+    """
+    if len(payload) == 8 and payload[0] == FINALIZE_REGISTER_TELEPORT:
+        return FinalizeRegisterTeleport.decode(payload)
+    if payload and payload[0] == FINALIZE_REGISTER_TELEPORTS:
+        return FinalizeRegisterTeleports.decode(payload)
+    if payload and payload[0] == FINALIZE_FLUSH_MANY:
+        return FinalizeFlushMany.decode(payload)
+    return FinalizeFlush.decode(payload)
+
+
+def l2_to_l1_message_hash(from_address, to_address, payload):
+    """Hash the StarkNet core contract consumes an L2 -> L1 message by."""
+    return keccak_words([from_address, to_address, len(payload), *payload])
+
+
+def l2_to_l1_message_hashes(messages):
+    """Hashes of the (from_address, to_address, payload) `messages`."""
+    return [l2_to_l1_message_hash(*message) for message in messages]
+
+
+def l1_to_l2_message_hash(from_address, to_address, selector, payload, nonce):
+    """Hash of an L1 -> L2 message sent by the StarkNet core contract with `nonce`."""
+    return keccak_words([from_address, to_address, nonce, selector, len(payload), *payload])
+
+
+def l1_to_l2_message_hashes(messages):
+    """Hashes of the (from_address, to_address, selector, payload, nonce) `messages`."""
+    return [l1_to_l2_message_hash(*message) for message in messages]
@@ -1,20 +1,26 @@
+from __future__ import annotations
+
 import asyncio
+import glob
+import hashlib
 import pytest
-import dill
 import os
 import sys
 from types import SimpleNamespace
+from typing import TYPE_CHECKING
 import time
 
-from starkware.starknet.compiler.compile import compile_starknet_files
-from starkware.starknet.testing.starknet import Starknet, StarknetContract, DeclaredClass
-from starkware.starknet.business_logic.state.state import BlockInfo
-from starkware.starknet.business_logic.execution.objects import Event
 from starkware.starknet.public.abi import get_selector_from_name
 from itertools import chain
 
 from Signer import Signer
 
+# The compiler and the testing framework are imported where they are first
+# needed: the xdist controller and workers load this file before any
+# test runs (see scripts/l2_import_report.py).
+if TYPE_CHECKING:
+    from starkware.starknet.testing.starknet import Starknet, StarknetContract, DeclaredClass
+
 # pytest-xdest only shows stderr
 sys.stdout = sys.stderr
 
@@ -28,6 +34,8 @@ TARGET_DOMAIN = get_selector_from_name("optimism")
 # HELPERS #
 ###########
 def check_event(contract, event_name, tx, values):
+    from starkware.starknet.business_logic.execution.objects import Event
+
     expected_event = Event(
         from_address=contract.contract_address,
         keys=[get_selector_from_name(event_name)],
@@ -44,18 +52,35 @@ def to_uint(a):
     return a[0] + (a[1] << 128)
 
 
-async def deploy_account(starknet, signer, source):
+def sign_permit(starknet, signer, dai, owner, spender, amount, nonce, deadline):
+    """The signature of `signer` for the `dai.permit` call with these arguments."""
+    chain_id = starknet.state.general_config.chain_id.value
+    return list(signer.sign_permit(dai.contract_address, owner, spender, amount, nonce, deadline, chain_id))
+
+
+async def deploy_account(starknet, signer, contract_class):
     return await starknet.deploy(
-        source=source,
+        contract_class=contract_class,
         constructor_calldata=[signer.public_key],
     )
 
+# path -> (source digest, contract class), survives deployments rebuilt in the
+# same process (see scripts/l2_daemon.py) so only changed contracts recompile.
+_compiled = {}
+
 def compile(path):
-    return compile_starknet_files(
-        files=[path],
-        debug_info=True,
-        cairo_path=CONTRACT_SRC,
-    )
+    with open(path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    cached = _compiled.get(path)
+    if cached is None or cached[0] != digest:
+        from starkware.starknet.compiler.compile import compile_starknet_files
+
+        cached = _compiled[path] = (digest, compile_starknet_files(
+            files=[path],
+            debug_info=True,
+            cairo_path=CONTRACT_SRC,
+        ))
+    return cached[1]
 
 
 def get_block_timestamp(starknet_state):
@@ -63,6 +88,8 @@ def get_block_timestamp(starknet_state):
 
 
 def set_block_timestamp(starknet_state, timestamp):
+    from starkware.starknet.business_logic.state.state import BlockInfo
+
     starknet_state.state.block_info = BlockInfo.create_for_testing(
         starknet_state.state.block_info.block_number, timestamp
     )
@@ -82,9 +109,96 @@ def serialize_contract(contract, abi):
 
 
 def unserialize_contract(starknet_state, serialized_contract):
+    from starkware.starknet.testing.starknet import StarknetContract
+
     return StarknetContract(state=starknet_state, **serialized_contract)
 
 
+def pytest_addoption(parser):
+    group = parser.getgroup("l2", "StarkNet L2 test harness")
+    group.addoption(
+        "--profile-steps",
+        default=None,
+        metavar="ENTRY_POINTS",
+        help="comma separated entry points (e.g. finalize_register_teleport,"
+        "handle_force_withdrawal) whose Cairo steps are profiled",
+    )
+    group.addoption(
+        "--profile-steps-output",
+        default="l2-steps.folded",
+        metavar="PATH",
+        help="collapsed-stack output of --profile-steps, per line totals go to PATH.lines.tsv",
+    )
+    group.addoption(
+        "--check-invariants",
+        action="store_true",
+        help="check DAI and teleport gateway invariants after every transaction (see invariants.py)",
+    )
+    group.addoption(
+        "--account-farm-size",
+        type=int,
+        default=100,
+        metavar="N",
+        help="number of accounts of the account_farm fixture",
+    )
+    group.addoption(
+        "--account-farm-seed",
+        type=int,
+        default=0,
+        help="seed the keys of the account_farm fixture are derived from",
+    )
+    group.addoption(
+        "--rebuild-deployment",
+        action="store_true",
+        help="build the deployment even if the snapshot in the pytest cache is up to date",
+    )
+    group.addoption(
+        "--run-slow",
+        action="store_true",
+        help="run the tests marked slow",
+    )
+    group.addoption(
+        "--duration-schedule",
+        action="store_true",
+        help="hand out tests to xdist workers longest first, based on the durations "
+        "of previous runs, instead of the plain --dist load/loadscope distribution",
+    )
+
+
+def pytest_configure(config):
+    entry_points = config.getoption("profile_steps")
+    if entry_points:
+        from profiler import StepProfiler
+
+        profiler = StepProfiler(
+            entry_points=entry_points.split(","),
+            output=config.getoption("profile_steps_output"),
+        )
+        profiler.install()
+        config.pluginmanager.register(profiler, "l2_step_profiler")
+
+    if config.getoption("check_invariants"):
+        import invariants
+
+        invariants.install()
+        config.add_cleanup(invariants.uninstall)
+
+    # Durations and scopes are recorded on every run, the scheduler itself is
+    # only used with --duration-schedule.
+    from scheduling import DurationSchedulingPlugin
+
+    config.pluginmanager.register(DurationSchedulingPlugin(config), "l2_duration_scheduling")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("run_slow"):
+        return
+    skip_slow = pytest.mark.skip(reason="slow, run with --run-slow")
+    for item in items:
+        if "slow" in item.keywords:
+            item.add_marker(skip_slow)
+
+
 @pytest.fixture(scope="session")
 def event_loop():
     return asyncio.new_event_loop()
@@ -105,6 +219,8 @@ REGISTRY_FILE = os.path.join(L2_CONTRACTS_DIR, "registry.cairo")
 GOVERNANCE_FILE = os.path.join(L2_CONTRACTS_DIR, "l2_governance_relay.cairo")
 
 async def build_copyable_deployment():
+    from starkware.starknet.testing.starknet import Starknet
+
     starknet = await Starknet.empty()
 
     # initialize a realistic timestamp
@@ -117,30 +233,39 @@ async def build_copyable_deployment():
         auth_user=Signer(83745982347),
     )
 
+    defs = SimpleNamespace(
+        account=compile(ACCOUNT_FILE),
+        dai=compile(DAI_FILE),
+        l2_bridge=compile(BRIDGE_FILE),
+        l2_teleport_gateway=compile(TELEPORT_GATEWAY_FILE),
+        registry=compile(REGISTRY_FILE),
+        l2_governance_relay=compile(GOVERNANCE_FILE),
+    )
+
     # Maps from name -> account contract
     accounts = SimpleNamespace(
         **{
-            name: (await deploy_account(starknet, signer, ACCOUNT_FILE))
+            name: (await deploy_account(starknet, signer, defs.account))
             for name, signer in signers.items()
         }
     )
 
     l2_governance_relay = await starknet.deploy(
-            source=GOVERNANCE_FILE,
+            contract_class=defs.l2_governance_relay,
             constructor_calldata=[
                 int(L1_GOVERNANCE_ADDRESS),
             ])
 
-    registry = await starknet.deploy(source=REGISTRY_FILE)
+    registry = await starknet.deploy(contract_class=defs.registry)
 
     dai = await starknet.deploy(
-            source=DAI_FILE,
+            contract_class=defs.dai,
             constructor_calldata=[
                 accounts.auth_user.contract_address,
             ])
 
     l2_bridge = await starknet.deploy(
-        source=BRIDGE_FILE,
+        contract_class=defs.l2_bridge,
         constructor_calldata=[
             accounts.auth_user.contract_address,
             dai.contract_address,
@@ -150,7 +275,7 @@ async def build_copyable_deployment():
     )
 
     l2_teleport_gateway = await starknet.deploy(
-        source=TELEPORT_GATEWAY_FILE,
+        contract_class=defs.l2_teleport_gateway,
         constructor_calldata=[
             accounts.auth_user.contract_address,
             dai.contract_address,
@@ -191,7 +316,7 @@ async def build_copyable_deployment():
     with open(SPELL_FILE, 'w') as f:
         f.write(contract)
 
-    sample_spell = await starknet.declare(source=SPELL_FILE)
+    sample_spell = await starknet.declare(contract_class=compile(SPELL_FILE))
 
     await registry.set_L1_address(
             int(L1_ADDRESS)).execute(accounts.auth_user.contract_address)
@@ -212,15 +337,6 @@ async def build_copyable_deployment():
             l2_governance_relay.contract_address,
         ).execute(accounts.auth_user.contract_address)
 
-    defs = SimpleNamespace(
-        account=compile(ACCOUNT_FILE),
-        dai=compile(DAI_FILE),
-        l2_bridge=compile(BRIDGE_FILE),
-        l2_teleport_gateway=compile(TELEPORT_GATEWAY_FILE),
-        registry=compile(REGISTRY_FILE),
-        l2_governance_relay=compile(GOVERNANCE_FILE),
-    )
-
     try:
         os.remove(SPELL_FILE)
     except OSError as error:
@@ -263,57 +379,218 @@ async def build_copyable_deployment():
 
 @pytest.fixture(scope="session")
 async def copyable_deployment(request):
-    CACHE_KEY = "deployment"
-    val = request.config.cache.get(CACHE_KEY, None)
+    warm = request.config.pluginmanager.get_plugin("l2_warm_deployment")
+    if warm is not None:
+        return warm.deployment
+
+    from snapshot import dump_deployment, load_deployment, read_fingerprint, source_fingerprint
+
+    # The snapshot is reused as long as the contracts and the harness that
+    # built it are unchanged.
+    directory = str(request.config.cache.makedir("l2_snapshot"))
+    fingerprint = source_fingerprint(snapshot_sources())
+    if not request.config.getoption("rebuild_deployment") and read_fingerprint(directory) == fingerprint:
+        return await load_deployment(directory)
+
     val = await build_copyable_deployment()
-    res = dill.dumps(val).decode("cp437")
-    request.config.cache.set(CACHE_KEY, res)
+    dump_deployment(val, directory, fingerprint)
     return val
 
 
+def snapshot_sources():
+    contracts = [
+        path for path in glob.glob(os.path.join(L2_CONTRACTS_DIR, "*.cairo")) if path != SPELL_FILE
+    ]
+    harness = [
+        os.path.join(os.path.dirname(__file__), name)
+        for name in ["conftest.py", "Signer.py", "snapshot.py"]
+    ]
+    return contracts + harness
+
+
+def make_ctx(deployment, base_state, checkpoint=None):
+    from starkware.starknet.testing.starknet import Starknet
+
+    serialized_contracts = deployment.serialized_contracts
+    signers = deployment.signers
+
+    starknet_state = base_state.copy()
+    contracts = {
+        name: unserialize_contract(starknet_state, serialized_contract)
+        for name, serialized_contract in serialized_contracts.items()
+    }
+
+    async def execute(account_name, contract_address, selector_name, calldata):
+        return await signers[account_name].send_transaction(
+            contracts[account_name],
+            contract_address,
+            selector_name,
+            calldata,
+        )
+
+    def advance_clock(num_seconds):
+        set_block_timestamp(
+            starknet_state, get_block_timestamp(starknet_state) + num_seconds
+        )
+
+    return SimpleNamespace(
+        starknet=Starknet(starknet_state),
+        advance_clock=advance_clock,
+        consts=deployment.consts,
+        execute=execute,
+        signers=signers,
+        sample_spell=deployment.sample_spell,
+        checkpoint=checkpoint or SimpleNamespace(),
+        **contracts,
+    )
+
+
+###############
+# CHECKPOINTS #
+###############
+# Named states shared by tests with a common preamble. A checkpoint is built
+# once per session (per xdist worker) from its parent, and tests marked with
+# `@pytest.mark.checkpoint(name)` start from a copy of it instead of replaying
+# the preamble. Whatever the builder returns (e.g. the transactions it ran)
+# is available through the `checkpoint` fixture.
+CHECKPOINTS = {}
+
+
+def checkpoint(name, parent=None):
+    def register(build):
+        CHECKPOINTS[name] = SimpleNamespace(name=name, parent=parent, build=build)
+        return build
+    return register
+
+
+@checkpoint("after_user2_approve_10")
+async def after_user2_approve_10(ctx):
+    await ctx.dai.approve(
+            ctx.user2.contract_address,
+            to_split_uint(10),
+        ).execute(ctx.user1.contract_address)
+    return {}
+
+
+@checkpoint("after_gateway_approve_10")
+async def after_gateway_approve_10(ctx):
+    await ctx.dai.approve(
+            ctx.l2_teleport_gateway.contract_address,
+            to_split_uint(10),
+        ).execute(ctx.user1.contract_address)
+    return {}
+
+
+@checkpoint("after_one_teleport", parent="after_gateway_approve_10")
+async def after_one_teleport(ctx):
+    teleport_tx = await ctx.l2_teleport_gateway.initiate_teleport(
+            TARGET_DOMAIN,
+            ctx.user1.contract_address,
+            10,
+            ctx.user1.contract_address,
+        ).execute(ctx.user1.contract_address)
+    return dict(teleport_tx=teleport_tx)
+
+
+@checkpoint("after_bridge_approve_10")
+async def after_bridge_approve_10(ctx):
+    await ctx.dai.approve(
+            ctx.l2_bridge.contract_address,
+            to_split_uint(10),
+        ).execute(ctx.user1.contract_address)
+    return {}
+
+
+@pytest.fixture(scope="session")
+async def checkpoints(copyable_deployment):
+    built = {}
+
+    async def get(name):
+        if name not in built:
+            if name not in CHECKPOINTS:
+                raise KeyError(f"unknown checkpoint {name}")
+            spec = CHECKPOINTS[name]
+            if spec.parent is None:
+                base_state = copyable_deployment.starknet.state
+                results = {}
+            else:
+                base_state, parent = await get(spec.parent)
+                results = vars(parent)
+            ctx = make_ctx(copyable_deployment, base_state)
+            results = {**results, **(await spec.build(ctx))}
+            built[name] = (ctx.starknet.state, SimpleNamespace(**results))
+        return built[name]
+
+    return get
+
+
 @pytest.fixture(scope="session")
 async def ctx_factory(copyable_deployment):
     def make():
-        serialized_contracts = copyable_deployment.serialized_contracts
-        signers = copyable_deployment.signers
-        consts = copyable_deployment.consts
-        sample_spell = copyable_deployment.sample_spell
-
-        starknet_state = copyable_deployment.starknet.state.copy()
-        contracts = {
-            name: unserialize_contract(starknet_state, serialized_contract)
-            for name, serialized_contract in serialized_contracts.items()
-        }
+        return make_ctx(copyable_deployment, copyable_deployment.starknet.state)
+
+    return make
+
+@pytest.fixture(scope="function")
+async def ctx(request, ctx_factory, copyable_deployment, checkpoints):
+    marker = request.node.get_closest_marker("checkpoint")
+    if marker is None:
+        ctx = ctx_factory()
+    else:
+        base_state, results = await checkpoints(marker.args[0])
+        ctx = make_ctx(copyable_deployment, base_state, checkpoint=results)
+
+    attach_invariants(request, ctx)
+    return ctx
+
+
+def attach_invariants(request, ctx):
+    if request.config.getoption("check_invariants"):
+        import invariants
 
-        async def execute(account_name, contract_address, selector_name, calldata):
-            return await signers[account_name].send_transaction(
-                contracts[account_name],
-                contract_address,
-                selector_name,
-                calldata,
-            )
-
-        def advance_clock(num_seconds):
-            set_block_timestamp(
-                starknet_state, get_block_timestamp(starknet_state) + num_seconds
-            )
-
-        return SimpleNamespace(
-            starknet=Starknet(starknet_state),
-            advance_clock=advance_clock,
-            consts=consts,
-            execute=execute,
-            sample_spell=sample_spell,
-            **contracts,
+        invariants.attach(
+            ctx.starknet.state,
+            ctx.dai.contract_address,
+            ctx.l2_teleport_gateway.contract_address,
         )
 
-    return make
+
+@pytest.fixture(scope="session")
+async def account_farm(request, copyable_deployment):
+    """
+    `--account-farm-size` accounts with distinct, deterministic keys, deployed
+    on top of the base deployment (see account_farm.py). The keys and
+    addresses are cached in the pytest cache across sessions.
+    """
+    from account_farm import load_or_build_farm
+
+    state = copyable_deployment.starknet.state.copy()
+    user1 = copyable_deployment.serialized_contracts["user1"]["contract_address"]
+    class_hash = await state.state.get_class_hash_at(user1)
+
+    farm = load_or_build_farm(
+        str(request.config.cache.makedir("l2_account_farm")),
+        seed=request.config.getoption("account_farm_seed"),
+        size=request.config.getoption("account_farm_size"),
+        class_hash=class_hash,
+    )
+    farm.apply(state)
+    farm.state = state
+    return farm
+
 
 @pytest.fixture(scope="function")
-def ctx(ctx_factory):
-    ctx = ctx_factory()
+async def farm_ctx(request, copyable_deployment, account_farm):
+    """Like `ctx`, starting from the base deployment with the account farm."""
+    ctx = make_ctx(copyable_deployment, account_farm.state)
+    ctx.farm = account_farm
+    attach_invariants(request, ctx)
     return ctx
 
+@pytest.fixture(scope="function")
+async def checkpoint(ctx):
+    return ctx.checkpoint
+
 @pytest.fixture(scope="function")
 async def starknet(ctx) -> Starknet:
     return ctx.starknet
@@ -322,6 +599,10 @@ async def starknet(ctx) -> Starknet:
 async def block_timestamp(starknet):
     return lambda: get_block_timestamp(starknet.state)
 
+@pytest.fixture(scope="function")
+async def signers(ctx):
+    return ctx.signers
+
 @pytest.fixture(scope="function")
 async def user1(ctx) -> StarknetContract:
     return ctx.user1
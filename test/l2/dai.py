@@ -1,11 +1,17 @@
+from __future__ import annotations
+
 import pytest
+from typing import TYPE_CHECKING
 
-from starkware.starknet.testing.contract import StarknetContract
 from starkware.starkware_utils.error_handling import StarkException
-from starkware.starknet.business_logic.execution.objects import Event
-from starkware.starknet.public.abi import get_selector_from_name
-from itertools import chain
-from conftest import to_split_uint, to_uint, check_event
+from conftest import to_split_uint, to_uint, check_event, sign_permit
+from dai_model import DaiFuzzer, format_ops
+from measurements import get_resources
+import invariants
+
+if TYPE_CHECKING:
+    from starkware.starknet.testing.starknet import Starknet
+    from starkware.starknet.testing.contract import StarknetContract
 
 MAX = (2**128-1, 2**128-1)
 L1_ADDRESS = 0x1
@@ -14,7 +20,12 @@ ECDSA_PUBLIC_KEY = 0
 burn = 0
 no_funds = 1
 
+BURNED = 0
+INSUFFICIENT_BALANCE = 1
+INSUFFICIENT_ALLOWANCE = 2
+
 starknet_contract_address = 0x0
+FIRST_RECIPIENT = 0x10000
 
 
 
@@ -220,6 +231,155 @@ async def test_should_not_allow_minting_to_address_beyond_max(
     assert "dai/uint256-overflow" in str(err.value)
 
 
+# BATCHES
+@pytest.mark.asyncio
+async def test_transfer_many(
+    dai: StarknetContract,
+    user1: StarknetContract,
+    user2: StarknetContract,
+    check_balances,
+):
+    tx = await dai.transfer_many(
+        [user2.contract_address, user1.contract_address, user2.contract_address],
+        [to_split_uint(10), to_split_uint(5), to_split_uint(20)],
+    ).execute(user1.contract_address)
+    for recipient, amount in [(user2, 10), (user1, 5), (user2, 20)]:
+        check_event(
+            dai,
+            "Transfer",
+            tx, (
+                user1.contract_address,
+                recipient.contract_address,
+                to_split_uint(amount)
+            )
+        )
+
+    await check_balances(70, 130)
+
+
+@pytest.mark.asyncio
+async def test_should_not_transfer_many_beyond_balance(
+    dai: StarknetContract,
+    user1: StarknetContract,
+    user2: StarknetContract,
+    check_balances,
+):
+    with pytest.raises(StarkException) as err:
+        await dai.transfer_many(
+            [user2.contract_address, user2.contract_address],
+            [to_split_uint(60), to_split_uint(41)],
+        ).execute(user1.contract_address)
+    assert "dai/insufficient-balance" in str(err.value)
+
+
+@pytest.mark.asyncio
+async def test_should_not_transfer_many_to_zero_or_dai_address(
+    dai: StarknetContract,
+    user1: StarknetContract,
+    user2: StarknetContract,
+):
+    for recipient in [burn, dai.contract_address]:
+        with pytest.raises(StarkException) as err:
+            await dai.transfer_many(
+                [user2.contract_address, recipient],
+                [to_split_uint(10), to_split_uint(10)],
+            ).execute(user1.contract_address)
+        assert "dai/invalid-recipient" in str(err.value)
+
+
+@pytest.mark.asyncio
+async def test_transfer_many_should_check_lengths_and_amounts(
+    dai: StarknetContract,
+    user1: StarknetContract,
+    user2: StarknetContract,
+):
+    with pytest.raises(StarkException) as err:
+        await dai.transfer_many(
+            [user2.contract_address, user2.contract_address],
+            [to_split_uint(10)],
+        ).execute(user1.contract_address)
+    assert "dai/length-mismatch" in str(err.value)
+
+    with pytest.raises(StarkException) as err:
+        await dai.transfer_many(
+            [user2.contract_address],
+            [(2**128, 2**128)],
+        ).execute(user1.contract_address)
+    assert "dai/invalid-amount" in str(err.value)
+
+
+@pytest.mark.asyncio
+async def test_mint_many(
+    dai: StarknetContract,
+    auth_user: StarknetContract,
+    user1: StarknetContract,
+    user2: StarknetContract,
+    check_balances,
+):
+    tx = await dai.mint_many(
+        [user1.contract_address, user2.contract_address],
+        [to_split_uint(10), to_split_uint(20)],
+    ).execute(auth_user.contract_address)
+    check_event(dai, "Transfer", tx, (0, user1.contract_address, to_split_uint(10)))
+    check_event(dai, "Transfer", tx, (0, user2.contract_address, to_split_uint(20)))
+
+    await check_balances(110, 120)
+
+
+@pytest.mark.asyncio
+async def test_should_not_allow_mint_many_by_non_ward(
+    dai: StarknetContract,
+    user1: StarknetContract,
+):
+    with pytest.raises(StarkException) as err:
+        await dai.mint_many(
+            [user1.contract_address],
+            [to_split_uint(10)],
+        ).execute(user1.contract_address)
+    assert "dai/not-authorized" in str(err.value)
+
+
+@pytest.mark.asyncio
+async def test_should_not_allow_mint_many_to_zero_or_dai_address(
+    dai: StarknetContract,
+    auth_user: StarknetContract,
+    user1: StarknetContract,
+):
+    for account in [burn, dai.contract_address]:
+        with pytest.raises(StarkException) as err:
+            await dai.mint_many(
+                [user1.contract_address, account],
+                [to_split_uint(10), to_split_uint(10)],
+            ).execute(auth_user.contract_address)
+        assert "dai/invalid-recipient" in str(err.value)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("size", [10, 100, pytest.param(1000, marks=pytest.mark.slow)])
+async def test_transfer_many_steps_per_transfer(
+    dai: StarknetContract,
+    auth_user: StarknetContract,
+    user1: StarknetContract,
+    user2: StarknetContract,
+    size: int,
+):
+    await dai.mint(
+        user1.contract_address, to_split_uint(size)).execute(auth_user.contract_address)
+    single = get_resources(await dai.transfer(
+        user2.contract_address, to_split_uint(1)).execute(user1.contract_address))
+
+    recipients = [FIRST_RECIPIENT + i for i in range(size)]
+    tx = await dai.transfer_many(
+        recipients, [to_split_uint(1)] * size).execute(user1.contract_address)
+    batch = get_resources(tx)
+
+    per_transfer = batch.steps / size
+    assert per_transfer < single.steps
+
+    balance = await dai.balanceOf(recipients[-1]).call()
+    assert balance.result == (to_split_uint(1),)
+
+
 @pytest.mark.asyncio
 async def test_burn(
     dai: StarknetContract,
@@ -275,6 +435,88 @@ async def test_deployer_should_not_be_able_to_burn(
     assert "dai/insufficient-allowance" in str(err.value)
 
 
+@pytest.mark.asyncio
+async def test_try_burn(
+    dai: StarknetContract,
+    user1: StarknetContract,
+    check_balances,
+):
+    tx = await dai.try_burn(
+        user1.contract_address,
+        to_split_uint(10),
+    ).execute(user1.contract_address)
+    assert tx.result == (BURNED,)
+    check_event(dai, "Transfer", tx, (user1.contract_address, 0, to_split_uint(10)))
+
+    await check_balances(90, 100)
+
+
+@pytest.mark.asyncio
+async def test_try_burn_beyond_balance(
+    dai: StarknetContract,
+    user1: StarknetContract,
+    check_balances,
+):
+    tx = await dai.try_burn(
+        user1.contract_address,
+        to_split_uint(101),
+    ).execute(user1.contract_address)
+    assert tx.result == (INSUFFICIENT_BALANCE,)
+    assert tx.main_call_events == []
+
+    await check_balances(100, 100)
+
+
+@pytest.mark.asyncio
+@pytest.mark.checkpoint("after_user2_approve_10")
+async def test_try_burn_other(
+    dai: StarknetContract,
+    user1: StarknetContract,
+    user2: StarknetContract,
+    user3: StarknetContract,
+    check_balances,
+):
+    tx = await dai.try_burn(
+        user1.contract_address,
+        to_split_uint(11),
+    ).execute(user2.contract_address)
+    assert tx.result == (INSUFFICIENT_ALLOWANCE,)
+
+    tx = await dai.try_burn(
+        user1.contract_address,
+        to_split_uint(1),
+    ).execute(user3.contract_address)
+    assert tx.result == (INSUFFICIENT_ALLOWANCE,)
+
+    await check_balances(100, 100)
+
+    tx = await dai.try_burn(
+        user1.contract_address,
+        to_split_uint(10),
+    ).execute(user2.contract_address)
+    assert tx.result == (BURNED,)
+
+    allowance = await dai.allowance(
+        user1.contract_address,
+        user2.contract_address).call()
+    assert allowance.result == (to_split_uint(0),)
+
+    await check_balances(90, 100)
+
+
+@pytest.mark.asyncio
+async def test_try_burn_should_not_accept_invalid_amount(
+    dai: StarknetContract,
+    user1: StarknetContract,
+):
+    with pytest.raises(StarkException) as err:
+        await dai.try_burn(
+            user1.contract_address,
+            (2**128, 2**128),
+        ).execute(user1.contract_address)
+    assert "dai/invalid-amount" in str(err.value)
+
+
 @pytest.mark.asyncio
 async def test_approve(
     dai: StarknetContract,
@@ -302,16 +544,13 @@ async def test_approve(
 
 
 @pytest.mark.asyncio
+@pytest.mark.checkpoint("after_user2_approve_10")
 async def test_can_burn_other_if_approved(
     dai: StarknetContract,
     user1: StarknetContract,
     user2: StarknetContract,
     check_balances,
 ):
-    await dai.approve(
-            user2.contract_address,
-            to_split_uint(10)).execute(user1.contract_address)
-
     tx = await dai.burn(
             user1.contract_address,
             to_split_uint(10)).execute(user2.contract_address)
@@ -342,6 +581,209 @@ async def test_approve_should_not_accept_invalid_amount(
     assert "dai/invalid-amount" in str(err.value)
 
 
+# PERMIT
+@pytest.mark.asyncio
+async def test_permit(
+    starknet: Starknet,
+    dai: StarknetContract,
+    user1: StarknetContract,
+    user2: StarknetContract,
+    user3: StarknetContract,
+    signers,
+    block_timestamp,
+):
+    deadline = block_timestamp() + 3600
+    signature = sign_permit(
+        starknet, signers["user1"], dai,
+        user1.contract_address, user2.contract_address, 10, 0, deadline)
+
+    # anyone can submit the permit
+    tx = await dai.permit(
+        user1.contract_address,
+        user2.contract_address,
+        to_split_uint(10),
+        0,
+        deadline,
+        signature,
+    ).execute(user3.contract_address)
+    check_event(
+        dai,
+        "Approval",
+        tx, (
+            user1.contract_address,
+            user2.contract_address,
+            to_split_uint(10)
+        )
+    )
+
+    allowance = await dai.allowance(
+        user1.contract_address,
+        user2.contract_address).call()
+    assert allowance.result == (to_split_uint(10),)
+
+    nonce = await dai.nonces(user1.contract_address).call()
+    assert nonce.result == (1,)
+
+
+# An account contract answering every signature check with is_valid = 0
+# instead of reverting.
+REJECTING_ACCOUNT = """
+%lang starknet
+
+@view
+func is_valid_signature(hash: felt, signature_len: felt, signature: felt*) -> (is_valid: felt) {
+    return (is_valid=0);
+}
+"""
+
+
+@pytest.mark.asyncio
+async def test_permit_should_not_accept_invalid_signature_result(
+    starknet: Starknet,
+    dai: StarknetContract,
+    user2: StarknetContract,
+    signers,
+    block_timestamp,
+):
+    from starkware.starknet.compiler.compile import compile_starknet_codes
+
+    account = await starknet.deploy(
+        contract_class=compile_starknet_codes([(REJECTING_ACCOUNT, "rejecting_account.cairo")]))
+    deadline = block_timestamp() + 3600
+    signature = sign_permit(
+        starknet, signers["user1"], dai,
+        account.contract_address, user2.contract_address, 10, 0, deadline)
+
+    with pytest.raises(StarkException) as err:
+        await dai.permit(
+            account.contract_address,
+            user2.contract_address,
+            to_split_uint(10),
+            0,
+            deadline,
+            signature,
+        ).execute(user2.contract_address)
+    assert "dai/invalid-permit" in str(err.value)
+
+
+@pytest.mark.asyncio
+async def test_permit_keeps_invariants(
+    starknet: Starknet,
+    dai: StarknetContract,
+    l2_teleport_gateway: StarknetContract,
+    user1: StarknetContract,
+    user2: StarknetContract,
+    signers,
+    block_timestamp,
+):
+    deadline = block_timestamp() + 3600
+    with invariants.checking(starknet.state, dai.contract_address, l2_teleport_gateway.contract_address):
+        for nonce in range(2):
+            signature = sign_permit(
+                starknet, signers["user1"], dai,
+                user1.contract_address, user2.contract_address, 10, nonce, deadline)
+            await dai.permit(
+                user1.contract_address,
+                user2.contract_address,
+                to_split_uint(10),
+                nonce,
+                deadline,
+                signature,
+            ).execute(user2.contract_address)
+
+
+@pytest.mark.asyncio
+async def test_permit_should_not_be_replayed(
+    starknet: Starknet,
+    dai: StarknetContract,
+    user1: StarknetContract,
+    user2: StarknetContract,
+    signers,
+    block_timestamp,
+):
+    deadline = block_timestamp() + 3600
+    signature = sign_permit(
+        starknet, signers["user1"], dai,
+        user1.contract_address, user2.contract_address, 10, 0, deadline)
+    permit = dai.permit(
+        user1.contract_address, user2.contract_address, to_split_uint(10), 0, deadline, signature)
+
+    await permit.execute(user2.contract_address)
+    with pytest.raises(StarkException) as err:
+        await permit.execute(user2.contract_address)
+    assert "dai/invalid-nonce" in str(err.value)
+
+
+@pytest.mark.asyncio
+async def test_permit_should_not_be_used_after_deadline(
+    ctx,
+    starknet: Starknet,
+    dai: StarknetContract,
+    user1: StarknetContract,
+    user2: StarknetContract,
+    signers,
+    block_timestamp,
+):
+    deadline = block_timestamp() + 3600
+    signature = sign_permit(
+        starknet, signers["user1"], dai,
+        user1.contract_address, user2.contract_address, 10, 0, deadline)
+
+    ctx.advance_clock(3601)
+
+    with pytest.raises(StarkException) as err:
+        await dai.permit(
+            user1.contract_address,
+            user2.contract_address,
+            to_split_uint(10),
+            0,
+            deadline,
+            signature,
+        ).execute(user2.contract_address)
+    assert "dai/permit-expired" in str(err.value)
+
+
+@pytest.mark.asyncio
+async def test_permit_should_not_accept_other_signer(
+    starknet: Starknet,
+    dai: StarknetContract,
+    user1: StarknetContract,
+    user2: StarknetContract,
+    signers,
+    block_timestamp,
+):
+    deadline = block_timestamp() + 3600
+    signature = sign_permit(
+        starknet, signers["auth_user"], dai,
+        user1.contract_address, user2.contract_address, 10, 0, deadline)
+
+    with pytest.raises(StarkException) as err:
+        await dai.permit(
+            user1.contract_address,
+            user2.contract_address,
+            to_split_uint(10),
+            0,
+            deadline,
+            signature,
+        ).execute(user2.contract_address)
+    assert "dai/invalid-permit" in str(err.value)
+
+    # the signed amount can't be changed
+    signature = sign_permit(
+        starknet, signers["user1"], dai,
+        user1.contract_address, user2.contract_address, 10, 0, deadline)
+    with pytest.raises(StarkException) as err:
+        await dai.permit(
+            user1.contract_address,
+            user2.contract_address,
+            to_split_uint(11),
+            0,
+            deadline,
+            signature,
+        ).execute(user2.contract_address)
+    assert "dai/invalid-permit" in str(err.value)
+
+
 @pytest.mark.asyncio
 async def test_decrease_allowance_should_not_accept_invalid_amount(
     dai: StarknetContract,
@@ -448,16 +890,13 @@ async def test_should_not_transfer_beyond_allowance(
 
 
 @pytest.mark.asyncio
+@pytest.mark.checkpoint("after_user2_approve_10")
 async def test_burn_using_burn_and_allowance(
     dai: StarknetContract,
     user1: StarknetContract,
     user2: StarknetContract,
     check_balances,
 ):
-    await dai.approve(
-            user2.contract_address,
-            to_split_uint(10)).execute(user1.contract_address)
-
     tx = await dai.burn(
             user1.contract_address,
             to_split_uint(10)).execute(user2.contract_address)
@@ -475,15 +914,12 @@ async def test_burn_using_burn_and_allowance(
 
 
 @pytest.mark.asyncio
+@pytest.mark.checkpoint("after_user2_approve_10")
 async def test_should_not_burn_beyond_allowance(
     dai: StarknetContract,
     user1: StarknetContract,
     user2: StarknetContract,
 ):
-    await dai.approve(
-            user2.contract_address,
-            to_split_uint(10)).execute(user1.contract_address)
-
     allowance = await dai.allowance(
         user1.contract_address,
         user2.contract_address).call()
@@ -497,14 +933,12 @@ async def test_should_not_burn_beyond_allowance(
 
 
 @pytest.mark.asyncio
+@pytest.mark.checkpoint("after_user2_approve_10")
 async def test_increase_allowance(
     dai: StarknetContract,
     user1: StarknetContract,
     user2: StarknetContract,
 ):
-    await dai.approve(
-            user2.contract_address,
-            to_split_uint(10)).execute(user1.contract_address)
     await dai.increaseAllowance(
             user2.contract_address,
             to_split_uint(10)).execute(user1.contract_address)
@@ -516,14 +950,12 @@ async def test_increase_allowance(
 
 
 @pytest.mark.asyncio
+@pytest.mark.checkpoint("after_user2_approve_10")
 async def test_should_not_increase_allowance_beyond_max(
     dai: StarknetContract,
     user1: StarknetContract,
     user2: StarknetContract,
 ):
-    await dai.approve(
-            user2.contract_address,
-            to_split_uint(10)).execute(user1.contract_address)
     with pytest.raises(StarkException) as err:
         await dai.increaseAllowance(
                 user2.contract_address, MAX).execute(user1.contract_address)
@@ -531,14 +963,12 @@ async def test_should_not_increase_allowance_beyond_max(
 
 
 @pytest.mark.asyncio
+@pytest.mark.checkpoint("after_user2_approve_10")
 async def test_decrease_allowance(
     dai: StarknetContract,
     user1: StarknetContract,
     user2: StarknetContract,
 ):
-    await dai.approve(
-            user2.contract_address,
-            to_split_uint(10)).execute(user1.contract_address)
     await dai.decreaseAllowance(
             user2.contract_address,
             to_split_uint(1)).execute(user1.contract_address)
@@ -550,15 +980,12 @@ async def test_decrease_allowance(
 
 
 @pytest.mark.asyncio
+@pytest.mark.checkpoint("after_user2_approve_10")
 async def test_should_not_decrease_allowance_beyond_allowance(
     dai: StarknetContract,
     user1: StarknetContract,
     user2: StarknetContract,
 ):
-    await dai.approve(
-            user2.contract_address,
-            to_split_uint(10)).execute(user1.contract_address)
-
     allowance = await dai.allowance(
         user1.contract_address,
         user2.contract_address).call()
@@ -646,3 +1073,31 @@ async def test_has_metadata(
 
     decimals = await dai.decimals().call()
     assert decimals.result == (18,)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("seed", range(4))
+async def test_matches_reference_model(
+    dai: StarknetContract,
+    user1: StarknetContract,
+    user2: StarknetContract,
+    user3: StarknetContract,
+    auth_user: StarknetContract,
+    seed: int,
+):
+    names = dict(
+        user1=user1.contract_address,
+        user2=user2.contract_address,
+        user3=user3.contract_address,
+        auth_user=auth_user.contract_address,
+    )
+    fuzzer = DaiFuzzer(dai, names.values())
+    failure = await fuzzer.fuzz(seed, length=40)
+    if failure is not None:
+        ops, divergence = failure
+        names = {address: name for name, address in names.items()}
+        pytest.fail(
+            f"dai diverged from the model at step {divergence.step}:\n"
+            f"{format_ops(ops, names)}\n"
+            f"expected {divergence.expected}\nactual {divergence.actual}"
+        )
@@ -0,0 +1,337 @@
+"""Differential fuzzing of dai.cairo against a Python reference model.
+
+`DaiModel` implements the Uint256 balances, allowances and wards of
+dai.cairo, including the order in which the contract checks its arguments,
+so a call either reverts with the same `dai/...` reason on both or succeeds
+on both with the same result and state.
+
+`DaiFuzzer` generates random sequences of calls from a seed, runs them on a
+copy of a state with a deployed DAI and on the model, and compares them
+after every call. A failing sequence is shrunk to a minimal reproduction by
+dropping calls and simplifying amounts for as long as it keeps failing.
+
+Used by `test_matches_reference_model` in dai.py and, for many seeds in
+parallel, by scripts/l2_fuzz_dai.py.
+"""
+
+import functools
+import random
+import re
+from collections import namedtuple
+
+UINT128 = 2**128
+MAX = (UINT128 - 1, UINT128 - 1)
+ERROR_MESSAGE = re.compile(r"Error message: (\S+)")
+
+Op = namedtuple("Op", ["name", "caller", "args"])
+Divergence = namedtuple("Divergence", ["step", "op", "expected", "actual"])
+
+
+class Revert(Exception):
+    pass
+
+
+def _value(amount):
+    low, high = amount
+    return low + high * UINT128
+
+
+def _split(value):
+    return (value % UINT128, value // UINT128)
+
+
+def _check(amount):
+    if amount[0] >= UINT128 or amount[1] >= UINT128:
+        raise Revert("dai/invalid-amount")
+    return _value(amount)
+
+
+class DaiModel:
+    def __init__(self, dai_address, wards=(), balances=None, allowances=None, total_supply=0):
+        self.dai_address = dai_address
+        self.wards = set(wards)
+        self.balances = dict(balances or {})
+        self.allowances = dict(allowances or {})
+        self.total_supply = total_supply
+
+    def copy(self):
+        return DaiModel(self.dai_address, self.wards, self.balances, self.allowances, self.total_supply)
+
+    def storage(self):
+        """Total supply, balances and allowances as stored, i.e. without zeros."""
+        return dict(
+            total_supply=self.total_supply,
+            balances={key: value for key, value in self.balances.items() if value},
+            allowances={key: value for key, value in self.allowances.items() if value},
+        )
+
+    def apply(self, op):
+        """Applies `op` and returns its result, or raises Revert leaving the model unchanged."""
+        model = self.copy()
+        result = getattr(model, op.name)(op.caller, *op.args)
+        self.__dict__.update(model.__dict__)
+        return result
+
+    def _check_recipient(self, recipient):
+        if recipient == 0 or recipient == self.dai_address:
+            raise Revert("dai/invalid-recipient")
+
+    def _spend_allowance(self, owner, spender, amount):
+        if spender == owner:
+            return
+        allowance = self.allowances.get((owner, spender), 0)
+        if allowance == _value(MAX):
+            return
+        if amount > allowance:
+            raise Revert("dai/insufficient-allowance")
+        self.allowances[(owner, spender)] = allowance - amount
+
+    def _transfer(self, sender, recipient, amount):
+        amount = _check(amount)
+        self._check_recipient(recipient)
+        if amount > self.balances.get(sender, 0):
+            raise Revert("dai/insufficient-balance")
+        self.balances[sender] = self.balances.get(sender, 0) - amount
+        balance = self.balances.get(recipient, 0) + amount
+        if balance >= UINT128**2:
+            raise Revert("dai/uint256-overflow")
+        self.balances[recipient] = balance
+        return amount
+
+    def _approve(self, owner, spender, amount):
+        if spender == 0:
+            raise Revert("dai/invalid-recipient")
+        self.allowances[(owner, spender)] = amount
+        return (1,)
+
+    def mint(self, caller, account, amount):
+        if caller not in self.wards:
+            raise Revert("dai/not-authorized")
+        self._check_recipient(account)
+        amount = _check(amount)
+        if self.total_supply + amount >= UINT128**2:
+            raise Revert("dai/uint256-overflow")
+        self.balances[account] = self.balances.get(account, 0) + amount
+        self.total_supply += amount
+        return ()
+
+    def burn(self, caller, account, amount):
+        amount = _check(amount)
+        if amount > self.balances.get(account, 0):
+            raise Revert("dai/insufficient-balance")
+        self.balances[account] = self.balances.get(account, 0) - amount
+        self.total_supply -= amount
+        self._spend_allowance(account, caller, amount)
+        return ()
+
+    def transfer(self, caller, recipient, amount):
+        self._transfer(caller, recipient, amount)
+        return (1,)
+
+    def transferFrom(self, caller, sender, recipient, amount):
+        amount = self._transfer(sender, recipient, amount)
+        self._spend_allowance(sender, caller, amount)
+        return (1,)
+
+    def approve(self, caller, spender, amount):
+        return self._approve(caller, spender, _check(amount))
+
+    def increaseAllowance(self, caller, spender, amount):
+        allowance = _check(amount) + self.allowances.get((caller, spender), 0)
+        if allowance >= UINT128**2:
+            raise Revert("dai/uint256-overflow")
+        return self._approve(caller, spender, allowance)
+
+    def decreaseAllowance(self, caller, spender, amount):
+        amount = _check(amount)
+        allowance = self.allowances.get((caller, spender), 0)
+        if amount > allowance:
+            raise Revert("dai/insufficient-allowance")
+        return self._approve(caller, spender, allowance - amount)
+
+
+def calldata(op):
+    data = []
+    for arg in op.args:
+        data.extend(arg if isinstance(arg, tuple) else (arg,))
+    return data
+
+
+def format_ops(ops, names):
+    def name(value):
+        return names.get(value, hex(value))
+
+    def arg(value):
+        return str(value) if isinstance(value, tuple) else name(value)
+
+    return "\n".join(
+        f"{step}: dai.{op.name}({', '.join(arg(value) for value in op.args)}).execute({name(op.caller)})"
+        for step, op in enumerate(ops)
+    )
+
+
+class DaiFuzzer:
+    """
+    Fuzzes the DAI contract `dai` (a StarknetContract) with calls from
+    `accounts`. Every sequence runs on a copy of `dai.state`, the model is
+    seeded from the storage of that state.
+    """
+
+    OPS = ["mint", "burn", "transfer", "transferFrom", "approve", "increaseAllowance", "decreaseAllowance"]
+
+    def __init__(self, dai, accounts):
+        from starkware.starknet.public.abi import get_storage_var_address
+
+        self.dai = dai
+        self.accounts = list(accounts)
+        self.storage_key = functools.lru_cache(maxsize=None)(get_storage_var_address)
+        self.base_model = None
+
+    async def _read_uint(self, state, key):
+        low = await state.state.get_storage_at(self.dai.contract_address, key)
+        high = await state.state.get_storage_at(self.dai.contract_address, key + 1)
+        return low + high * UINT128
+
+    async def read_model(self, state):
+        """The model of the DAI storage in `state`, as far as `accounts` are concerned."""
+        model = DaiModel(self.dai.contract_address)
+        model.total_supply = await self._read_uint(state, self.storage_key("_total_supply"))
+        for account in self.accounts:
+            if await state.state.get_storage_at(self.dai.contract_address, self.storage_key("_wards", account)):
+                model.wards.add(account)
+            balance = await self._read_uint(state, self.storage_key("_balances", account))
+            if balance:
+                model.balances[account] = balance
+            for spender in self.accounts:
+                allowance = await self._read_uint(state, self.storage_key("_allowances", account, spender))
+                if allowance:
+                    model.allowances[(account, spender)] = allowance
+        return model
+
+    async def _read_base_model(self):
+        if self.base_model is None:
+            self.base_model = await self.read_model(self.dai.state)
+
+    def _amount(self, rng, available):
+        choice = rng.random()
+        if choice < 0.4:
+            return _split(rng.randint(0, available) if available else rng.randint(0, 10))
+        if choice < 0.55:
+            return _split(available)
+        if choice < 0.65:
+            return _split(available + 1)
+        if choice < 0.75:
+            return rng.choice([(0, 0), (1, 0), (UINT128 - 1, 0), (0, 1), MAX])
+        if choice < 0.95:
+            return _split(rng.randrange(UINT128**2))
+        return rng.choice([(UINT128, 0), (0, UINT128)])
+
+    def _recipient(self, rng):
+        if rng.random() < 0.05:
+            return rng.choice([0, self.dai.contract_address])
+        return rng.choice(self.accounts)
+
+    def generate(self, seed, length):
+        """A sequence of `length` calls, biased towards the amounts the model holds."""
+        rng = random.Random(seed)
+        model = self.base_model.copy()
+        ops = []
+        for _ in range(length):
+            name = rng.choice(self.OPS)
+            caller = rng.choice(self.accounts)
+            if name == "mint":
+                if model.wards and rng.random() < 0.9:
+                    caller = rng.choice(sorted(model.wards))
+                op = Op(name, caller, (self._recipient(rng), self._amount(rng, model.total_supply or 100)))
+            elif name == "burn":
+                account = rng.choice([caller, rng.choice(self.accounts)])
+                op = Op(name, caller, (account, self._amount(rng, model.balances.get(account, 0))))
+            elif name == "transfer":
+                op = Op(name, caller, (self._recipient(rng), self._amount(rng, model.balances.get(caller, 0))))
+            elif name == "transferFrom":
+                sender = rng.choice(self.accounts)
+                available = min(model.balances.get(sender, 0), model.allowances.get((sender, caller), 0) or UINT128)
+                op = Op(name, caller, (sender, self._recipient(rng), self._amount(rng, available)))
+            else:
+                spender = 0 if rng.random() < 0.05 else rng.choice(self.accounts)
+                available = model.allowances.get((caller, spender), 0) or model.balances.get(caller, 0)
+                op = Op(name, caller, (spender, self._amount(rng, available)))
+            ops.append(op)
+            try:
+                model.apply(op)
+            except Revert:
+                pass
+        return ops
+
+    async def run(self, ops):
+        """Runs `ops` on a copy of the base state and the model, returns the first Divergence or None."""
+        from starkware.starkware_utils.error_handling import StarkException
+
+        await self._read_base_model()
+        state = self.dai.state.copy()
+        model = self.base_model.copy()
+
+        for step, op in enumerate(ops):
+            try:
+                expected = ("ok", model.apply(op))
+            except Revert as revert:
+                expected = ("revert", str(revert))
+            try:
+                call_info = await state.execute_entry_point_raw(
+                    contract_address=self.dai.contract_address,
+                    selector=op.name,
+                    calldata=calldata(op),
+                    caller_address=op.caller,
+                )
+                actual = ("ok", tuple(call_info.retdata))
+            except StarkException as error:
+                reasons = ERROR_MESSAGE.findall(error.message or "")
+                actual = ("revert", expected[1] if expected[1] in reasons else " / ".join(reasons) or error.message)
+            if actual != expected:
+                return Divergence(step, op, expected, actual)
+
+            if expected[0] == "ok":
+                stored = (await self.read_model(state)).storage()
+                if stored != model.storage():
+                    return Divergence(step, op, model.storage(), stored)
+        return None
+
+    async def _fails(self, ops):
+        return await self.run(ops) is not None
+
+    async def shrink(self, ops):
+        """Drops calls and simplifies amounts of a failing `ops` while it keeps failing."""
+        ops = list(ops)
+        chunk = len(ops) // 2
+        while chunk >= 1:
+            start = 0
+            while start < len(ops):
+                candidate = ops[:start] + ops[start + chunk:]
+                if candidate and await self._fails(candidate):
+                    ops = candidate
+                else:
+                    start += chunk
+            chunk //= 2
+
+        for step in range(len(ops)):
+            op = ops[step]
+            for index, arg in enumerate(op.args):
+                if not isinstance(arg, tuple):
+                    continue
+                for simpler in [(0, 0), (1, 0), _split(_value(arg) // 2)]:
+                    if _value(simpler) >= _value(arg):
+                        continue
+                    args = op.args[:index] + (simpler,) + op.args[index + 1:]
+                    candidate = ops[:step] + [op._replace(args=args)] + ops[step + 1:]
+                    if await self._fails(candidate):
+                        ops, op, arg = candidate, candidate[step], simpler
+        return ops
+
+    async def fuzz(self, seed, length):
+        """Returns None, or the shrunk failing sequence of `seed` and its Divergence."""
+        await self._read_base_model()
+        ops = self.generate(seed, length)
+        if await self.run(ops) is None:
+            return None
+        ops = await self.shrink(ops)
+        return ops, await self.run(ops)
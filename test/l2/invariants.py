@@ -0,0 +1,258 @@
+"""Invariants checked after every transaction (`--check-invariants`).
+
+`CachedState._apply` is where a successful transaction's storage writes
+land in the state it ran against, and `StarknetState.add_messages_and_events`
+is called right after with its execution info. The checker records the old
+and new value of every written cell in the first and checks them in the
+second, so the cost of a check depends on the transaction, not on the
+number of DAI holders.
+
+Storage keys are hashes, written cells are attributed to balances,
+allowances and batches by hashing the addresses and domains that appear in
+the transaction (callers, calldata, event data).
+
+Invariants:
+- DAI total supply equals the sum of the balances. The running sum is
+  seeded from `totalSupply` when the checker is attached and moved by the
+  balance writes of each transaction, every DAI balance write must be
+  attributable to a holder.
+- The DAI batched for a domain (`_batched_dai_to_flush` plus, once the
+  gateway is sharded, `_batched_dai_to_flush_shards` of every shard) moves
+  by exactly the teleported amounts (TeleportInitialized) minus the flushed
+  amounts (Flushed).
+- Balances and allowances are valid Uint256 values and an allowance only
+  grows together with an Approval event for the new value, i.e. it never
+  underflows.
+- The permit nonce of an owner only moves in a `permit` call for that owner,
+  by exactly one.
+"""
+
+import weakref
+from contextlib import contextmanager
+
+from starkware.starknet.business_logic.state.state import CachedState
+from starkware.starknet.public.abi import get_selector_from_name, get_storage_var_address
+from starkware.starknet.testing.state import StarknetState
+
+UINT128 = 2**128
+TELEPORT_INITIALIZED = get_selector_from_name("TeleportInitialized")
+FLUSHED = get_selector_from_name("Flushed")
+APPROVAL = get_selector_from_name("Approval")
+PERMIT = get_selector_from_name("permit")
+
+
+class InvariantViolation(AssertionError):
+    pass
+
+
+def _calls(execution_info):
+    if hasattr(execution_info, "gen_call_iterator"):
+        return list(execution_info.gen_call_iterator())
+    return list(execution_info.gen_call_topology())
+
+
+class InvariantChecker:
+    def __init__(self, starknet_state, dai_address, teleport_gateway_address):
+        self.cached_state = starknet_state.state
+        self.dai = dai_address
+        self.gateway = teleport_gateway_address
+        self.pending = []
+        self._keys = {}
+
+        self.total_supply_key = get_storage_var_address("_total_supply")
+        self.total_supply = self._uint(self.cached_state.cache.storage_view, dai_address, self.total_supply_key)
+        self.balance_sum = self.total_supply
+
+    def _key(self, var_name, *args):
+        key = self._keys.get((var_name, args))
+        if key is None:
+            key = self._keys[(var_name, args)] = get_storage_var_address(var_name, *args)
+        return key
+
+    @staticmethod
+    def _uint(values, address, key):
+        low = values.get((address, key), 0)
+        high = values.get((address, key + 1), 0)
+        if low >= UINT128 or high >= UINT128:
+            raise InvariantViolation(f"invalid Uint256 at {hex(address)}:{hex(key)}: ({low}, {high})")
+        return low + high * UINT128
+
+    def record(self, old_values, writes):
+        self.pending.append((old_values, writes))
+
+    def check(self, execution_info):
+        if not self.pending:
+            return
+        old_values, writes = {}, {}
+        # Keep the oldest old value and the newest write of every cell.
+        for old, new in self.pending:
+            for cell, value in old.items():
+                old_values.setdefault(cell, value)
+            writes.update(new)
+        self.pending = []
+
+        calls = _calls(execution_info)
+        events = execution_info.get_sorted_events()
+        candidates = set()
+        for call in calls:
+            candidates.update([call.caller_address, call.contract_address, *call.calldata])
+        for event in events:
+            candidates.update(event.data)
+
+        dai_cells = {key for address, key in writes if address == self.dai}
+        if dai_cells:
+            self._check_dai(dai_cells, old_values, writes, calls, events, candidates)
+        if any(address == self.gateway for address, _ in writes):
+            self._check_batches(old_values, writes, events, candidates)
+
+    def _check_dai(self, dai_cells, old_values, writes, calls, events, candidates):
+        old, new = old_values, {**old_values, **writes}
+        attributed = set()
+
+        if self.total_supply_key in dai_cells or self.total_supply_key + 1 in dai_cells:
+            self.total_supply = self._uint(new, self.dai, self.total_supply_key)
+            attributed.update([self.total_supply_key, self.total_supply_key + 1])
+
+        for holder in candidates:
+            key = self._key("_balances", holder)
+            if key in dai_cells or key + 1 in dai_cells:
+                self.balance_sum += self._uint(new, self.dai, key) - self._uint(old, self.dai, key)
+                attributed.update([key, key + 1])
+            ward_key = self._key("_wards", holder)
+            if ward_key in dai_cells:
+                attributed.add(ward_key)
+
+        approvals = {
+            (event.data[0], event.data[1]): event.data[2] + event.data[3] * UINT128
+            for event in events
+            if event.from_address == self.dai and event.keys == [APPROVAL]
+        }
+        spenders = {call.caller_address for call in calls if call.contract_address == self.dai}
+        pairs = set(approvals) | {(owner, spender) for owner in candidates for spender in spenders}
+        for owner, spender in pairs:
+            key = self._key("_allowances", owner, spender)
+            if key not in dai_cells and key + 1 not in dai_cells:
+                continue
+            attributed.update([key, key + 1])
+            before = self._uint(old, self.dai, key)
+            after = self._uint(new, self.dai, key)
+            if after > before and approvals.get((owner, spender)) != after:
+                raise InvariantViolation(
+                    f"allowance of {hex(spender)} over {hex(owner)} grew from {before} to {after} "
+                    "without an Approval event (underflow?)"
+                )
+
+        permit_owners = {
+            call.calldata[0]
+            for call in calls
+            if call.contract_address == self.dai and call.entry_point_selector == PERMIT
+        }
+        for owner in permit_owners:
+            key = self._key("_nonces", owner)
+            if key not in dai_cells:
+                continue
+            attributed.add(key)
+            before = old.get((self.dai, key), 0)
+            after = new[(self.dai, key)]
+            if after != before + 1:
+                raise InvariantViolation(
+                    f"permit nonce of {hex(owner)} moved from {before} to {after}, expected {before + 1}"
+                )
+
+        unattributed = dai_cells - attributed
+        if unattributed:
+            raise InvariantViolation(
+                f"dai storage writes not attributable to balances, allowances, wards, permit nonces or the total supply: "
+                f"{sorted(hex(key) for key in unattributed)}"
+            )
+        if self.balance_sum != self.total_supply:
+            raise InvariantViolation(
+                f"dai total supply {self.total_supply} != sum of balances {self.balance_sum}"
+            )
+
+    def _check_batches(self, old_values, writes, events, candidates):
+        old, new = old_values, {**old_values, **writes}
+        teleported, flushed = {}, {}
+        for event in events:
+            if event.from_address != self.gateway:
+                continue
+            if event.keys == [TELEPORT_INITIALIZED]:
+                target_domain, amount = event.data[1], event.data[4]
+                teleported[target_domain] = teleported.get(target_domain, 0) + amount
+            elif event.keys == [FLUSHED]:
+                target_domain = event.data[0]
+                flushed[target_domain] = flushed.get(target_domain, 0) + event.data[1] + event.data[2] * UINT128
+
+        # Sharding is set once, cells of shards that didn't exist before are 0.
+        shards = self.cached_state.cache.storage_view.get((self.gateway, self._key("_shards")), 0)
+        for domain in candidates | set(teleported) | set(flushed):
+            keys = [self._key("_batched_dai_to_flush", domain)]
+            keys += [self._key("_batched_dai_to_flush_shards", domain, shard) for shard in range(shards)]
+            expected = teleported.get(domain, 0) - flushed.get(domain, 0)
+            written = any((self.gateway, key + i) in writes for key in keys for i in range(2))
+            if not written and expected == 0:
+                continue
+            delta = sum(self._uint(new, self.gateway, key) - self._uint(old, self.gateway, key) for key in keys)
+            if delta != expected:
+                raise InvariantViolation(
+                    f"batched dai to flush of domain {hex(domain)} moved by {delta}, "
+                    f"expected {teleported.get(domain, 0)} teleported - {flushed.get(domain, 0)} flushed"
+                )
+
+
+_checkers = weakref.WeakKeyDictionary()
+_original = {}
+
+
+def attach(starknet_state, dai_address, teleport_gateway_address):
+    checker = InvariantChecker(starknet_state, dai_address, teleport_gateway_address)
+    _checkers[starknet_state.state] = checker
+    return checker
+
+
+@contextmanager
+def checking(starknet_state, dai_address, teleport_gateway_address):
+    """
+    Checks the invariants of the transactions run against `starknet_state`
+    inside the block, with or without `--check-invariants`.
+    """
+    installed_here = not _original
+    if installed_here:
+        install()
+    checker = attach(starknet_state, dai_address, teleport_gateway_address)
+    try:
+        yield checker
+    finally:
+        if _checkers.get(starknet_state.state) is checker:
+            del _checkers[starknet_state.state]
+        if installed_here:
+            uninstall()
+
+
+def install():
+    assert not _original, "invariant checks already installed"
+    _original["apply"] = CachedState._apply
+    _original["add_messages_and_events"] = StarknetState.add_messages_and_events
+
+    def _apply(self, parent):
+        checker = _checkers.get(parent)
+        if checker is not None:
+            writes = self.cache._storage_writes
+            view = parent.cache.storage_view
+            checker.record({cell: view.get(cell, 0) for cell in writes}, dict(writes))
+        return _original["apply"](self, parent)
+
+    def add_messages_and_events(self, execution_info):
+        _original["add_messages_and_events"](self, execution_info)
+        checker = _checkers.get(self.state)
+        if checker is not None:
+            checker.check(execution_info)
+
+    CachedState._apply = _apply
+    StarknetState.add_messages_and_events = add_messages_and_events
+
+
+def uninstall():
+    if _original:
+        CachedState._apply = _original.pop("apply")
+        StarknetState.add_messages_and_events = _original.pop("add_messages_and_events")
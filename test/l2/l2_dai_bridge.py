@@ -1,19 +1,31 @@
+from __future__ import annotations
+
 import pytest
+from typing import TYPE_CHECKING
 
-from starkware.starknet.testing.starknet import Starknet
-from starkware.starknet.testing.contract import StarknetContract
 from starkware.starkware_utils.error_handling import StarkException
-from starkware.starknet.definitions.error_codes import StarknetErrorCode
-from conftest import to_split_uint, to_uint
-
-from starkware.starknet.business_logic.execution.objects import Event
-from starkware.starknet.public.abi import get_selector_from_name
-from itertools import chain
+from conftest import to_split_uint, to_uint, check_event, sign_permit
+from codec import Withdrawal, Withdrawals
+from messaging import (
+    BRIDGE,
+    assert_messages,
+    deposit_message,
+    drain_messages,
+    expected_message,
+    inject_messages,
+)
+from measurements import count_calls, get_resources
+
+if TYPE_CHECKING:
+    from starkware.starknet.testing.starknet import Starknet
+    from starkware.starknet.testing.contract import StarknetContract
 
 L1_ADDRESS = 0x1
 INVALID_L1_ADDRESS = 0x10000000000000000000000000000000000000000
 L1_BRIDGE_ADDRESS = 0x1
+INVALID_L1_BRIDGE_ADDRESS = 0x2
 FINALIZE_WITHDRAW = 0
+MAX_WITHDRAWALS_PER_FLUSH = 100
 ECDSA_PUBLIC_KEY = 0
 
 burn = 0
@@ -22,22 +34,11 @@ no_funds = 1
 starknet_contract_address = 0x0
 
 
-###########
-# HELPERS #
-###########
-
-def check_event(contract, event_name, tx, values):
-    expected_event = Event(
-        from_address=contract.contract_address,
-        keys=[get_selector_from_name(event_name)],
-        data=list(chain(*[e if isinstance(e, tuple) else [e] for e in values]))
-    )
-    assert expected_event in ( tx.raw_events if hasattr(tx, 'raw_events') else tx.get_sorted_events())
-
 #########
 # TESTS #
 #########
 @pytest.mark.asyncio
+@pytest.mark.checkpoint("after_bridge_approve_10")
 async def test_initiate_withdraw(
     starknet: Starknet,
     dai: StarknetContract,
@@ -45,11 +46,6 @@ async def test_initiate_withdraw(
     user1: StarknetContract,
     check_balances,
 ):
-    await dai.approve(
-            l2_bridge.contract_address,
-            to_split_uint(10),
-        ).execute(user1.contract_address)
-
     tx = await l2_bridge.initiate_withdraw(
             L1_ADDRESS,
             to_split_uint(10)).execute(user1.contract_address)
@@ -74,6 +70,178 @@ async def test_initiate_withdraw(
     await check_balances(90, 100)
 
 
+@pytest.mark.asyncio
+async def test_initiate_withdraw_with_permit(
+    starknet: Starknet,
+    dai: StarknetContract,
+    l2_bridge: StarknetContract,
+    user1: StarknetContract,
+    user2: StarknetContract,
+    signers,
+    block_timestamp,
+    check_balances,
+):
+    # user1 signs the allowance of the bridge off-chain, anyone submits it,
+    # and user1 only sends initiate_withdraw.
+    deadline = block_timestamp() + 3600
+    signature = sign_permit(
+        starknet, signers["user1"], dai,
+        user1.contract_address, l2_bridge.contract_address, 10, 0, deadline)
+    await dai.permit(
+        user1.contract_address,
+        l2_bridge.contract_address,
+        to_split_uint(10),
+        0,
+        deadline,
+        signature,
+    ).execute(user2.contract_address)
+
+    await l2_bridge.initiate_withdraw(
+            L1_ADDRESS,
+            to_split_uint(10)).execute(user1.contract_address)
+
+    payload = [FINALIZE_WITHDRAW, L1_ADDRESS, *to_split_uint(10)]
+    starknet.consume_message_from_l2(
+        from_address=l2_bridge.contract_address,
+        to_address=L1_BRIDGE_ADDRESS,
+        payload=payload,
+    )
+
+    await check_balances(90, 100)
+
+
+@pytest.mark.asyncio
+@pytest.mark.checkpoint("after_bridge_approve_10")
+async def test_drain_withdrawals(
+    starknet: Starknet,
+    l2_bridge: StarknetContract,
+    user1: StarknetContract,
+    check_balances,
+):
+    for _ in range(10):
+        await l2_bridge.initiate_withdraw(
+                L1_ADDRESS,
+                to_split_uint(1)).execute(user1.contract_address)
+
+    senders = {l2_bridge.contract_address: BRIDGE}
+    drained = drain_messages(starknet, senders)
+    assert_messages(drained, [
+        expected_message(l2_bridge.contract_address, L1_BRIDGE_ADDRESS, Withdrawal(L1_ADDRESS, 1))
+    ] * 10)
+    assert drain_messages(starknet, senders) == []
+
+    await check_balances(90, 100)
+
+
+@pytest.mark.asyncio
+@pytest.mark.checkpoint("after_bridge_approve_10")
+async def test_queue_and_flush_withdrawals(
+    starknet: Starknet,
+    l2_bridge: StarknetContract,
+    user1: StarknetContract,
+    user2: StarknetContract,
+    check_balances,
+):
+    withdrawals = [Withdrawal(L1_ADDRESS + i, i + 1) for i in range(4)]
+    for index, withdrawal in enumerate(withdrawals):
+        tx = await l2_bridge.queue_withdraw(
+                withdrawal.l1_recipient,
+                to_split_uint(withdrawal.amount)).execute(user1.contract_address)
+        check_event(
+            l2_bridge,
+            "withdraw_queued",
+            tx, (
+                withdrawal.l1_recipient,
+                to_split_uint(withdrawal.amount),
+                user1.contract_address,
+                index
+            )
+        )
+    await check_balances(90, 100)
+    bounds = await l2_bridge.withdrawal_queue_bounds().call()
+    assert bounds.result == (0, 4)
+
+    senders = {l2_bridge.contract_address: BRIDGE}
+    assert drain_messages(starknet, senders) == []
+
+    # oldest first, at most max_count of them
+    tx = await l2_bridge.flush_withdrawals(3).execute(user2.contract_address)
+    check_event(l2_bridge, "withdrawals_flushed", tx, (0, 3))
+    tx = await l2_bridge.flush_withdrawals(3).execute(user2.contract_address)
+    check_event(l2_bridge, "withdrawals_flushed", tx, (3, 1))
+
+    drained = drain_messages(starknet, senders)
+    assert [message.record for message in drained] == [
+        Withdrawals(0, tuple(withdrawals[:3])),
+        Withdrawals(3, tuple(withdrawals[3:])),
+    ]
+    assert_messages(drained, [
+        expected_message(l2_bridge.contract_address, L1_BRIDGE_ADDRESS, Withdrawals(0, tuple(withdrawals[:3]))),
+        expected_message(l2_bridge.contract_address, L1_BRIDGE_ADDRESS, Withdrawals(3, tuple(withdrawals[3:]))),
+    ])
+
+    bounds = await l2_bridge.withdrawal_queue_bounds().call()
+    assert bounds.result == (4, 4)
+    queued = await l2_bridge.withdrawal_queue(0).call()
+    assert queued.result == ((0, (0, 0)),)
+
+
+@pytest.mark.asyncio
+@pytest.mark.checkpoint("after_bridge_approve_10")
+async def test_flush_withdrawals_reverts(
+    l2_bridge: StarknetContract,
+    auth_user: StarknetContract,
+    user1: StarknetContract,
+):
+    with pytest.raises(StarkException) as err:
+        await l2_bridge.flush_withdrawals(10).execute(user1.contract_address)
+    assert "l2_dai_bridge/queue-empty" in str(err.value)
+
+    with pytest.raises(StarkException) as err:
+        await l2_bridge.queue_withdraw(
+                INVALID_L1_ADDRESS,
+                to_split_uint(1)).execute(user1.contract_address)
+    assert "l2_dai_bridge/invalid-l1-address" in str(err.value)
+
+    await l2_bridge.queue_withdraw(L1_ADDRESS, to_split_uint(1)).execute(user1.contract_address)
+    with pytest.raises(StarkException) as err:
+        await l2_bridge.flush_withdrawals(0).execute(user1.contract_address)
+    assert "l2_dai_bridge/invalid-count" in str(err.value)
+
+    await l2_bridge.close().execute(auth_user.contract_address)
+    with pytest.raises(StarkException) as err:
+        await l2_bridge.queue_withdraw(L1_ADDRESS, to_split_uint(1)).execute(user1.contract_address)
+    assert "l2_dai_bridge/bridge-closed" in str(err.value)
+    # queued withdrawals can still be flushed
+    await l2_bridge.flush_withdrawals(10).execute(user1.contract_address)
+
+
+@pytest.mark.asyncio
+async def test_flush_withdrawals_caps_batches(
+    starknet: Starknet,
+    dai: StarknetContract,
+    l2_bridge: StarknetContract,
+    auth_user: StarknetContract,
+    user1: StarknetContract,
+):
+    count = 2 * MAX_WITHDRAWALS_PER_FLUSH + 50
+    await dai.mint(user1.contract_address, to_split_uint(count)).execute(auth_user.contract_address)
+    await dai.approve(l2_bridge.contract_address, to_split_uint(count)).execute(user1.contract_address)
+    for _ in range(count):
+        await l2_bridge.queue_withdraw(L1_ADDRESS, to_split_uint(1)).execute(user1.contract_address)
+
+    while True:
+        bounds = await l2_bridge.withdrawal_queue_bounds().call()
+        if bounds.result.head == bounds.result.tail:
+            break
+        await l2_bridge.flush_withdrawals(1000).execute(user1.contract_address)
+
+    drained = drain_messages(starknet, {l2_bridge.contract_address: BRIDGE})
+    assert [len(message.record.withdrawals) for message in drained] == [
+        MAX_WITHDRAWALS_PER_FLUSH, MAX_WITHDRAWALS_PER_FLUSH, 50,
+    ]
+
+
 @pytest.mark.asyncio
 async def test_close_should_fail_when_not_authorized(
     l2_bridge: StarknetContract,
@@ -85,6 +253,7 @@ async def test_close_should_fail_when_not_authorized(
 
 
 @pytest.mark.asyncio
+@pytest.mark.checkpoint("after_bridge_approve_10")
 async def test_initiate_withdraw_should_fail_when_closed(
     starknet: Starknet,
     dai: StarknetContract,
@@ -93,11 +262,6 @@ async def test_initiate_withdraw_should_fail_when_closed(
     user1: StarknetContract,
     user2: StarknetContract,
 ):
-    await dai.approve(
-            l2_bridge.contract_address,
-            to_split_uint(10),
-        ).execute(user1.contract_address)
-
     await l2_bridge.close().execute(auth_user.contract_address)
 
     with pytest.raises(StarkException) as err:
@@ -137,6 +301,7 @@ async def test_initiate_withdraw_insufficient_funds(
 
 
 @pytest.mark.asyncio
+@pytest.mark.checkpoint("after_bridge_approve_10")
 async def test_withdraw_invalid_l1_address(
     starknet: Starknet,
     dai: StarknetContract,
@@ -144,10 +309,6 @@ async def test_withdraw_invalid_l1_address(
     user1: StarknetContract,
     check_balances,
 ):
-    await dai.approve(
-            l2_bridge.contract_address,
-            to_split_uint(10),
-        ).execute(user1.contract_address)
     with pytest.raises(StarkException) as err:
         await l2_bridge.initiate_withdraw(
                 INVALID_L1_ADDRESS,
@@ -191,6 +352,33 @@ async def test_handle_deposit(
 
 
 @pytest.mark.asyncio
+async def test_inject_deposits(
+    starknet: Starknet,
+    l2_bridge: StarknetContract,
+    user1: StarknetContract,
+    user2: StarknetContract,
+    check_balances,
+):
+    messages = [
+        deposit_message(L1_BRIDGE_ADDRESS, l2_bridge.contract_address, user.contract_address, 1, L1_ADDRESS)
+        for user in [user1, user2] * 25
+    ]
+    messages.insert(10, deposit_message(
+        INVALID_L1_BRIDGE_ADDRESS, l2_bridge.contract_address, user1.contract_address, 1, L1_ADDRESS))
+
+    report = await inject_messages(starknet, messages, keep_results=True)
+
+    assert report.count == 51
+    assert [failure.index for failure in report.failures] == [10]
+    assert "l2_dai_bridge/message-not-from-bridge" in report.failures[0].error.message
+    assert report.results[10] is None
+    assert sum(result is not None for result in report.results) == 50
+
+    await check_balances(125, 125)
+
+
+@pytest.mark.asyncio
+@pytest.mark.checkpoint("after_bridge_approve_10")
 async def test_handle_force_withdrawal(
     starknet: Starknet,
     dai: StarknetContract,
@@ -198,11 +386,6 @@ async def test_handle_force_withdrawal(
     user1: StarknetContract,
     check_balances,
 ):
-    await dai.approve(
-            l2_bridge.contract_address,
-            to_split_uint(10),
-        ).execute(user1.contract_address)
-
     tx = await starknet.send_message_to_l2(
         from_address=L1_BRIDGE_ADDRESS,
         to_address=l2_bridge.contract_address,
@@ -304,18 +487,45 @@ async def test_handle_force_withdrawal_insufficient_allowance(
 
 
 @pytest.mark.asyncio
-async def test_handle_force_withdrawal_invalid_l1_address(
+@pytest.mark.checkpoint("after_bridge_approve_10")
+async def test_handle_force_withdrawal_calls_dai_once(
     starknet: Starknet,
     dai: StarknetContract,
     l2_bridge: StarknetContract,
     user1: StarknetContract,
+    user3: StarknetContract,
     check_balances,
 ):
-    await dai.approve(
-            l2_bridge.contract_address,
-            to_split_uint(10),
-        ).execute(user1.contract_address)
+    # The DAI checks and the burn are a single try_burn call, whether the
+    # burn happens or not.
+    for user, l1_messages in [(user1, 1), (user3, 0)]:
+        tx = await starknet.send_message_to_l2(
+            from_address=L1_BRIDGE_ADDRESS,
+            to_address=l2_bridge.contract_address,
+            selector="handle_force_withdrawal",
+            payload=[
+                user.contract_address,
+                int(L1_ADDRESS),
+                *to_split_uint(10)
+            ],
+        )
+        assert get_resources(tx).l1_messages == l1_messages
+        assert count_calls(tx, dai.contract_address) == 1
+        # the registry and DAI
+        assert count_calls(tx) == 2
 
+    await check_balances(90, 100)
+
+
+@pytest.mark.asyncio
+@pytest.mark.checkpoint("after_bridge_approve_10")
+async def test_handle_force_withdrawal_invalid_l1_address(
+    starknet: Starknet,
+    dai: StarknetContract,
+    l2_bridge: StarknetContract,
+    user1: StarknetContract,
+    check_balances,
+):
     tx = await starknet.send_message_to_l2(
         from_address=L1_BRIDGE_ADDRESS,
         to_address=l2_bridge.contract_address,
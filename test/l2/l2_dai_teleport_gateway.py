@@ -1,16 +1,23 @@
-import os
+from __future__ import annotations
+
 import pytest
-import asyncio
+from typing import TYPE_CHECKING
 
-from starkware.starknet.testing.starknet import Starknet
-from starkware.starknet.testing.contract import StarknetContract
 from starkware.starkware_utils.error_handling import StarkException
 from starkware.starknet.public.abi import get_selector_from_name
-from starkware.crypto.signature.fast_pedersen_hash import pedersen_hash
 from conftest import to_split_uint, to_uint, check_event, VALID_DOMAINS
-from starkware.starknet.business_logic.execution.objects import Event
-from itertools import chain
-import pprint
+from codec import (
+    FinalizeFlush, FinalizeFlushMany, FinalizeRegisterTeleport, FinalizeRegisterTeleports, TeleportGUID,
+)
+from measurements import (
+    get_resources, live_cells, measure, storage_snapshot, write_conflicts, written_cells,
+)
+from messaging import TELEPORT_GATEWAY, assert_messages, drain_messages, expected_message
+import invariants
+
+if TYPE_CHECKING:
+    from starkware.starknet.testing.starknet import Starknet
+    from starkware.starknet.testing.contract import StarknetContract
 
 L1_ADDRESS = 0x1
 INVALID_L1_ADDRESS = 0x10000000000000000000000000000000000000000
@@ -18,6 +25,7 @@ L1_TELEPORT_BRIDGE_ADDRESS = 0x1
 DOMAIN = get_selector_from_name("starknet")
 TARGET_DOMAIN = get_selector_from_name("optimism")
 INVALID_DOMAIN = get_selector_from_name("invalid_domain")
+OTHER_DOMAIN = get_selector_from_name("arbitrum")
 TELEPORT_AMOUNT = 10
 FINALIZE_REGISTER_TELEPORT = 0
 FINALIZE_FLUSH = 1
@@ -115,6 +123,7 @@ async def test_file_reverts_when_not_called_by_owner(
 
 ## initiateTeleport()
 @pytest.mark.asyncio
+@pytest.mark.checkpoint("after_gateway_approve_10")
 async def test_burns_dai_marks_it_for_future_flush(
     starknet: Starknet,
     l2_teleport_gateway: StarknetContract,
@@ -123,7 +132,6 @@ async def test_burns_dai_marks_it_for_future_flush(
     check_balances,
     block_timestamp
 ):
-    await dai.approve(l2_teleport_gateway.contract_address, to_split_uint(TELEPORT_AMOUNT)).execute(user1.contract_address)
     tx = await l2_teleport_gateway.initiate_teleport(
             TARGET_DOMAIN,
             user1.contract_address,
@@ -215,6 +223,7 @@ async def test_nonce_management(
 
 
 @pytest.mark.asyncio
+@pytest.mark.checkpoint("after_gateway_approve_10")
 async def test_sends_xchain_message_burns_dai_marks_it_for_future_flush(
     starknet: Starknet,
     l2_teleport_gateway: StarknetContract,
@@ -223,7 +232,6 @@ async def test_sends_xchain_message_burns_dai_marks_it_for_future_flush(
     check_balances,
     block_timestamp
 ):
-    await dai.approve(l2_teleport_gateway.contract_address, to_split_uint(TELEPORT_AMOUNT)).execute(user1.contract_address)
     tx = await l2_teleport_gateway.initiate_teleport(
             TARGET_DOMAIN,
             user1.contract_address,
@@ -336,28 +344,20 @@ async def test_reverts_when_gateway_is_closed(
 
 
 @pytest.mark.asyncio
+@pytest.mark.checkpoint("after_one_teleport")
 async def test_allows_to_finalize_when_closed(
     l2_teleport_gateway: StarknetContract,
-    dai: StarknetContract,
     user1: StarknetContract,
     auth_user: StarknetContract,
+    checkpoint,
     block_timestamp
 ):
-    await dai.approve(l2_teleport_gateway.contract_address, to_split_uint(TELEPORT_AMOUNT)).execute(user1.contract_address)
-
-
-    tx = await l2_teleport_gateway.initiate_teleport(
-            TARGET_DOMAIN,
-            user1.contract_address,
-            TELEPORT_AMOUNT,
-            user1.contract_address).execute(user1.contract_address)
-
     timestamp = block_timestamp()
 
     check_event(
         l2_teleport_gateway,
         "TeleportInitialized",
-        tx, (
+        checkpoint.teleport_tx, (
             DOMAIN,
             TARGET_DOMAIN,
             user1.contract_address,
@@ -394,6 +394,323 @@ async def test_reverts_when_domain_is_not_whitelisted(
     assert "l2_dai_teleport_gateway/invalid-domain" in str(err.value)
 
 
+## initiate_teleports()
+@pytest.mark.asyncio
+async def test_initiates_a_batch_of_teleports(
+    l2_teleport_gateway: StarknetContract,
+    dai: StarknetContract,
+    auth_user: StarknetContract,
+    user1: StarknetContract,
+    user2: StarknetContract,
+    check_balances,
+    block_timestamp
+):
+    await l2_teleport_gateway.file(
+            VALID_DOMAINS, OTHER_DOMAIN, 1).execute(auth_user.contract_address)
+    await dai.approve(l2_teleport_gateway.contract_address, to_split_uint(15)).execute(user1.contract_address)
+    requests = [
+        (TARGET_DOMAIN, user2.contract_address, 1, user1.contract_address),
+        (TARGET_DOMAIN, user2.contract_address, 2, user1.contract_address),
+        (OTHER_DOMAIN, user1.contract_address, 3, user2.contract_address),
+        (TARGET_DOMAIN, user2.contract_address, 4, user1.contract_address),
+        (OTHER_DOMAIN, user1.contract_address, 5, user2.contract_address),
+    ]
+    tx = await l2_teleport_gateway.initiate_teleports(requests).execute(user1.contract_address)
+
+    for nonce, (target_domain, receiver, amount, operator) in enumerate(requests):
+        check_event(
+            l2_teleport_gateway,
+            "TeleportInitialized",
+            tx, (
+                DOMAIN,
+                target_domain,
+                receiver,
+                operator,
+                amount,
+                nonce,
+                block_timestamp()
+            )
+        )
+        teleport = await l2_teleport_gateway.teleports(nonce).call()
+        assert teleport.result == ((target_domain, receiver, operator, amount, block_timestamp()),)
+
+    nonce = await l2_teleport_gateway.nonce().call()
+    assert nonce.result == (len(requests),)
+    batched_dai_to_flush = await l2_teleport_gateway.batched_dai_to_flush(TARGET_DOMAIN).call()
+    assert batched_dai_to_flush.result == (to_split_uint(7),)
+    batched_dai_to_flush = await l2_teleport_gateway.batched_dai_to_flush(OTHER_DOMAIN).call()
+    assert batched_dai_to_flush.result == (to_split_uint(8),)
+    await check_balances(100 - 15, 100)
+
+
+@pytest.mark.asyncio
+async def test_batch_reverts_on_invalid_domain(
+    l2_teleport_gateway: StarknetContract,
+    dai: StarknetContract,
+    user1: StarknetContract,
+    user2: StarknetContract,
+):
+    await dai.approve(l2_teleport_gateway.contract_address, to_split_uint(20)).execute(user1.contract_address)
+    with pytest.raises(StarkException) as err:
+        await l2_teleport_gateway.initiate_teleports([
+            (TARGET_DOMAIN, user2.contract_address, TELEPORT_AMOUNT, user2.contract_address),
+            (INVALID_DOMAIN, user2.contract_address, TELEPORT_AMOUNT, user2.contract_address),
+        ]).execute(user1.contract_address)
+    assert "l2_dai_teleport_gateway/invalid-domain" in str(err.value)
+
+
+@pytest.mark.asyncio
+async def test_batch_reverts_when_closed(
+    l2_teleport_gateway: StarknetContract,
+    auth_user: StarknetContract,
+    user1: StarknetContract,
+    user2: StarknetContract,
+):
+    await l2_teleport_gateway.close().execute(auth_user.contract_address)
+    with pytest.raises(StarkException) as err:
+        await l2_teleport_gateway.initiate_teleports([
+            (TARGET_DOMAIN, user2.contract_address, TELEPORT_AMOUNT, user2.contract_address),
+        ]).execute(user1.contract_address)
+    assert "l2_dai_teleport_gateway/gateway-closed" in str(err.value)
+
+
+@pytest.mark.asyncio
+async def test_batch_is_cheaper_than_single_teleports(
+    l2_teleport_gateway: StarknetContract,
+    dai: StarknetContract,
+    user1: StarknetContract,
+    user2: StarknetContract,
+):
+    await dai.approve(l2_teleport_gateway.contract_address, to_split_uint(20)).execute(user1.contract_address)
+    single_steps = 0
+    for _ in range(10):
+        tx = await l2_teleport_gateway.initiate_teleport(
+                TARGET_DOMAIN,
+                user2.contract_address,
+                1,
+                user1.contract_address).execute(user1.contract_address)
+        single_steps += get_resources(tx).steps
+
+    tx = await l2_teleport_gateway.initiate_teleports([
+        (TARGET_DOMAIN, user2.contract_address, 1, user1.contract_address)
+        for _ in range(10)
+    ]).execute(user1.contract_address)
+    batch_steps = get_resources(tx).steps
+
+    assert batch_steps < single_steps
+
+
+## teleport commitments
+COMMIT_TELEPORTS = int.from_bytes("commit_teleports".encode(), byteorder="big")
+
+
+@pytest.mark.asyncio
+async def test_stores_a_commitment_when_enabled(
+    l2_teleport_gateway: StarknetContract,
+    dai: StarknetContract,
+    auth_user: StarknetContract,
+    user1: StarknetContract,
+    user2: StarknetContract,
+    block_timestamp,
+):
+    await l2_teleport_gateway.file(COMMIT_TELEPORTS, 0, 1).execute(auth_user.contract_address)
+    commit_teleports = await l2_teleport_gateway.commit_teleports().call()
+    assert commit_teleports.result == (1,)
+
+    await dai.approve(l2_teleport_gateway.contract_address, to_split_uint(TELEPORT_AMOUNT)).execute(user1.contract_address)
+    await l2_teleport_gateway.initiate_teleport(
+            TARGET_DOMAIN,
+            user2.contract_address,
+            TELEPORT_AMOUNT,
+            user1.contract_address).execute(user1.contract_address)
+    guid = TeleportGUID(
+        DOMAIN, TARGET_DOMAIN, user2.contract_address, user1.contract_address, TELEPORT_AMOUNT, 0, block_timestamp())
+
+    commitment = await l2_teleport_gateway.teleport_commitments(0).call()
+    assert commitment.result == (guid.commitment(),)
+    teleport = await l2_teleport_gateway.teleports(0).call()
+    assert teleport.result == ((0, 0, 0, 0, 0),)
+
+    with pytest.raises(StarkException) as err:
+        await l2_teleport_gateway.finalize_register_teleport(
+                TARGET_DOMAIN,
+                user2.contract_address,
+                TELEPORT_AMOUNT + 1,
+                user1.contract_address,
+                0,
+                block_timestamp()).execute(user1.contract_address)
+    assert "l2_dai_teleport_gateway/teleport-does-not-exist" in str(err.value)
+
+    tx = await l2_teleport_gateway.finalize_register_teleport(
+            TARGET_DOMAIN,
+            user2.contract_address,
+            TELEPORT_AMOUNT,
+            user1.contract_address,
+            0,
+            block_timestamp()).execute(user1.contract_address)
+    check_event(l2_teleport_gateway, "TeleportRegisterFinalized", tx, tuple(guid.encode()))
+
+
+@pytest.mark.asyncio
+@pytest.mark.checkpoint("after_one_teleport")
+async def test_finalizes_records_from_before_commitments(
+    l2_teleport_gateway: StarknetContract,
+    dai: StarknetContract,
+    auth_user: StarknetContract,
+    user1: StarknetContract,
+    user2: StarknetContract,
+    block_timestamp,
+):
+    await l2_teleport_gateway.file(COMMIT_TELEPORTS, 0, 1).execute(auth_user.contract_address)
+    await dai.approve(l2_teleport_gateway.contract_address, to_split_uint(2)).execute(user1.contract_address)
+    await l2_teleport_gateway.initiate_teleports([
+        (TARGET_DOMAIN, user2.contract_address, 1, user1.contract_address),
+        (TARGET_DOMAIN, user2.contract_address, 1, user1.contract_address),
+    ]).execute(user1.contract_address)
+
+    guids = (
+        TeleportGUID(
+            DOMAIN, TARGET_DOMAIN, user1.contract_address, user1.contract_address, TELEPORT_AMOUNT, 0,
+            block_timestamp()),
+        *(
+            TeleportGUID(
+                DOMAIN, TARGET_DOMAIN, user2.contract_address, user1.contract_address, 1, nonce, block_timestamp())
+            for nonce in (1, 2)
+        ),
+    )
+    commitment = await l2_teleport_gateway.teleport_commitments(0).call()
+    assert commitment.result == (0,)
+    for guid in guids[1:]:
+        commitment = await l2_teleport_gateway.teleport_commitments(guid.nonce).call()
+        assert commitment.result == (guid.commitment(),)
+
+    await l2_teleport_gateway.finalize_register_teleports(
+            [guid.registration() for guid in guids]).execute(user1.contract_address)
+
+
+@pytest.mark.asyncio
+async def test_commitments_cut_teleport_storage_writes(
+    starknet: Starknet,
+    l2_teleport_gateway: StarknetContract,
+    dai: StarknetContract,
+    auth_user: StarknetContract,
+    user1: StarknetContract,
+    user2: StarknetContract,
+):
+    await dai.approve(l2_teleport_gateway.contract_address, to_split_uint(TELEPORT_AMOUNT * 3)).execute(user1.contract_address)
+
+    async def initiate():
+        _, resources = await measure(
+            starknet.state,
+            l2_teleport_gateway.initiate_teleport(
+                TARGET_DOMAIN,
+                user2.contract_address,
+                TELEPORT_AMOUNT,
+                user1.contract_address).execute(user1.contract_address),
+        )
+        return resources
+
+    # the first teleport also writes cells that stay the same afterwards
+    await initiate()
+    records = await initiate()
+    await l2_teleport_gateway.file(COMMIT_TELEPORTS, 0, 1).execute(auth_user.contract_address)
+    commitments = await initiate()
+
+    # _teleports(nonce) takes 5 cells, a commitment 1
+    assert records.storage_writes - commitments.storage_writes == 4
+
+
+## finalize_register_teleports()
+async def initiate_batch(l2_teleport_gateway, dai, user1, user2, size):
+    await dai.approve(l2_teleport_gateway.contract_address, to_split_uint(size)).execute(user1.contract_address)
+    await l2_teleport_gateway.initiate_teleports([
+        (TARGET_DOMAIN, user2.contract_address, 1, user1.contract_address)
+        for _ in range(size)
+    ]).execute(user1.contract_address)
+
+
+def registrations(guids):
+    return [guid.registration() for guid in guids]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("size", [1, 5, 20])
+async def test_finalizes_a_batch_of_teleports_with_one_message(
+    starknet: Starknet,
+    l2_teleport_gateway: StarknetContract,
+    dai: StarknetContract,
+    user1: StarknetContract,
+    user2: StarknetContract,
+    block_timestamp,
+    size,
+):
+    await initiate_batch(l2_teleport_gateway, dai, user1, user2, size)
+    guids = tuple(
+        TeleportGUID(DOMAIN, TARGET_DOMAIN, user2.contract_address, user1.contract_address, 1, nonce, block_timestamp())
+        for nonce in range(size)
+    )
+
+    tx = await l2_teleport_gateway.finalize_register_teleports(
+            registrations(guids)).execute(user1.contract_address)
+    for guid in guids:
+        check_event(l2_teleport_gateway, "TeleportRegisterFinalized", tx, tuple(guid.encode()))
+
+    gateway = l2_teleport_gateway.contract_address
+    drained = drain_messages(starknet, {gateway: TELEPORT_GATEWAY})
+    assert [message.record for message in drained] == [FinalizeRegisterTeleports(guids)]
+    assert_messages(drained, [
+        expected_message(gateway, L1_TELEPORT_BRIDGE_ADDRESS, FinalizeRegisterTeleports(guids)),
+    ])
+    assert get_resources(tx).l1_messages == 1
+
+
+@pytest.mark.asyncio
+async def test_batch_finalize_rejects_tampered_teleports(
+    starknet: Starknet,
+    l2_teleport_gateway: StarknetContract,
+    dai: StarknetContract,
+    user1: StarknetContract,
+    user2: StarknetContract,
+    block_timestamp,
+):
+    await initiate_batch(l2_teleport_gateway, dai, user1, user2, 3)
+    guids = [
+        TeleportGUID(DOMAIN, TARGET_DOMAIN, user2.contract_address, user1.contract_address, 1, nonce, block_timestamp())
+        for nonce in range(3)
+    ]
+
+    tampered = [*guids[:2], TeleportGUID(*guids[2].encode()[:4], 2, *guids[2].encode()[5:])]
+    with pytest.raises(StarkException) as err:
+        await l2_teleport_gateway.finalize_register_teleports(
+                registrations(tampered)).execute(user1.contract_address)
+    assert "l2_dai_teleport_gateway/teleport-does-not-exist" in str(err.value)
+
+    # L1 can't consume the message with teleports other than the ones sent
+    await l2_teleport_gateway.finalize_register_teleports(
+            registrations(guids)).execute(user1.contract_address)
+    with pytest.raises(AssertionError):
+        starknet.consume_message_from_l2(
+            from_address=l2_teleport_gateway.contract_address,
+            to_address=L1_TELEPORT_BRIDGE_ADDRESS,
+            payload=FinalizeRegisterTeleports(tuple(tampered)).encode(),
+        )
+    starknet.consume_message_from_l2(
+        from_address=l2_teleport_gateway.contract_address,
+        to_address=L1_TELEPORT_BRIDGE_ADDRESS,
+        payload=FinalizeRegisterTeleports(tuple(guids)).encode(),
+    )
+
+
+@pytest.mark.asyncio
+async def test_batch_finalize_reverts_when_empty(
+    l2_teleport_gateway: StarknetContract,
+    user1: StarknetContract,
+):
+    with pytest.raises(StarkException) as err:
+        await l2_teleport_gateway.finalize_register_teleports([]).execute(user1.contract_address)
+    assert "l2_dai_teleport_gateway/empty-batch" in str(err.value)
+
+
 ## flush()
 @pytest.mark.asyncio
 async def test_flushes_batched_dai(
@@ -440,6 +757,45 @@ async def test_flushes_batched_dai(
     )
 
 
+@pytest.mark.asyncio
+async def test_drain_teleports_and_flush(
+    starknet: Starknet,
+    l2_teleport_gateway: StarknetContract,
+    dai: StarknetContract,
+    user1: StarknetContract,
+    user2: StarknetContract,
+    block_timestamp,
+):
+    await dai.approve(l2_teleport_gateway.contract_address, to_split_uint(5)).execute(user1.contract_address)
+    for nonce in range(5):
+        await l2_teleport_gateway.initiate_teleport(
+                TARGET_DOMAIN,
+                user2.contract_address,
+                1,
+                user1.contract_address).execute(user1.contract_address)
+        await l2_teleport_gateway.finalize_register_teleport(
+                TARGET_DOMAIN,
+                user2.contract_address,
+                1,
+                user1.contract_address,
+                nonce,
+                block_timestamp()).execute(user1.contract_address)
+    await l2_teleport_gateway.flush(TARGET_DOMAIN).execute(user1.contract_address)
+
+    gateway = l2_teleport_gateway.contract_address
+    drained = drain_messages(starknet, {gateway: TELEPORT_GATEWAY})
+    teleports = [
+        FinalizeRegisterTeleport(TeleportGUID(
+            DOMAIN, TARGET_DOMAIN, user2.contract_address, user1.contract_address, 1, nonce, block_timestamp()))
+        for nonce in range(5)
+    ]
+    assert [message.record for message in drained] == [*teleports, FinalizeFlush(TARGET_DOMAIN, 5)]
+    assert_messages(drained, [
+        expected_message(gateway, L1_TELEPORT_BRIDGE_ADDRESS, record)
+        for record in [FinalizeFlush(TARGET_DOMAIN, 5), *reversed(teleports)]
+    ])
+
+
 @pytest.mark.asyncio
 async def test_cannot_flush_zero_debt(
     l2_teleport_gateway: StarknetContract,
@@ -451,3 +807,337 @@ async def test_cannot_flush_zero_debt(
     with pytest.raises(StarkException) as err:
         await l2_teleport_gateway.flush(TARGET_DOMAIN).execute(user1.contract_address)
     assert "l2_dai_teleport_gateway/value-is-zero" in str(err.value)
+
+
+## flush_many()
+async def initiate_in_domains(l2_teleport_gateway, dai, auth_user, user1, domains):
+    for domain in domains:
+        await l2_teleport_gateway.file(VALID_DOMAINS, domain, 1).execute(auth_user.contract_address)
+    await dai.approve(
+            l2_teleport_gateway.contract_address,
+            to_split_uint(TELEPORT_AMOUNT * len(domains))).execute(user1.contract_address)
+    await l2_teleport_gateway.initiate_teleports([
+        (domain, user1.contract_address, TELEPORT_AMOUNT, user1.contract_address)
+        for domain in domains
+    ]).execute(user1.contract_address)
+
+
+@pytest.mark.asyncio
+async def test_flushes_many_domains_with_one_message(
+    starknet: Starknet,
+    l2_teleport_gateway: StarknetContract,
+    dai: StarknetContract,
+    auth_user: StarknetContract,
+    user1: StarknetContract,
+):
+    await initiate_in_domains(l2_teleport_gateway, dai, auth_user, user1, [TARGET_DOMAIN, OTHER_DOMAIN])
+
+    tx = await l2_teleport_gateway.flush_many(
+            [TARGET_DOMAIN, INVALID_DOMAIN, OTHER_DOMAIN]).execute(user1.contract_address)
+    for domain in [TARGET_DOMAIN, OTHER_DOMAIN]:
+        check_event(l2_teleport_gateway, "Flushed", tx, (domain, to_split_uint(TELEPORT_AMOUNT)))
+        batched_dai_to_flush = await l2_teleport_gateway.batched_dai_to_flush(domain).call()
+        assert batched_dai_to_flush.result == (to_split_uint(0),)
+
+    gateway = l2_teleport_gateway.contract_address
+    flushes = FinalizeFlushMany((
+        FinalizeFlush(TARGET_DOMAIN, TELEPORT_AMOUNT),
+        FinalizeFlush(OTHER_DOMAIN, TELEPORT_AMOUNT),
+    ))
+    drained = drain_messages(starknet, {gateway: TELEPORT_GATEWAY})
+    assert [message.record for message in drained] == [flushes]
+    assert_messages(drained, [expected_message(gateway, L1_TELEPORT_BRIDGE_ADDRESS, flushes)])
+
+
+@pytest.mark.asyncio
+async def test_flush_many_sends_nothing_when_nothing_is_batched(
+    starknet: Starknet,
+    l2_teleport_gateway: StarknetContract,
+    user1: StarknetContract,
+):
+    tx = await l2_teleport_gateway.flush_many([TARGET_DOMAIN, OTHER_DOMAIN]).execute(user1.contract_address)
+    assert get_resources(tx).l1_messages == 0
+    assert drain_messages(starknet, {l2_teleport_gateway.contract_address: TELEPORT_GATEWAY}) == []
+
+
+@pytest.mark.asyncio
+async def test_flush_many_resources(
+    starknet: Starknet,
+    l2_teleport_gateway: StarknetContract,
+    dai: StarknetContract,
+    auth_user: StarknetContract,
+    user1: StarknetContract,
+):
+    domains = [get_selector_from_name(f"domain_{i}") for i in range(5)]
+    await initiate_in_domains(l2_teleport_gateway, dai, auth_user, user1, domains)
+    _, many = await measure(
+        starknet.state,
+        l2_teleport_gateway.flush_many(domains).execute(user1.contract_address))
+
+    await initiate_in_domains(l2_teleport_gateway, dai, auth_user, user1, domains)
+    single_steps = single_messages = 0
+    for domain in domains:
+        tx = await l2_teleport_gateway.flush(domain).execute(user1.contract_address)
+        single_steps += get_resources(tx).steps
+        single_messages += get_resources(tx).l1_messages
+
+    assert many.l1_messages == 1 and single_messages == len(domains)
+    assert many.steps < single_steps
+
+
+## sharding
+SHARDS = int.from_bytes("shards".encode(), byteorder="big")
+FIRST_CALLER = 0x10000
+
+
+async def fund_callers(l2_teleport_gateway, dai, auth_user, callers):
+    for caller in callers:
+        await dai.mint(caller, to_split_uint(TELEPORT_AMOUNT)).execute(auth_user.contract_address)
+        await dai.approve(
+                l2_teleport_gateway.contract_address,
+                to_split_uint(TELEPORT_AMOUNT)).execute(caller)
+
+
+@pytest.mark.asyncio
+async def test_sharded_teleports(
+    l2_teleport_gateway: StarknetContract,
+    dai: StarknetContract,
+    auth_user: StarknetContract,
+    user1: StarknetContract,
+    block_timestamp,
+):
+    callers = [FIRST_CALLER + i for i in range(4)]
+    await fund_callers(l2_teleport_gateway, dai, auth_user, callers)
+    await dai.approve(l2_teleport_gateway.contract_address, to_split_uint(TELEPORT_AMOUNT)).execute(user1.contract_address)
+    await l2_teleport_gateway.initiate_teleport(
+            TARGET_DOMAIN, user1.contract_address, 1, user1.contract_address).execute(user1.contract_address)
+
+    await l2_teleport_gateway.file(SHARDS, 0, 4).execute(auth_user.contract_address)
+    with pytest.raises(StarkException) as err:
+        await l2_teleport_gateway.file(SHARDS, 0, 8).execute(auth_user.contract_address)
+    assert "l2_dai_teleport_gateway/shards-already-set" in str(err.value)
+
+    # nonce = base + index in the shard * shards + shard, the base being the
+    # nonce when sharding started
+    expected = {}
+    for caller in callers:
+        shard = caller % 4
+        for index in range(2):
+            tx = await l2_teleport_gateway.initiate_teleport(
+                    TARGET_DOMAIN, caller, 1, caller).execute(caller)
+            nonce = 1 + index * 4 + shard
+            check_event(
+                l2_teleport_gateway,
+                "TeleportInitialized",
+                tx, (DOMAIN, TARGET_DOMAIN, caller, caller, 1, nonce, block_timestamp())
+            )
+            expected[nonce] = caller
+    assert len(expected) == 2 * len(callers)
+    for shard in range(4):
+        shard_nonce = await l2_teleport_gateway.shard_nonces(shard).call()
+        assert shard_nonce.result == (2,)
+
+    await l2_teleport_gateway.finalize_register_teleport(
+            TARGET_DOMAIN, callers[1], 1, callers[1], 1 + 4 + callers[1] % 4, block_timestamp(),
+        ).execute(user1.contract_address)
+
+    # batched DAI is the sum of the unsharded cell and of every shard
+    batched_dai_to_flush = await l2_teleport_gateway.batched_dai_to_flush(TARGET_DOMAIN).call()
+    assert batched_dai_to_flush.result == (to_split_uint(1 + 2 * len(callers)),)
+    tx = await l2_teleport_gateway.flush(TARGET_DOMAIN).execute(user1.contract_address)
+    check_event(l2_teleport_gateway, "Flushed", tx, (TARGET_DOMAIN, to_split_uint(1 + 2 * len(callers))))
+    batched_dai_to_flush = await l2_teleport_gateway.batched_dai_to_flush(TARGET_DOMAIN).call()
+    assert batched_dai_to_flush.result == (to_split_uint(0),)
+
+
+@pytest.mark.asyncio
+async def test_sharded_teleports_keep_invariants(
+    starknet: Starknet,
+    l2_teleport_gateway: StarknetContract,
+    dai: StarknetContract,
+    auth_user: StarknetContract,
+    user1: StarknetContract,
+):
+    callers = [FIRST_CALLER + i for i in range(4)]
+    await fund_callers(l2_teleport_gateway, dai, auth_user, callers)
+
+    with invariants.checking(starknet.state, dai.contract_address, l2_teleport_gateway.contract_address):
+        await l2_teleport_gateway.initiate_teleport(
+                TARGET_DOMAIN, callers[0], 1, callers[0]).execute(callers[0])
+        await l2_teleport_gateway.file(SHARDS, 0, 4).execute(auth_user.contract_address)
+        for caller in callers:
+            await l2_teleport_gateway.initiate_teleport(
+                    TARGET_DOMAIN, caller, 1, caller).execute(caller)
+        await l2_teleport_gateway.flush(TARGET_DOMAIN).execute(user1.contract_address)
+
+
+@pytest.mark.asyncio
+async def test_file_should_not_accept_invalid_shards(
+    l2_teleport_gateway: StarknetContract,
+    auth_user: StarknetContract,
+):
+    for shards in [1, 257]:
+        with pytest.raises(StarkException) as err:
+            await l2_teleport_gateway.file(SHARDS, 0, shards).execute(auth_user.contract_address)
+        assert "l2_dai_teleport_gateway/invalid-data" in str(err.value)
+
+
+@pytest.mark.asyncio
+async def test_sharding_removes_write_conflicts(
+    starknet: Starknet,
+    l2_teleport_gateway: StarknetContract,
+    dai: StarknetContract,
+    auth_user: StarknetContract,
+):
+    """
+    Runs a teleport of each of 8 callers, as if they were sent concurrently,
+    and counts the pairs of them writing a common storage cell, before and
+    after sharding the gateway counters.
+    """
+    callers = [FIRST_CALLER + i for i in range(8)]
+    await fund_callers(l2_teleport_gateway, dai, auth_user, callers)
+
+    async def conflicts():
+        write_sets = []
+        for caller in callers:
+            snapshot = storage_snapshot(starknet.state)
+            await l2_teleport_gateway.initiate_teleport(
+                    TARGET_DOMAIN, caller, 1, caller).execute(caller)
+            write_sets.append(written_cells(starknet.state, snapshot))
+        return (
+            len(write_conflicts(write_sets, l2_teleport_gateway.contract_address)),
+            len(write_conflicts(write_sets)),
+        )
+
+    unsharded = await conflicts()
+    await l2_teleport_gateway.file(SHARDS, 0, len(callers)).execute(auth_user.contract_address)
+    sharded = await conflicts()
+
+    pairs = len(callers) * (len(callers) - 1) // 2
+    assert unsharded[0] == pairs
+    assert sharded[0] == 0
+    # the DAI total supply is still written by every teleport
+    assert sharded[1] == pairs
+
+
+## prune_teleports()
+TELEPORT_TTL = int.from_bytes("teleport_ttl".encode(), byteorder="big")
+DAY = 24 * 60 * 60
+
+
+@pytest.mark.asyncio
+@pytest.mark.checkpoint("after_one_teleport")
+async def test_prunes_expired_teleports(
+    ctx,
+    l2_teleport_gateway: StarknetContract,
+    auth_user: StarknetContract,
+    user1: StarknetContract,
+    block_timestamp,
+):
+    guid = TeleportGUID(
+        DOMAIN, TARGET_DOMAIN, user1.contract_address, user1.contract_address, TELEPORT_AMOUNT, 0, block_timestamp())
+
+    with pytest.raises(StarkException) as err:
+        await l2_teleport_gateway.prune_teleports([guid.registration()]).execute(auth_user.contract_address)
+    assert "l2_dai_teleport_gateway/pruning-disabled" in str(err.value)
+
+    await l2_teleport_gateway.file(TELEPORT_TTL, 0, 30 * DAY).execute(auth_user.contract_address)
+    teleport_ttl = await l2_teleport_gateway.teleport_ttl().call()
+    assert teleport_ttl.result == (30 * DAY,)
+
+    ctx.advance_clock(30 * DAY)
+    with pytest.raises(StarkException) as err:
+        await l2_teleport_gateway.prune_teleports([guid.registration()]).execute(auth_user.contract_address)
+    assert "l2_dai_teleport_gateway/teleport-not-expired" in str(err.value)
+
+    ctx.advance_clock(1)
+    tampered = TeleportGUID(*guid.encode()[:4], TELEPORT_AMOUNT + 1, *guid.encode()[5:])
+    with pytest.raises(StarkException) as err:
+        await l2_teleport_gateway.prune_teleports([tampered.registration()]).execute(auth_user.contract_address)
+    assert "l2_dai_teleport_gateway/teleport-does-not-exist" in str(err.value)
+
+    # only wards can prune, finalization on L1 can't be checked on L2
+    with pytest.raises(StarkException) as err:
+        await l2_teleport_gateway.prune_teleports([guid.registration()]).execute(user1.contract_address)
+    assert "l2_dai_teleport_gateway/not-authorized" in str(err.value)
+
+    # a nonce without a record can't be pruned as an all zero teleport
+    missing = TeleportGUID(DOMAIN, 0, 0, 0, 0, 1, 0)
+    with pytest.raises(StarkException) as err:
+        await l2_teleport_gateway.prune_teleports([missing.registration()]).execute(auth_user.contract_address)
+    assert "l2_dai_teleport_gateway/teleport-does-not-exist" in str(err.value)
+
+    # nor can a record be pruned twice
+    with pytest.raises(StarkException) as err:
+        await l2_teleport_gateway.prune_teleports(
+                [guid.registration(), guid.registration()]).execute(auth_user.contract_address)
+    assert "l2_dai_teleport_gateway/teleport-does-not-exist" in str(err.value)
+
+    tx = await l2_teleport_gateway.prune_teleports([guid.registration()]).execute(auth_user.contract_address)
+    check_event(l2_teleport_gateway, "TeleportsPruned", tx, (1,))
+    teleport = await l2_teleport_gateway.teleports(0).call()
+    assert teleport.result == ((0, 0, 0, 0, 0),)
+
+
+@pytest.mark.asyncio
+async def test_file_should_not_accept_invalid_teleport_ttl(
+    l2_teleport_gateway: StarknetContract,
+    auth_user: StarknetContract,
+):
+    for ttl in [-1, 2**64 + 1]:
+        with pytest.raises(StarkException) as err:
+            await l2_teleport_gateway.file(TELEPORT_TTL, 0, ttl).execute(auth_user.contract_address)
+        assert "l2_dai_teleport_gateway/invalid-data" in str(err.value)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("commit", [0, 1])
+async def test_pruning_bounds_teleport_state(
+    ctx,
+    starknet: Starknet,
+    l2_teleport_gateway: StarknetContract,
+    dai: StarknetContract,
+    auth_user: StarknetContract,
+    user1: StarknetContract,
+    user2: StarknetContract,
+    block_timestamp,
+    commit,
+):
+    """
+    Six months of 3 teleports every 5 days, pruning whatever expired with a
+    30 day TTL before each batch: the number of storage cells of the gateway
+    stops growing once the first teleports expire.
+    """
+    await l2_teleport_gateway.file(TELEPORT_TTL, 0, 30 * DAY).execute(auth_user.contract_address)
+    await l2_teleport_gateway.file(COMMIT_TELEPORTS, 0, commit).execute(auth_user.contract_address)
+    await dai.mint(user1.contract_address, to_split_uint(10**6)).execute(auth_user.contract_address)
+    await dai.approve(l2_teleport_gateway.contract_address, to_split_uint(10**6)).execute(user1.contract_address)
+
+    gateway = l2_teleport_gateway.contract_address
+    live = []
+    cells = []
+    nonce = 0
+    for _ in range(0, 180, 5):
+        expired = [guid for guid in live if guid.timestamp + 30 * DAY < block_timestamp()]
+        if expired:
+            await l2_teleport_gateway.prune_teleports(
+                    [guid.registration() for guid in expired]).execute(auth_user.contract_address)
+            live = [guid for guid in live if guid not in expired]
+
+        await l2_teleport_gateway.initiate_teleports([
+            (TARGET_DOMAIN, user2.contract_address, 1, user1.contract_address)
+            for _ in range(3)
+        ]).execute(user1.contract_address)
+        live += [
+            TeleportGUID(
+                DOMAIN, TARGET_DOMAIN, user2.contract_address, user1.contract_address, 1, nonce + i,
+                block_timestamp())
+            for i in range(3)
+        ]
+        nonce += 3
+        cells.append(live_cells(starknet.state, gateway))
+        ctx.advance_clock(5 * DAY)
+
+    # 7 batches of 3 teleports live at most (30 days / 5 days + 1)
+    assert len(live) <= 21
+    assert max(cells[12:]) == max(cells[6:12])
@@ -1,10 +1,15 @@
+from __future__ import annotations
+
 import pytest
+from typing import TYPE_CHECKING
 
-from starkware.starknet.testing.starknet import Starknet
-from starkware.starknet.testing.contract import StarknetContract, DeclaredClass
 from starkware.starkware_utils.error_handling import StarkException
 from conftest import to_split_uint, to_uint
 
+if TYPE_CHECKING:
+    from starkware.starknet.testing.starknet import Starknet
+    from starkware.starknet.testing.contract import StarknetContract, DeclaredClass
+
 
 L1_ADDRESS = 0x1
 L1_GOVERNANCE_ADDRESS = 0x1
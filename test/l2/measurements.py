@@ -0,0 +1,108 @@
+"""Execution resources of transactions run against the L2 test harness."""
+
+from collections import namedtuple
+
+from starkware.starknet.public.abi import get_selector_from_name
+
+Resources = namedtuple(
+    "Resources",
+    ["steps", "pedersen", "range_check", "storage_writes", "l1_messages"],
+)
+
+
+# `execute()` returns a StarknetCallInfo whose call_info is a FunctionInvocation,
+# `send_message_to_l2()` returns a TransactionExecutionInfo whose call_info is a
+# CallInfo. The helpers below accept both.
+def root_call(tx):
+    return tx.call_info if hasattr(tx, "call_info") else tx
+
+
+def call_selector(call):
+    return call.selector if hasattr(call, "selector") else call.entry_point_selector
+
+
+def call_messages(call):
+    return call.messages if hasattr(call, "messages") else call.l2_to_l1_messages
+
+
+def iter_calls(call):
+    yield call
+    for internal_call in call.internal_calls:
+        yield from iter_calls(internal_call)
+
+
+def find_call(tx, entry_point):
+    selector = get_selector_from_name(entry_point)
+    for call in iter_calls(root_call(tx)):
+        if call_selector(call) == selector:
+            return call
+    raise KeyError(f"{entry_point} was not called")
+
+
+def count_calls(tx, contract_address=None):
+    """Number of calls `tx` makes to other contracts (to `contract_address` only, when given)."""
+    calls = list(iter_calls(root_call(tx)))[1:]
+    if contract_address is not None:
+        calls = [call for call in calls if call.contract_address == contract_address]
+    return len(calls)
+
+
+def storage_snapshot(starknet_state):
+    return dict(starknet_state.state.cache._storage_writes)
+
+
+def written_cells(starknet_state, snapshot):
+    """The (contract address, key) storage cells changed since `snapshot`."""
+    writes = starknet_state.state.cache._storage_writes
+    return {key for key, value in writes.items() if snapshot.get(key) != value}
+
+
+def live_cells(starknet_state, contract_address):
+    """Number of non-zero storage cells of `contract_address` written so far."""
+    writes = starknet_state.state.cache._storage_writes
+    return sum(1 for (address, _), value in writes.items() if address == contract_address and value != 0)
+
+
+def count_storage_writes(starknet_state, snapshot):
+    return len(written_cells(starknet_state, snapshot))
+
+
+def write_conflicts(write_sets, contract_address=None):
+    """
+    Pairs of the transactions with the cells `write_sets` that write a common
+    cell (of `contract_address` only, when given), i.e. the pairs a parallel
+    executor couldn't run concurrently.
+    """
+    if contract_address is not None:
+        write_sets = [{cell for cell in cells if cell[0] == contract_address} for cells in write_sets]
+    return [
+        (i, j)
+        for i in range(len(write_sets))
+        for j in range(i + 1, len(write_sets))
+        if write_sets[i] & write_sets[j]
+    ]
+
+
+def get_resources(tx, entry_point=None, storage_writes=None):
+    """
+    Resources used by `tx`, or by its `entry_point` call (including the calls
+    it makes) when given. Storage writes can't be read from the call tree and
+    are only filled in by `measure`.
+    """
+    call = root_call(tx) if entry_point is None else find_call(tx, entry_point)
+    builtins = call.execution_resources.builtin_instance_counter
+    return Resources(
+        steps=call.execution_resources.n_steps,
+        pedersen=builtins.get("pedersen_builtin", 0),
+        range_check=builtins.get("range_check_builtin", 0),
+        storage_writes=storage_writes,
+        l1_messages=sum(len(call_messages(c)) for c in iter_calls(call)),
+    )
+
+
+async def measure(starknet_state, tx_coroutine, entry_point=None):
+    """Awaits `tx_coroutine` and returns its result together with its Resources."""
+    snapshot = storage_snapshot(starknet_state)
+    tx = await tx_coroutine
+    storage_writes = count_storage_writes(starknet_state, snapshot)
+    return tx, get_resources(tx, entry_point, storage_writes=storage_writes)
@@ -0,0 +1,207 @@
+"""Bulk L1 <-> L2 messaging for the L2 test harness.
+
+`inject_messages` applies many L1 -> L2 messages to a Starknet in one loop.
+It does what `Starknet.send_message_to_l2` does per message, but resolves
+the selectors and the chain id once and doesn't stop at the first failing
+message: every failure is recorded with its index and the loop goes on.
+
+Messages are `L1Message` tuples, `read_deposits_csv` turns a CSV of
+`LogDeposit` records of the L1 bridge into `handle_deposit` messages.
+
+In the other direction, `drain_messages` consumes every pending L2 -> L1
+message at once and decodes the payloads of the bridge and the teleport
+gateway into records (see codec.py), and `match_messages` compares them
+with the expected records through their message hashes.
+"""
+
+import csv
+import time
+import weakref
+from collections import defaultdict, namedtuple
+
+from codec import Deposit, decode_bridge_payload, decode_gateway_payload, l2_to_l1_message_hash
+
+L1Message = namedtuple("L1Message", ["from_address", "to_address", "selector", "payload"])
+InjectionFailure = namedtuple("InjectionFailure", ["index", "message", "error"])
+
+BRIDGE = "bridge"
+TELEPORT_GATEWAY = "teleport_gateway"
+
+L2Message = namedtuple("L2Message", ["from_address", "to_address", "payload", "hash", "record"])
+
+
+class InjectionReport:
+    def __init__(self):
+        self.count = 0
+        self.results = []
+        self.failures = []
+        self.elapsed = 0.0
+
+    @property
+    def succeeded(self):
+        return self.count - len(self.failures)
+
+    @property
+    def messages_per_s(self):
+        return self.count / self.elapsed if self.elapsed else 0.0
+
+    def __repr__(self):
+        return (
+            f"InjectionReport({self.count} messages, {len(self.failures)} failed, "
+            f"{self.messages_per_s:.1f} msgs/s)"
+        )
+
+
+def deposit_message(l1_bridge, l2_bridge, l2_recipient, amount, l1_sender):
+    """The message `L1DAIBridge.deposit` sends to `handle_deposit`."""
+    return L1Message(
+        from_address=l1_bridge,
+        to_address=l2_bridge,
+        selector="handle_deposit",
+        payload=Deposit(l2_recipient, amount, l1_sender).encode(),
+    )
+
+
+def read_deposits_csv(path, l1_bridge, l2_bridge):
+    """
+    Yields the `handle_deposit` messages of the `LogDeposit(l1Sender, amount,
+    l2Recipient)` records in the CSV at `path` (with a header row, decimal or
+    0x-prefixed values).
+    """
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            yield deposit_message(
+                l1_bridge,
+                l2_bridge,
+                l2_recipient=int(row["l2Recipient"], 0),
+                amount=int(row["amount"], 0),
+                l1_sender=int(row["l1Sender"], 0),
+            )
+
+
+async def inject_messages(starknet, messages, keep_results=False):
+    """
+    Applies the L1Messages of the iterable `messages` to `starknet` (a
+    Starknet) in order. Returns an InjectionReport with the failures and, with
+    `keep_results`, the TransactionExecutionInfo of every message (None for
+    failed ones).
+    """
+    from starkware.starknet.business_logic.transaction.objects import InternalL1Handler
+    from starkware.starknet.public.abi import get_selector_from_name
+    from starkware.starkware_utils.error_handling import StarkException
+
+    state = starknet.state
+    chain_id = state.general_config.chain_id.value
+    selectors = {}
+    report = InjectionReport()
+
+    start = time.perf_counter()
+    for index, message in enumerate(messages):
+        selector = message.selector
+        if isinstance(selector, str):
+            if selector not in selectors:
+                selectors[selector] = get_selector_from_name(selector)
+            selector = selectors[selector]
+
+        nonce = starknet.l1_to_l2_nonce
+        starknet.l1_to_l2_nonce += 1
+        tx = InternalL1Handler.create(
+            contract_address=message.to_address,
+            entry_point_selector=selector,
+            calldata=[message.from_address, *message.payload],
+            nonce=nonce,
+            chain_id=chain_id,
+        )
+        report.count += 1
+        try:
+            execution_info = await state.execute_tx(tx=tx)
+        except StarkException as error:
+            report.failures.append(InjectionFailure(index, message, error))
+            execution_info = None
+        if keep_results:
+            report.results.append(execution_info)
+    report.elapsed = time.perf_counter() - start
+    return report
+
+
+def decode_payload(sender, payload):
+    """
+    The record of `payload` sent by a `sender` of kind BRIDGE or
+    TELEPORT_GATEWAY, None if the payload isn't one the sender sends.
+    """
+    try:
+        if sender == BRIDGE:
+            return decode_bridge_payload(payload)
+        if sender == TELEPORT_GATEWAY:
+            return decode_gateway_payload(payload)
+    except AssertionError:
+        pass
+    return None
+
+
+def expected_message(from_address, to_address, record):
+    payload = record.encode()
+    return L2Message(from_address, to_address, payload, l2_to_l1_message_hash(from_address, to_address, payload), record)
+
+
+# StarknetState -> number of entries of its l2_to_l1_messages_log already
+# handled by drain_messages. Only saves hashing them again, the pending
+# counts of the state decide what is drained.
+_drained = weakref.WeakKeyDictionary()
+
+
+def drain_messages(starknet, senders):
+    """
+    Consumes all pending L2 -> L1 messages of `starknet` and returns them as
+    L2Messages in the order they were sent. `senders` maps contract addresses
+    to BRIDGE or TELEPORT_GATEWAY, the payloads of their messages are decoded
+    into records (the record of other messages is None).
+    """
+    state = starknet.state
+    log = state.l2_to_l1_messages_log
+    start = _drained.get(state, 0)
+    pending = state._l2_to_l1_messages
+
+    drained = []
+    if len(log) - start < sum(pending.values()):
+        start = 0
+    for message in log[start:]:
+        hash_value = l2_to_l1_message_hash(message.from_address, message.to_address, message.payload)
+        # The state keys its pending messages by hex string.
+        key = f"0x{hash_value:064x}"
+        if pending.get(key, 0) == 0:
+            continue
+        state.consume_message_hash(key)
+        record = decode_payload(senders.get(message.from_address), message.payload)
+        drained.append(L2Message(message.from_address, message.to_address, list(message.payload), hash_value, record))
+    _drained[state] = len(log)
+    return drained
+
+
+def match_messages(drained, expected):
+    """
+    Matches the L2Messages `drained` with the L2Messages `expected` (see
+    `expected_message`) by hash, counting duplicates. Returns the expected
+    messages that weren't drained and the drained messages that weren't
+    expected.
+    """
+    by_hash = defaultdict(list)
+    for message in drained:
+        by_hash[message.hash].append(message)
+
+    missing = []
+    for message in expected:
+        if by_hash.get(message.hash):
+            by_hash[message.hash].pop()
+        else:
+            missing.append(message)
+    unexpected = [message for messages in by_hash.values() for message in messages]
+    return missing, unexpected
+
+
+def assert_messages(drained, expected):
+    missing, unexpected = match_messages(drained, expected)
+    assert not missing and not unexpected, (
+        f"missing L2 -> L1 messages: {[m.record or m.payload for m in missing]}, "
+        f"unexpected: {[m.record or m.payload for m in unexpected]}"
+    )
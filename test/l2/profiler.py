@@ -0,0 +1,220 @@
+"""Cairo VM step profiler for StarkNet entry points.
+
+Hooks into `CairoFunctionRunner.run_from_entrypoint`, which the StarkNet
+business logic uses for every (internal and external) entry point it runs,
+and reconstructs the Cairo call stack from the VM trace using the debug
+info that `compile_starknet_files(debug_info=True)` attaches to programs.
+Steps are aggregated per call stack and per source line, and written as a
+collapsed-stack file that `flamegraph.pl`, speedscope or inferno can read.
+"""
+
+import os
+from collections import Counter
+
+import pytest
+from starkware.cairo.common.cairo_function_runner import CairoFunctionRunner
+
+MAIN_SCOPE = "__main__."
+WRAPPERS_SCOPE = "__wrappers__."
+
+
+class _ProgramInfo:
+    """Lazily resolved pc -> (function, source line) mapping for a program."""
+
+    def __init__(self, program):
+        self.program = program
+        self.debug_info = program.debug_info
+        self.contract = self._contract_name()
+        self._functions = {}
+        self._lines = {}
+
+    def _contract_name(self):
+        if self.debug_info is None:
+            return "unknown"
+        for location in self.debug_info.instruction_locations.values():
+            filename = location.inst.input_file.filename
+            scope = str(location.accessible_scopes[-1])
+            if filename and not filename.startswith("autogen/") and scope.startswith(MAIN_SCOPE):
+                return os.path.splitext(os.path.basename(filename))[0]
+        return "unknown"
+
+    def _location(self, offset):
+        if self.debug_info is None:
+            return None
+        return self.debug_info.instruction_locations.get(offset)
+
+    def function(self, offset):
+        name = self._functions.get(offset)
+        if name is None:
+            location = self._location(offset)
+            if location is None:
+                name = f"pc={offset}"
+            else:
+                name = str(location.accessible_scopes[-1])
+                if name.startswith(MAIN_SCOPE):
+                    name = name[len(MAIN_SCOPE):]
+                if name.startswith(WRAPPERS_SCOPE):
+                    name = name[len(WRAPPERS_SCOPE):]
+            self._functions[offset] = name
+        return name
+
+    def line(self, offset):
+        line = self._lines.get(offset)
+        if line is None:
+            location = self._location(offset)
+            if location is None:
+                line = f"{self.contract}:pc={offset}"
+            else:
+                filename = location.inst.input_file.filename or "unknown"
+                line = f"{os.path.basename(filename)}:{location.inst.start_line}"
+            self._lines[offset] = line
+        return line
+
+
+class _Frame:
+    """A running entry point: one CairoFunctionRunner and its call stack."""
+
+    def __init__(self, runner, info, name, prefix, recording):
+        self.runner = runner
+        self.info = info
+        self.name = name
+        self.prefix = prefix
+        self.recording = recording
+        # list of (fp offset, function name)
+        self.stack = []
+        self.processed = 0
+
+    def current_stack(self):
+        return self.prefix + [name for _, name in self.stack]
+
+
+class StepProfiler:
+    """
+    Records Cairo steps of the selected entry points and everything they call.
+
+    `entry_points` are entry point names, e.g. `finalize_register_teleport`
+    or `handle_force_withdrawal`. The profiler is also a pytest plugin: on
+    xdist workers it ships its counters to the controller, which merges them
+    and writes the output files at the end of the session.
+    """
+
+    def __init__(self, entry_points, output=None):
+        self.entry_points = set(entry_points)
+        self.output = output
+        self.stacks = Counter()
+        self.lines = Counter()
+        self._programs = {}
+        self._frames = []
+        self._original = None
+
+    def install(self):
+        assert self._original is None, "profiler already installed"
+        original = CairoFunctionRunner.run_from_entrypoint
+        profiler = self
+
+        def run_from_entrypoint(runner, entrypoint, *args, **kwargs):
+            profiler._enter(runner, entrypoint)
+            try:
+                return original(runner, entrypoint, *args, **kwargs)
+            finally:
+                profiler._exit()
+
+        self._original = original
+        CairoFunctionRunner.run_from_entrypoint = run_from_entrypoint
+
+    def uninstall(self):
+        if self._original is not None:
+            CairoFunctionRunner.run_from_entrypoint = self._original
+            self._original = None
+
+    def _program_info(self, program):
+        info = self._programs.get(id(program))
+        if info is None or info.program is not program:
+            info = self._programs[id(program)] = _ProgramInfo(program)
+        return info
+
+    def _enter(self, runner, entrypoint):
+        info = self._program_info(runner.program)
+        offset = entrypoint if isinstance(entrypoint, int) else runner.program.get_label(entrypoint)
+        name = info.function(offset)
+
+        parent = self._frames[-1] if self._frames else None
+        if parent is not None and parent.recording:
+            # Catch the caller up to the call_contract syscall that got us here.
+            self._advance(parent)
+            self._frames.append(_Frame(runner, info, name, parent.current_stack(), True))
+        else:
+            recording = name in self.entry_points
+            self._frames.append(_Frame(runner, info, name, [], recording))
+
+    def _exit(self):
+        frame = self._frames.pop()
+        if frame.recording and getattr(frame.runner, "vm", None) is not None:
+            self._advance(frame)
+
+    def _advance(self, frame):
+        trace = frame.runner.vm.trace
+        program_base = frame.runner.program_base
+        info = frame.info
+        stack = frame.stack
+        key = ";".join(frame.current_stack())
+
+        for entry in trace[frame.processed:]:
+            offset = entry.pc.offset - program_base.offset
+            fp = entry.fp.offset
+
+            changed = False
+            # `ret` restores the caller's fp, `call` moves to a higher one.
+            while len(stack) > 1 and fp < stack[-1][0]:
+                stack.pop()
+                changed = True
+            if not stack or fp > stack[-1][0]:
+                stack.append((fp, f"{info.contract}.{info.function(offset)}"))
+                changed = True
+            if changed:
+                key = ";".join(frame.current_stack())
+
+            self.stacks[key] += 1
+            self.lines[(stack[-1][1], info.line(offset))] += 1
+
+        frame.processed = len(trace)
+
+    def write(self, path):
+        with open(path, "w") as f:
+            for stack, steps in sorted(self.stacks.items()):
+                f.write(f"{stack} {steps}\n")
+
+        with open(f"{path}.lines.tsv", "w") as f:
+            f.write("steps\tfunction\tline\n")
+            for (function, line), steps in self.lines.most_common():
+                f.write(f"{steps}\t{function}\t{line}\n")
+
+    def merge(self, stacks, lines):
+        self.stacks.update(stacks)
+        self.lines.update({tuple(key.split("\t")): steps for key, steps in lines.items()})
+
+    # pytest plugin hooks
+
+    def pytest_sessionfinish(self, session):
+        self.uninstall()
+        config = session.config
+        if hasattr(config, "workerinput"):
+            config.workeroutput["l2_step_profile"] = dict(
+                stacks=dict(self.stacks),
+                lines={"\t".join(key): steps for key, steps in self.lines.items()},
+            )
+        elif self.output is not None:
+            self.write(self.output)
+
+    def pytest_terminal_summary(self, terminalreporter):
+        if self.output is not None and self.stacks:
+            terminalreporter.write_line(
+                f"l2 step profile: {sum(self.stacks.values())} steps of "
+                f"{', '.join(sorted(self.entry_points))} written to {self.output}"
+            )
+
+    @pytest.hookimpl(optionalhook=True)
+    def pytest_testnodedown(self, node, error):
+        profile = getattr(node, "workeroutput", {}).get("l2_step_profile")
+        if profile is not None:
+            self.merge(profile["stacks"], profile["lines"])
@@ -0,0 +1,174 @@
+"""Duration aware scheduling of the L2 tests across xdist workers.
+
+`--dist loadscope` hands out whole modules, so the biggest test file ends up
+as a long tail on a single worker. `DurationScheduling` instead hands out
+single tests, longest first, using the durations recorded by previous runs
+in the pytest cache. Idle workers pull the next test, so the load evens out
+and the wall time approaches the longest chain of tests that must run
+together.
+
+Tests that use a fixture scoped to their class, module or package still
+share a work unit, the scopes are reported by the workers and cached
+alongside the durations. Tests without history stay grouped by module.
+
+The scheduler is opt-in (`--duration-schedule`), durations and scopes are
+recorded on every run. Only the entries of tests that ran are replaced, so
+`--maxfail`, `-k` or running a single test keeps the history of the rest.
+Entries are dropped once their file is gone, or once a run collected their
+whole module without them.
+"""
+
+import os
+from collections import OrderedDict
+from statistics import median
+
+import pytest
+
+DURATIONS_KEY = "l2/durations"
+SHARED_SCOPES_KEY = "l2/shared_scopes"
+SHARED_FIXTURE_SCOPES = ["class", "module", "package"]
+
+
+def shared_scope(item):
+    """Nodeid of the narrowest node whose tests must run together with `item`."""
+    scopes = {
+        fixturedefs[-1].scope
+        for fixturedefs in item._fixtureinfo.name2fixturedefs.values()
+        if fixturedefs
+    }
+    module = item.nodeid.split("::")[0]
+    if "package" in scopes:
+        return module.rsplit("/", 1)[0] if "/" in module else module
+    if "module" in scopes:
+        return module
+    if "class" in scopes and item.cls is not None:
+        return item.nodeid.rsplit("::", 1)[0]
+    return item.nodeid
+
+
+def make_scheduler_class():
+    # xdist is an optional plugin, only import it once it is known to be active.
+    from xdist.scheduler import LoadScopeScheduling
+
+    class DurationScheduling(LoadScopeScheduling):
+        def __init__(self, config, log, durations, shared_scopes):
+            super().__init__(config, log)
+            self.durations = durations
+            self.shared_scopes = shared_scopes
+            known = list(durations.values())
+            self.default_duration = median(known) if known else 0
+            self._ordered = False
+
+        def _split_scope(self, nodeid):
+            if nodeid in self.shared_scopes:
+                return self.shared_scopes[nodeid]
+            if nodeid in self.durations:
+                return nodeid
+            return nodeid.split("::")[0]
+
+        def _unit_duration(self, work_unit):
+            return sum(self.durations.get(nodeid, self.default_duration) for nodeid in work_unit)
+
+        def _assign_work_unit(self, node):
+            if not self._ordered:
+                self.workqueue = OrderedDict(
+                    sorted(
+                        self.workqueue.items(),
+                        key=lambda unit: self._unit_duration(unit[1]),
+                        reverse=True,
+                    )
+                )
+                self._ordered = True
+            super()._assign_work_unit(node)
+
+    return DurationScheduling
+
+
+class DurationSchedulingPlugin:
+    """
+    Records test durations (on the controller, from the worker reports) and
+    fixture scopes (on the workers), and provides the xdist scheduler.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.durations = {}
+        self.skipped = set()
+        self.shared_scopes = {}
+        self.collected = set()
+
+    # workers
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_collection_modifyitems(self, items):
+        # tryfirst, to see the tests deselected by -k and -m as well
+        for item in items:
+            self.collected.add(item.nodeid)
+            scope = shared_scope(item)
+            if scope != item.nodeid:
+                self.shared_scopes[item.nodeid] = scope
+
+    def pytest_sessionfinish(self, session):
+        config = session.config
+        if hasattr(config, "workerinput"):
+            config.workeroutput["l2_shared_scopes"] = self.shared_scopes
+            config.workeroutput["l2_collected"] = sorted(self.collected)
+            return
+
+        complete = {nodeid.split("::")[0] for nodeid in self.collected} - self._partial_modules()
+        durations = {nodeid: value for nodeid, value in self.durations.items() if nodeid not in self.skipped}
+        for key, fresh, replaced in [
+            (DURATIONS_KEY, durations, set(durations)),
+            # the scopes of every collected test were computed afresh
+            (SHARED_SCOPES_KEY, self.shared_scopes, self.collected),
+        ]:
+            cached = {
+                nodeid: value
+                for nodeid, value in config.cache.get(key, {}).items()
+                if nodeid not in replaced and self._is_live(nodeid, complete)
+            }
+            cached.update(fresh)
+            config.cache.set(key, cached)
+
+    def _partial_modules(self):
+        """Modules the run was restricted to some tests of, e.g. `dai.py::test_burn`."""
+        modules = set()
+        for arg in self.config.args:
+            if "::" not in arg:
+                continue
+            path = os.path.join(str(self.config.invocation_params.dir), arg.split("::")[0])
+            modules.add(os.path.relpath(path, str(self.config.rootpath)).replace(os.sep, "/"))
+        return modules
+
+    def _is_live(self, nodeid, complete):
+        """Whether the test `nodeid` may still exist, given the modules `complete`ly collected this run."""
+        module = nodeid.split("::")[0]
+        if module in complete:
+            return nodeid in self.collected
+        return os.path.exists(os.path.join(str(self.config.rootpath), module))
+
+    # controller
+
+    def pytest_runtest_logreport(self, report):
+        if hasattr(self.config, "workerinput"):
+            return
+        self.durations[report.nodeid] = self.durations.get(report.nodeid, 0) + report.duration
+        if report.skipped:
+            self.skipped.add(report.nodeid)
+
+    @pytest.hookimpl(optionalhook=True)
+    def pytest_testnodedown(self, node, error):
+        output = getattr(node, "workeroutput", {})
+        self.shared_scopes.update(output.get("l2_shared_scopes", {}))
+        self.collected.update(output.get("l2_collected", []))
+
+    @pytest.hookimpl(optionalhook=True, tryfirst=True)
+    def pytest_xdist_make_scheduler(self, config, log):
+        if not config.getoption("duration_schedule") or config.getoption("dist") not in ("load", "loadscope"):
+            return None
+        return make_scheduler_class()(
+            config,
+            log,
+            durations=config.cache.get(DURATIONS_KEY, {}),
+            shared_scopes=config.cache.get(SHARED_SCOPES_KEY, {}),
+        )
@@ -0,0 +1,179 @@
+"""Compact on-disk snapshots of the L2 test deployment.
+
+A snapshot directory holds
+
+- `deployment.json`: block info, the contract address -> class hash and
+  nonce mappings, the storage diff against an empty state, and what the
+  harness needs on top of the state (contract names, ABIs, signer keys),
+- `classes/<class hash>.json`: the compiled classes, written once per class
+  hash and only loaded when a transaction first runs the class.
+
+Unlike pickling the deployment, the files don't depend on the internals of
+the cairo-lang objects, and the (large) compiled classes are shared between
+snapshots and between the copies of a loaded state.
+
+The fingerprint of a snapshot covers its sources and the installed
+cairo-lang version, so a snapshot built by another toolchain is rebuilt.
+
+Only the state is restored: the contracts of a loaded deployment have no
+`deploy_call_info` (it is None), since the deployment transactions aren't
+replayed. Tests needing the deployment call info must build the deployment.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from types import SimpleNamespace
+
+SNAPSHOT_VERSION = 1
+DEPLOYMENT_FILE = "deployment.json"
+CLASSES_DIR = "classes"
+
+
+def cairo_lang_version():
+    from importlib.metadata import PackageNotFoundError, version
+
+    try:
+        return version("cairo-lang")
+    except PackageNotFoundError:
+        return "unknown"
+
+
+def source_fingerprint(paths):
+    """Digest of the files at `paths` and of the cairo-lang version."""
+    digest = hashlib.sha256()
+    digest.update(f"cairo-lang {cairo_lang_version()}".encode())
+    for path in sorted(paths):
+        digest.update(os.path.basename(path).encode())
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _write_atomic(path, data):
+    # xdist workers may write the same snapshot concurrently.
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, "w") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class ContractClasses(dict):
+    """
+    Class hash -> ContractClass mapping that loads classes from a snapshot on
+    first use. Copies of the state share the loaded classes instead of deep
+    copying them.
+    """
+
+    def __init__(self, directory, class_hashes):
+        super().__init__()
+        self.directory = directory
+        self.class_hashes = frozenset(class_hashes)
+
+    def __contains__(self, class_hash):
+        return dict.__contains__(self, class_hash) or class_hash in self.class_hashes
+
+    def __missing__(self, class_hash):
+        if class_hash not in self.class_hashes:
+            raise KeyError(class_hash)
+        from starkware.starknet.services.api.contract_class import ContractClass
+
+        with open(os.path.join(self.directory, CLASSES_DIR, f"{class_hash.hex()}.json")) as f:
+            contract_class = ContractClass.loads(f.read())
+        self[class_hash] = contract_class
+        return contract_class
+
+    def __deepcopy__(self, memo):
+        copied = ContractClasses(self.directory, self.class_hashes)
+        dict.update(copied, self)
+        return copied
+
+
+def dump_deployment(deployment, directory, fingerprint=None):
+    """Writes `deployment` (see build_copyable_deployment) to `directory`."""
+    state = deployment.starknet.state.state
+    cache = state.cache
+
+    classes_dir = os.path.join(directory, CLASSES_DIR)
+    os.makedirs(classes_dir, exist_ok=True)
+    for class_hash, contract_class in state.contract_classes.items():
+        path = os.path.join(classes_dir, f"{class_hash.hex()}.json")
+        if not os.path.exists(path):
+            _write_atomic(path, contract_class.dumps())
+
+    snapshot = dict(
+        version=SNAPSHOT_VERSION,
+        fingerprint=fingerprint,
+        block_info=state.block_info.dump(),
+        classes=[class_hash.hex() for class_hash in state.contract_classes],
+        class_hashes=[[address, class_hash.hex()]
+                      for address, class_hash in cache.address_to_class_hash.items()],
+        nonces=[[address, nonce] for address, nonce in cache.address_to_nonce.items()],
+        storage=[[address, key, value]
+                 for (address, key), value in cache.storage_view.items() if value != 0],
+        contracts={
+            name: dict(address=contract["contract_address"], abi=contract["abi"])
+            for name, contract in deployment.serialized_contracts.items()
+        },
+        sample_spell=dict(
+            class_hash=deployment.sample_spell.class_hash,
+            abi=deployment.sample_spell.abi,
+        ),
+        signers={name: signer.private_key for name, signer in deployment.signers.items()},
+        consts=vars(deployment.consts),
+    )
+    _write_atomic(os.path.join(directory, DEPLOYMENT_FILE), json.dumps(snapshot))
+
+
+def read_fingerprint(directory):
+    try:
+        with open(os.path.join(directory, DEPLOYMENT_FILE)) as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if snapshot.get("version") != SNAPSHOT_VERSION:
+        return None
+    return snapshot.get("fingerprint")
+
+
+async def load_deployment(directory):
+    """Reads a deployment written by `dump_deployment`."""
+    from starkware.starknet.business_logic.state.state import BlockInfo, CachedState
+    from starkware.starknet.testing.contract import DeclaredClass
+    from starkware.starknet.testing.starknet import Starknet
+    from starkware.starknet.testing.state import StarknetState
+
+    from Signer import Signer
+
+    with open(os.path.join(directory, DEPLOYMENT_FILE)) as f:
+        snapshot = json.load(f)
+    assert snapshot["version"] == SNAPSHOT_VERSION, "unsupported snapshot version"
+
+    empty = await StarknetState.empty()
+    state = CachedState(
+        block_info=BlockInfo.load(snapshot["block_info"]),
+        state_reader=empty.state.state_reader,
+        contract_class_cache=ContractClasses(
+            directory, [bytes.fromhex(class_hash) for class_hash in snapshot["classes"]]
+        ),
+    )
+    state.cache.update_writes(
+        address_to_class_hash={
+            address: bytes.fromhex(class_hash) for address, class_hash in snapshot["class_hashes"]
+        },
+        address_to_nonce={address: nonce for address, nonce in snapshot["nonces"]},
+        storage_updates={(address, key): value for address, key, value in snapshot["storage"]},
+    )
+
+    return SimpleNamespace(
+        starknet=Starknet(StarknetState(state=state, general_config=empty.general_config)),
+        consts=SimpleNamespace(**snapshot["consts"]),
+        signers={name: Signer(private_key) for name, private_key in snapshot["signers"].items()},
+        sample_spell=DeclaredClass(**snapshot["sample_spell"]),
+        serialized_contracts={
+            # not part of the snapshot, see the module docstring
+            name: dict(abi=contract["abi"], contract_address=contract["address"], deploy_call_info=None)
+            for name, contract in snapshot["contracts"].items()
+        },
+    )